@@ -0,0 +1,236 @@
+#
+# This file is part of BDC-DB.
+# Copyright (C) 2023 INPE.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/gpl-3.0.html>.
+#
+
+"""Audit the stored JSONB documents against their current JSONSchemas.
+
+.. versionadded:: 0.9.0
+"""
+
+import json
+import typing as t
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+from sqlalchemy import Column, MetaData, Text, cast, select, tuple_
+from sqlalchemy.engine import Engine
+
+from .schemas import SchemaRegistry, get_default_registry, set_default_registry
+from .sqltypes import JSONB
+from .utils import stream
+
+
+@dataclass
+class Violation:
+    """Represent a stored document which does not match its JSONSchema."""
+
+    keys: t.List[t.Any]
+    message: str
+    path: str = ''
+
+
+@dataclass
+class ColumnAudit:
+    """Represent the audit progress of a JSONB column."""
+
+    table: str
+    column: str
+    schema: str
+    rows: int = 0
+    invalid: int = 0
+    violations: t.List[Violation] = field(default_factory=list)
+    last_key: t.Optional[t.List[t.Any]] = None
+    done: bool = False
+
+    @property
+    def name(self) -> str:
+        """Identify the column as ``table.column``."""
+        return f'{self.table}.{self.column}'
+
+
+@dataclass
+class AuditCheckpoint:
+    """Keep the progress of an audit, saved after each validated chunk to resume it later."""
+
+    columns: t.Dict[str, ColumnAudit] = field(default_factory=dict)
+
+    def save(self, path: t.Union[str, Path]):
+        """Write the checkpoint file atomically."""
+        path = Path(path)
+        temporary = path.with_name(f'{path.name}.tmp')
+        temporary.write_text(json.dumps(asdict(self), indent=2, default=str))
+        temporary.replace(path)
+
+    @classmethod
+    def load(cls, path: t.Union[str, Path]) -> 'AuditCheckpoint':
+        """Read a checkpoint file."""
+        data = json.loads(Path(path).read_text())
+        columns = dict()
+        for name, entry in data['columns'].items():
+            entry['violations'] = [Violation(**violation) for violation in entry['violations']]
+            columns[name] = ColumnAudit(**entry)
+        return cls(columns)
+
+
+def jsonb_columns(metadata: MetaData) -> t.List[Column]:
+    """List the columns of type :class:`~bdc_db.sqltypes.JSONB` declared in a metadata."""
+    return [
+        column
+        for table in metadata.sorted_tables
+        for column in table.columns
+        if isinstance(column.type, JSONB)
+    ]
+
+
+def _validate_chunk(schema_key: str, rows: t.List[t.Tuple[t.List[t.Any], str]],
+                    registry: t.Optional[SchemaRegistry] = None) -> t.List[Violation]:
+    """Validate the documents (JSON text) of a chunk, returning the violations."""
+    validator = (registry or get_default_registry()).validator(schema_key)
+    violations = []
+    for keys, document in rows:
+        error = next(iter(validator.iter_errors(json.loads(document))), None)
+        if error is not None:
+            violations.append(Violation(keys, error.message, '/'.join(str(part) for part in error.absolute_path)))
+    return violations
+
+
+def _chunks(column: Column, engine: Engine, audit: ColumnAudit, chunk_size: int):
+    """Stream the documents of a column ordered by primary key, after the last key audited."""
+    keys = list(column.table.primary_key.columns)
+    statement = select(*keys, cast(column, Text)).where(column.isnot(None)).order_by(*keys)
+    if audit.last_key is not None:
+        statement = statement.where(tuple_(*keys) > tuple_(*audit.last_key))
+
+    with engine.connect() as conn:
+        chunk = []
+        for row in stream(statement, chunk_size=chunk_size, mode='rows', session=conn):
+            chunk.append((list(row[:-1]), row[-1]))
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+def audit_jsonb(columns: t.Sequence[Column], engine: Engine, registry: t.Optional[SchemaRegistry] = None,
+                jobs: int = 4, chunk_size: int = 5000, checkpoint: t.Optional[t.Union[str, Path]] = None,
+                max_violations: int = 1000,
+                on_progress: t.Optional[t.Callable[[ColumnAudit], None]] = None) -> t.List[ColumnAudit]:
+    """Validate the stored documents of JSONB columns against their current JSONSchemas.
+
+    Each column is read with a server-side cursor ordered by primary key and the chunks are validated
+    by ``jobs`` worker processes, each one keeping the compiled validators. With ``checkpoint``,
+    the progress is saved after each chunk, so an interrupted audit resumes after the last key validated.
+
+    Examples:
+        .. code-block:: python
+
+            from bdc_db.audit import audit_jsonb, jsonb_columns
+            from bdc_db.db import db
+
+            for audit in audit_jsonb(jsonb_columns(db.metadata), db.engine, checkpoint='audit.json'):
+                print(audit.schema, audit.name, audit.invalid, [v.keys for v in audit.violations])
+
+    Args:
+        columns: The JSONB columns to audit.
+        engine: The SQLAlchemy active database engine.
+        registry: The schema registry. Defaults to :func:`~bdc_db.schemas.get_default_registry`.
+        jobs: The number of worker processes. Use ``0`` to validate in the current process.
+        chunk_size: The number of rows of each chunk.
+        checkpoint: The checkpoint file. When it exists, the audit resumes from it.
+        max_violations: The maximum number of violations kept per column (all are counted).
+        on_progress: Callback called with the column audit after each chunk.
+
+    Returns:
+        The audit of each column.
+    """
+    registry = registry or get_default_registry()
+    state = AuditCheckpoint.load(checkpoint) if checkpoint and Path(checkpoint).exists() else AuditCheckpoint()
+
+    pool = ProcessPoolExecutor(max_workers=jobs, initializer=set_default_registry,
+                               initargs=(registry, )) if jobs > 0 else None
+    results = []
+    try:
+        for column in columns:
+            audit = ColumnAudit(column.table.fullname, column.name, column.type._schema_key)
+            audit = state.columns.setdefault(audit.name, audit)
+            results.append(audit)
+            if audit.done:
+                continue
+
+            _audit_column(column, engine, audit, registry, pool, max(jobs, 1) * 2, chunk_size, max_violations,
+                          lambda: _report(state, audit, checkpoint, on_progress))
+            audit.done = True
+            _report(state, audit, checkpoint, on_progress)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    return results
+
+
+def _report(state: AuditCheckpoint, audit: ColumnAudit, checkpoint, on_progress):
+    if checkpoint:
+        state.save(checkpoint)
+    if on_progress is not None:
+        on_progress(audit)
+
+
+def _audit_column(column: Column, engine: Engine, audit: ColumnAudit, registry: SchemaRegistry,
+                  pool: t.Optional[ProcessPoolExecutor], max_pending: int, chunk_size: int, max_violations: int,
+                  report: t.Callable[[], None]):
+    """Validate the chunks of a column, advancing the checkpoint only over contiguous finished chunks."""
+    pending = dict()
+    finished = dict()
+    next_index = 0
+
+    def _advance():
+        nonlocal next_index
+        while next_index in finished:
+            chunk, violations = finished.pop(next_index)
+            audit.rows += len(chunk)
+            audit.invalid += len(violations)
+            audit.violations.extend(violations[:max(0, max_violations - len(audit.violations))])
+            audit.last_key = chunk[-1][0]
+            next_index += 1
+            report()
+
+    def _collect(block: bool):
+        done, _ = wait(pending, return_when=FIRST_COMPLETED, timeout=None if block else 0)
+        for future in done:
+            index, chunk = pending.pop(future)
+            finished[index] = (chunk, future.result())
+        _advance()
+
+    try:
+        for index, chunk in enumerate(_chunks(column, engine, audit, chunk_size)):
+            if pool is None:
+                finished[index] = (chunk, _validate_chunk(audit.schema, chunk, registry))
+                _advance()
+                continue
+
+            pending[pool.submit(_validate_chunk, audit.schema, chunk)] = (index, chunk)
+            if len(pending) >= max_pending:
+                _collect(block=True)
+
+        while pending:
+            _collect(block=True)
+    finally:
+        # On errors, do not wait for the queued chunks (Executor.shutdown(cancel_futures) requires Python 3.9)
+        for future in pending:
+            future.cancel()
@@ -0,0 +1,391 @@
+#
+# This file is part of BDC-DB.
+# Copyright (C) 2023 INPE.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/gpl-3.0.html>.
+#
+
+"""Bulk-load mode which suspends the triggers and secondary indexes of tables.
+
+.. versionadded:: 0.9.0
+"""
+
+import datetime
+import hashlib
+import json
+import os
+import re
+import typing as t
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+from flask import current_app
+from sqlalchemy import Table, text
+from sqlalchemy.engine import Connection, Engine
+
+from . import config as _config
+from .changefeed import (BULK_LOAD_OP, change_feed_trigger_name, channel_name,
+                         get_change_feed)
+from .utils import execute, list_triggers
+
+CATCHUP_INFO_KEY = 'bdc_catchup'
+"""Key used in ``Table.info`` to declare the SQL which replays the effect of the suspended triggers.
+
+The value is a SQL statement or a list of statements. They run after a bulk load and in
+recovery, so they must be idempotent.
+"""
+
+_CREATE_INDEX = re.compile(r'^CREATE (UNIQUE )?INDEX ')
+_CREATE_TRIGGER = re.compile(r'\bCREATE\s+(?:OR\s+REPLACE\s+)?(?:CONSTRAINT\s+)?TRIGGER\s+(?:"((?:[^"]|"")+)"|(\w+))',
+                             re.IGNORECASE)
+
+
+@dataclass
+class SuspendedIndex:
+    """Represent an index dropped during a bulk load."""
+
+    schema: str
+    name: str
+    definition: str
+
+
+@dataclass
+class BulkLoadJournal:
+    """Represent the state of a bulk load, saved to recover from a crash."""
+
+    tables: t.List[str] = field(default_factory=list)
+    database: str = ''
+    triggers: t.List[t.Tuple[str, str, str]] = field(default_factory=list)
+    feeds: t.List[t.Tuple[str, str, str, str]] = field(default_factory=list)
+    indexes: t.List[SuspendedIndex] = field(default_factory=list)
+    catchup: t.List[str] = field(default_factory=list)
+    stage: str = 'loading'
+    started: str = field(default_factory=lambda: datetime.datetime.now(datetime.timezone.utc).isoformat())
+
+    def save(self, path: t.Union[str, Path], exclusive: bool = False):
+        """Write the journal file.
+
+        Args:
+            path: The journal file.
+            exclusive: Fail with ``FileExistsError`` when the file already exists.
+        """
+        with open(path, 'x' if exclusive else 'w') as f:
+            f.write(json.dumps(asdict(self), indent=2))
+
+    @classmethod
+    def load(cls, path: t.Union[str, Path]) -> 'BulkLoadJournal':
+        """Read a journal file."""
+        data = json.loads(Path(path).read_text())
+        data['triggers'] = [tuple(entry) for entry in data['triggers']]
+        data['feeds'] = [tuple(entry) for entry in data.get('feeds', [])]
+        data['indexes'] = [SuspendedIndex(**entry) for entry in data['indexes']]
+        return cls(**data)
+
+
+def database_key(engine: Engine) -> str:
+    """Identify the database of an engine by its host, port and name."""
+    url = engine.url
+    return f'{url.host or ""}:{url.port or 5432}/{url.database}'
+
+
+def journal_path(tables: t.Sequence[Table], engine: Engine,
+                 directory: t.Optional[t.Union[str, Path]] = None) -> Path:
+    """Build the journal file of a bulk load, keyed by the database and the loaded tables.
+
+    Args:
+        tables: The tables to load.
+        engine: The SQLAlchemy active database engine.
+        directory: The journal directory. Defaults to ``BDC_DB_BULK_LOAD_JOURNAL_DIR``.
+    """
+    directory = directory or current_app.config.get('BDC_DB_BULK_LOAD_JOURNAL_DIR',
+                                                    _config.BDC_DB_BULK_LOAD_JOURNAL_DIR)
+    key = '\n'.join([database_key(engine)] + sorted(table.fullname for table in tables))
+    digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+    database = re.sub(r'[^\w.-]', '_', str(engine.url.database))
+
+    return Path(directory) / f'{database}-{digest}.json'
+
+
+def pending_journals(engine: Engine, directory: t.Optional[t.Union[str, Path]] = None) \
+        -> t.List[t.Tuple[Path, BulkLoadJournal]]:
+    """List the journals of unfinished bulk loads in the database of an engine.
+
+    Args:
+        engine: The SQLAlchemy active database engine.
+        directory: The journal directory. Defaults to ``BDC_DB_BULK_LOAD_JOURNAL_DIR``.
+    """
+    directory = Path(directory or current_app.config.get('BDC_DB_BULK_LOAD_JOURNAL_DIR',
+                                                         _config.BDC_DB_BULK_LOAD_JOURNAL_DIR))
+    if not directory.is_dir():
+        return []
+
+    key = database_key(engine)
+    journals = [(path, BulkLoadJournal.load(path)) for path in sorted(directory.glob('*.json'))]
+
+    return [(path, journal) for path, journal in journals if journal.database == key]
+
+
+def _trigger_names(sql: str) -> t.Set[str]:
+    # The unquoted identifiers are folded to lower case by PostgreSQL
+    return {quoted.replace('""', '"') if quoted else name.lower() for quoted, name in _CREATE_TRIGGER.findall(sql)}
+
+
+def registered_triggers(tables: t.Sequence[Table], executor) -> t.List[t.Tuple[str, str, str]]:
+    """List the triggers of the tables which were registered in BDC-DB modules.
+
+    A trigger is registered when a BDC-DB trigger script creates it (``CREATE TRIGGER``)
+    with the exact same name.
+
+    Returns:
+        The schema, table name and trigger name of each trigger.
+    """
+    trigger_names = set()
+    for entry in current_app.extensions['bdc-db'].triggers.values():
+        for script in entry.values():
+            with open(script) as f:
+                trigger_names.update(_trigger_names(f.read()))
+
+    default_schema = execute('SELECT current_schema()', executor).scalar()
+    names = {(table.schema or default_schema, table.name) for table in tables}
+
+    return [
+        (trigger.schema, trigger.table_name, trigger.trigger_name)
+        for trigger in list_triggers(executor)
+        if (trigger.schema, trigger.table_name) in names
+        and trigger.trigger_name in trigger_names
+    ]
+
+
+def secondary_indexes(table: Table, executor) -> t.List[SuspendedIndex]:
+    """List the indexes of a table which do not back a constraint (primary key, unique, exclusion or foreign key).
+
+    The unique indexes are never listed, even without a constraint, since they enforce
+    the uniqueness of the loaded rows.
+    """
+    preparer = executor.dialect.identifier_preparer
+    query_result = execute(
+        "SELECT n.nspname AS schema,"
+        "       c.relname AS name,"
+        "       pg_get_indexdef(i.indexrelid) AS definition"
+        "  FROM pg_index i"
+        "  JOIN pg_class c ON c.oid = i.indexrelid"
+        "  JOIN pg_namespace n ON n.oid = c.relnamespace "
+        " WHERE i.indrelid = CAST(:table AS regclass) "
+        "   AND NOT i.indisunique "
+        "   AND NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conindid = i.indexrelid) "
+        "ORDER BY c.relname",
+        executor,
+        dict(table=preparer.format_table(table))
+    )
+
+    return [SuspendedIndex(row.schema, row.name, row.definition) for row in query_result]
+
+
+def change_feed_triggers(tables: t.Sequence[Table], executor) -> t.List[t.Tuple[str, str, str, str]]:
+    """List the change feed triggers of the tables (see :mod:`bdc_db.changefeed`).
+
+    Returns:
+        The schema, table name, trigger name and channel of each trigger.
+    """
+    default_schema = execute('SELECT current_schema()', executor).scalar()
+    existing = {(trigger.schema, trigger.table_name, trigger.trigger_name) for trigger in list_triggers(executor)}
+
+    feeds = []
+    for table in tables:
+        if get_change_feed(table) is None:
+            continue
+        entry = (table.schema or default_schema, table.name, change_feed_trigger_name(table))
+        if entry in existing:
+            feeds.append(entry + (channel_name(table),))
+    return feeds
+
+
+def _catchup_statements(table: Table) -> t.List[str]:
+    statements = table.info.get(CATCHUP_INFO_KEY) or []
+    return [statements] if isinstance(statements, str) else list(statements)
+
+
+def _restore(journal: BulkLoadJournal, engine: Engine, catchup: bool):
+    preparer = engine.dialect.identifier_preparer
+
+    with engine.begin() as conn:
+        for schema, table_name, trigger_name in journal.triggers:
+            conn.execute(text(f'ALTER TABLE {preparer.quote_schema(schema)}.{preparer.quote(table_name)} '
+                              f'ENABLE TRIGGER {preparer.quote(trigger_name)}'))
+
+        for index in journal.indexes:
+            conn.execute(text(_CREATE_INDEX.sub(r'CREATE \1INDEX IF NOT EXISTS ', index.definition)))
+
+        if catchup:
+            for statement in journal.catchup:
+                conn.execute(text(statement))
+
+            # A single event per table instead of one per loaded (or caught up) row
+            for schema, table_name, _, channel in journal.feeds:
+                message = dict(op=BULK_LOAD_OP, schema=schema, table=table_name, keys={})
+                conn.execute(text('SELECT pg_notify(:channel, :message)'),
+                             dict(channel=channel, message=json.dumps(message)))
+
+        # Enabled last, so the catch-up changes are not notified row by row
+        for schema, table_name, trigger_name, _ in journal.feeds:
+            conn.execute(text(f'ALTER TABLE {preparer.quote_schema(schema)}.{preparer.quote(table_name)} '
+                              f'ENABLE TRIGGER {preparer.quote(trigger_name)}'))
+
+
+def recover_bulk_load(engine: Engine, journal: t.Optional[t.Union[str, Path]] = None) -> t.List[BulkLoadJournal]:
+    """Restore the triggers and indexes left suspended by crashed bulk loads.
+
+    The catch-up SQL runs only when the crash happened after the load was committed.
+
+    Args:
+        engine: The SQLAlchemy active database engine.
+        journal: The journal file. Defaults to every journal of the engine database
+            in ``BDC_DB_BULK_LOAD_JOURNAL_DIR``.
+
+    Returns:
+        The recovered journals. It is empty when there is nothing to recover.
+    """
+    if journal is not None:
+        journals = [(Path(journal), BulkLoadJournal.load(journal))] if os.path.exists(journal) else []
+    else:
+        journals = pending_journals(engine)
+
+    for path, state in journals:
+        _restore(state, engine, catchup=state.stage == 'restoring')
+        os.remove(path)
+
+    return [state for _, state in journals]
+
+
+class BulkLoad:
+    """Suspend the triggers and secondary indexes of tables during an initial load.
+
+    On enter, the registered triggers of the tables are disabled and the secondary indexes
+    are dropped, recording them in a journal file. The change feed triggers are disabled too,
+    and a single ``BULK_LOAD`` event is notified per table once the load is committed.
+    The load must use the yielded connection, whose transaction may run with
+    ``synchronous_commit=off`` and deferred constraints.
+    On exit, the load is committed (or rolled back on errors), the indexes are created again,
+    the triggers are enabled and the catch-up SQL of tables (``Table.info['bdc_catchup']``) runs.
+
+    Examples:
+        .. code-block:: python
+
+            from bdc_db.bulkload import BulkLoad
+            from bdc_db.db import db
+
+            with BulkLoad([Item.__table__], db.engine) as conn:
+                conn.execute(insert(Item.__table__), rows)
+
+    Args:
+        tables: The tables to load.
+        engine: The SQLAlchemy active database engine.
+        triggers: The trigger names to disable. Defaults to the triggers registered in BDC-DB modules.
+        drop_indexes: Drop the secondary indexes and create them after the load.
+        suspend_change_feed: Disable the change feed triggers, notifying a single
+            :data:`~bdc_db.changefeed.BULK_LOAD_OP` event per table after the catch-up.
+        synchronous_commit: Set ``synchronous_commit`` of the load transaction. Defaults to ``off``.
+        defer_constraints: Defer the ``DEFERRABLE`` constraints until the load commits.
+        journal: The journal file. Defaults to a file of ``BDC_DB_BULK_LOAD_JOURNAL_DIR`` keyed
+            by the database and the tables, see :func:`~bdc_db.bulkload.journal_path`.
+    """
+
+    def __init__(self, tables: t.Sequence[Table], engine: Engine, triggers: t.Optional[t.Sequence[str]] = None,
+                 drop_indexes: bool = True, synchronous_commit: bool = False, defer_constraints: bool = True,
+                 journal: t.Optional[t.Union[str, Path]] = None, suspend_change_feed: bool = True):
+        """Build a new bulk load context."""
+        self.tables = list(tables)
+        self.engine = engine
+        self.triggers = triggers
+        self.drop_indexes = drop_indexes
+        self.suspend_change_feed = suspend_change_feed
+        self.synchronous_commit = synchronous_commit
+        self.defer_constraints = defer_constraints
+        self.journal_path = Path(journal) if journal else journal_path(self.tables, engine)
+        self.journal: t.Optional[BulkLoadJournal] = None
+        self.connection: t.Optional[Connection] = None
+
+    def _suspend(self) -> BulkLoadJournal:
+        preparer = self.engine.dialect.identifier_preparer
+        journal = BulkLoadJournal(tables=[table.fullname for table in self.tables],
+                                  database=database_key(self.engine))
+
+        with self.engine.begin() as conn:
+            if self.triggers is None:
+                journal.triggers = registered_triggers(self.tables, conn)
+            else:
+                journal.triggers = [entry for entry in registered_triggers(self.tables, conn)
+                                    if entry[2] in self.triggers]
+
+            if self.suspend_change_feed:
+                journal.feeds = change_feed_triggers(self.tables, conn)
+
+            for table in self.tables:
+                if self.drop_indexes:
+                    journal.indexes.extend(secondary_indexes(table, conn))
+                journal.catchup.extend(_catchup_statements(table))
+
+            journal.save(self.journal_path, exclusive=True)
+
+            for schema, table_name, trigger_name in [*journal.triggers, *(feed[:3] for feed in journal.feeds)]:
+                conn.execute(text(f'ALTER TABLE {preparer.quote_schema(schema)}.{preparer.quote(table_name)} '
+                                  f'DISABLE TRIGGER {preparer.quote(trigger_name)}'))
+
+            for index in journal.indexes:
+                conn.execute(text(f'DROP INDEX {preparer.quote_schema(index.schema)}.{preparer.quote(index.name)}'))
+
+        return journal
+
+    def __enter__(self) -> Connection:
+        """Suspend the triggers and indexes and start the load transaction."""
+        if os.path.exists(self.journal_path):
+            raise RuntimeError(f'A previous bulk load was not finished ({self.journal_path}). '
+                               'Use "bdc-db db bulk-load recover" to restore it.')
+
+        names = {table.fullname for table in self.tables}
+        for path, pending in pending_journals(self.engine, self.journal_path.parent):
+            if names.intersection(pending.tables):
+                raise RuntimeError(f'The tables {", ".join(sorted(names.intersection(pending.tables)))} are in '
+                                   f'another bulk load ({path}). Use "bdc-db db bulk-load recover" if it crashed.')
+
+        self.journal_path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+
+        self.journal = self._suspend()
+
+        self.connection = self.engine.connect()
+        self.connection.begin()
+        if not self.synchronous_commit:
+            self.connection.execute(text('SET LOCAL synchronous_commit TO OFF'))
+        if self.defer_constraints:
+            self.connection.execute(text('SET CONSTRAINTS ALL DEFERRED'))
+
+        return self.connection
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Commit the load and restore the triggers and indexes."""
+        loaded = exc_type is None
+        try:
+            if loaded:
+                self.connection.commit()
+                self.journal.stage = 'restoring'
+                self.journal.save(self.journal_path)
+            else:
+                self.connection.rollback()
+        except Exception:
+            loaded = False
+            raise
+        finally:
+            self.connection.close()
+            _restore(self.journal, self.engine, catchup=loaded)
+            os.remove(self.journal_path)
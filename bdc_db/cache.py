@@ -0,0 +1,289 @@
+#
+# This file is part of BDC-DB.
+# Copyright (C) 2023 INPE.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/gpl-3.0.html>.
+#
+
+"""In-process query result cache with invalidation by session writes.
+
+.. versionadded:: 0.9.0
+"""
+
+import json
+import threading
+import time
+import typing as t
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from sqlalchemy import event, inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import loading
+from sqlalchemy.sql.util import find_tables
+
+from .db import db as _db
+from .utils import poll_notifications
+
+CACHE_OPTION = 'bdc_cache'
+"""Execution option to cache a query (``True``) or to bypass the cache of registered models (``False``)."""
+
+CACHE_TTL_OPTION = 'bdc_cache_ttl'
+"""Execution option to set the time to live in seconds of a cached query."""
+
+_PENDING_KEY = 'bdc_cache_pending'
+
+
+@dataclass
+class CacheStats:
+    """Represent the counters of a :class:`~bdc_db.cache.QueryCache`."""
+
+    hits: int = 0
+    misses: int = 0
+    invalidations: int = 0
+    size: int = 0
+
+
+class QueryCache:
+    """Cache the results of ``SELECT`` statements executed by a session.
+
+    The queries are cached when they set the execution option ``bdc_cache=True`` or when they
+    only read registered models. The key is the compiled statement with its parameters and the
+    cache keeps at most ``maxsize`` results for ``ttl`` seconds (LRU).
+
+    The cached results of a table are invalidated when the session flushes changes on it or runs
+    an ``INSERT``/``UPDATE``/``DELETE`` (like :func:`~bdc_db.utils.bulk_upsert`). The writes done
+    by other processes may be propagated with an ``invalidator``, like :class:`~bdc_db.cache.NotifyInvalidator`.
+
+    Examples:
+        .. code-block:: python
+
+            from bdc_db.cache import QueryCache
+            from bdc_db.models import SpatialRefSys
+
+            cache = QueryCache(maxsize=1024, ttl=300)
+            cache.register(SpatialRefSys)
+            cache.install(db.session)
+
+            srs = db.session.get(SpatialRefSys, 4326)
+            collections = db.session.execute(select(Collection).execution_options(bdc_cache=True)).scalars().all()
+
+    Note:
+        Writes done outside the session (like Core statements in other connections)
+        are not seen by the cache, unless they are notified by an invalidator.
+
+    Args:
+        maxsize: The maximum number of cached results.
+        ttl: The default time to live in seconds of a cached result.
+        invalidator: Object with ``publish(session, tables)`` called on each session invalidation.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300.0, invalidator: t.Optional[t.Any] = None):
+        """Build a new query cache."""
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.invalidator = invalidator
+        self.stats = CacheStats()
+        self._entries: 'OrderedDict[str, t.Tuple[float, t.Any, t.FrozenSet[str]]]' = OrderedDict()
+        self._statements: t.Dict[t.Any, str] = dict()
+        self._tables: t.Set[str] = set()
+        self._lock = threading.RLock()
+        self._sessions: t.List[t.Any] = []
+
+    def register(self, *models: t.Any):
+        """Cache every query which reads only the given models or tables."""
+        for model in models:
+            table = getattr(model, '__table__', model)
+            self._tables.add(table.fullname)
+
+    def install(self, session: t.Optional[t.Any] = None):
+        """Listen the execute and flush events of a session (class). Defaults to ``db.session``."""
+        session = session if session is not None else _db.session
+        event.listen(session, 'do_orm_execute', self._on_execute)
+        event.listen(session, 'after_flush', self._on_flush)
+        event.listen(session, 'after_commit', self._on_transaction_end)
+        event.listen(session, 'after_soft_rollback', self._on_rollback)
+        self._sessions.append(session)
+
+    def uninstall(self):
+        """Remove the session listeners."""
+        for session in self._sessions:
+            event.remove(session, 'do_orm_execute', self._on_execute)
+            event.remove(session, 'after_flush', self._on_flush)
+            event.remove(session, 'after_commit', self._on_transaction_end)
+            event.remove(session, 'after_soft_rollback', self._on_rollback)
+        self._sessions = []
+
+    def clear(self):
+        """Remove all the cached results."""
+        with self._lock:
+            self._entries.clear()
+            self._statements.clear()
+            self.stats.size = 0
+
+    def invalidate(self, tables: t.Iterable[str]):
+        """Remove the cached results which read any of the given tables (``schema.table``)."""
+        tables = set(tables)
+        with self._lock:
+            for key in [key for key, (_, _, entry_tables) in self._entries.items() if entry_tables & tables]:
+                del self._entries[key]
+                self.stats.invalidations += 1
+            self.stats.size = len(self._entries)
+
+    def _get(self, key: str) -> t.Optional[t.Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def _set(self, key: str, frozen: t.Any, tables: t.FrozenSet[str], ttl: float):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, frozen, tables)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+            self.stats.size = len(self._entries)
+
+    @staticmethod
+    def _statement_tables(orm_context) -> t.FrozenSet[str]:
+        tables = {table.fullname for table in find_tables(orm_context.statement, include_joins=True)
+                  if hasattr(table, 'fullname')}
+        for mapper in orm_context.all_mappers:
+            tables.update(table.fullname for table in mapper.tables)
+        return frozenset(tables)
+
+    def _on_execute(self, orm_context):
+        if orm_context.is_insert or orm_context.is_update or orm_context.is_delete:
+            self._invalidate_session(orm_context.session, self._statement_tables(orm_context))
+            return None
+
+        option = orm_context.execution_options.get(CACHE_OPTION)
+        if not orm_context.is_select or orm_context.is_column_load or option is False:
+            return None
+
+        tables = self._statement_tables(orm_context)
+        if not tables or (option is not True and not tables <= self._tables):
+            return None
+
+        # Do not cache what the current transaction changed but not committed yet
+        if tables & orm_context.session.info.get(_PENDING_KEY, set()):
+            return None
+
+        with self._lock:
+            cache_key = orm_context.statement._generate_cache_key()
+            key = cache_key.to_offline_string(self._statements, orm_context.statement, orm_context.parameters or {})
+
+        frozen = self._get(key)
+        if frozen is None:
+            self.stats.misses += 1
+            frozen = orm_context.invoke_statement().freeze()
+            ttl = orm_context.execution_options.get(CACHE_TTL_OPTION, self.ttl)
+            self._set(key, frozen, tables, ttl)
+        else:
+            self.stats.hits += 1
+
+        if orm_context.all_mappers:
+            frozen = loading.merge_frozen_result(orm_context.session, orm_context.statement, frozen, load=False)
+        return frozen()
+
+    def _on_flush(self, session, flush_context):
+        tables = set()
+        for instance in [*session.new, *session.dirty, *session.deleted]:
+            tables.update(table.fullname for table in inspect(instance).mapper.tables)
+        if tables:
+            self._invalidate_session(session, tables)
+
+    def _invalidate_session(self, session, tables: t.Iterable[str]):
+        tables = set(tables)
+        session.info.setdefault(_PENDING_KEY, set()).update(tables)
+        self.invalidate(tables)
+        if self.invalidator is not None:
+            self.invalidator.publish(session, tables)
+
+    def _on_transaction_end(self, session):
+        # Other sessions may have cached the previous rows between the flush and the commit
+        tables = session.info.pop(_PENDING_KEY, None)
+        if tables:
+            self.invalidate(tables)
+
+    def _on_rollback(self, session, previous_transaction):
+        # The results cached by other sessions are still valid, but the rolled back
+        # changes may have been read by this one
+        tables = session.info.pop(_PENDING_KEY, None)
+        if tables:
+            self.invalidate(tables)
+
+
+class NotifyInvalidator:
+    """Propagate the cache invalidations between processes using PostgreSQL ``LISTEN/NOTIFY``.
+
+    The invalidated tables are notified within the session transaction, so the other
+    processes receive them only when the changes are committed.
+
+    Examples:
+        .. code-block:: python
+
+            invalidator = NotifyInvalidator(db.engine)
+            cache = QueryCache(invalidator=invalidator)
+            cache.install(db.session)
+            invalidator.start(cache)
+
+    Args:
+        engine: The SQLAlchemy active database engine.
+        channel: The notification channel.
+    """
+
+    def __init__(self, engine: Engine, channel: str = 'bdc_db_cache'):
+        """Build a new invalidator."""
+        self.engine = engine
+        self.channel = channel
+        self._thread: t.Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._ready = threading.Event()
+
+    def publish(self, session, tables: t.Iterable[str]):
+        """Notify the invalidated tables on commit of the session transaction."""
+        session.connection().execute(text('SELECT pg_notify(:channel, :payload)'),
+                                     dict(channel=self.channel, payload=json.dumps(sorted(tables))))
+
+    def start(self, cache: QueryCache, timeout: float = 1.0):
+        """Start a daemon thread which listens the channel and invalidates the cache."""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._listen, args=(cache, timeout), daemon=True)
+        self._thread.start()
+        self._ready.wait(timeout=10)
+
+    def stop(self):
+        """Stop the listener thread."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _listen(self, cache: QueryCache, timeout: float):
+        preparer = self.engine.dialect.identifier_preparer
+        with self.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            conn.execute(text(f'LISTEN {preparer.quote(self.channel)}'))
+            self._ready.set()
+
+            while not self._stop.is_set():
+                for _, payload in poll_notifications(conn.connection.dbapi_connection, timeout):
+                    cache.invalidate(json.loads(payload))
+
+            conn.execute(text(f'UNLISTEN {preparer.quote(self.channel)}'))
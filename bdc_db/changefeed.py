@@ -0,0 +1,346 @@
+#
+# This file is part of BDC-DB.
+# Copyright (C) 2023 INPE.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/gpl-3.0.html>.
+#
+
+"""Change feed of tables using PostgreSQL ``LISTEN/NOTIFY``.
+
+The tables declared with :func:`~bdc_db.changefeed.notify_changes` (or
+:class:`~bdc_db.models.ChangeFeedMixin`) get a row trigger which notifies each
+``INSERT``, ``UPDATE`` and ``DELETE`` as a JSON message. Messages larger than
+the ``NOTIFY`` limit are stored in an outbox table and notified by reference.
+
+.. versionadded:: 0.9.0
+"""
+
+import asyncio
+import inspect
+import json
+import threading
+import time
+import typing as t
+from dataclasses import dataclass, field
+
+from sqlalchemy import Table, event, text
+from sqlalchemy.engine import Connection, Engine
+
+from .utils import poll_notifications
+
+CHANGE_FEED_INFO_KEY = 'bdc_change_feed'
+"""Key used in ``Table.info`` to store the change feed declaration of a table."""
+
+NOTIFY_FUNCTION = 'bdc_db_notify_change'
+"""The name of the generic trigger function."""
+
+OUTBOX_TABLE = 'bdc_db_change_outbox'
+"""The table which keeps the messages larger than ``MAX_NOTIFY_BYTES``."""
+
+MAX_NOTIFY_BYTES = 7900
+"""The maximum payload size sent by ``NOTIFY`` (PostgreSQL limit is 8000 bytes)."""
+
+BULK_LOAD_OP = 'BULK_LOAD'
+"""The operation of the single event sent for a table after a :class:`~bdc_db.bulkload.BulkLoad`.
+
+The change feed trigger is disabled while the rows are loaded, so the consumers must read the table again.
+"""
+
+_FUNCTION_SQL = f'''
+CREATE TABLE IF NOT EXISTS public.{OUTBOX_TABLE} (
+    id BIGSERIAL PRIMARY KEY,
+    channel TEXT NOT NULL,
+    payload JSONB NOT NULL,
+    created TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE OR REPLACE FUNCTION public.{NOTIFY_FUNCTION}()
+RETURNS trigger AS $$
+DECLARE
+    record_data JSONB;
+    record_keys JSONB := '{{}}';
+    message JSONB;
+    outbox_id BIGINT;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        record_data := to_jsonb(OLD);
+    ELSE
+        record_data := to_jsonb(NEW);
+    END IF;
+
+    -- TG_ARGV: channel, include row ('row' or 'keys') and the key columns
+    FOR i IN 2 .. TG_NARGS - 1 LOOP
+        record_keys := record_keys || jsonb_build_object(TG_ARGV[i], record_data -> TG_ARGV[i]);
+    END LOOP;
+
+    message := jsonb_build_object('op', TG_OP, 'schema', TG_TABLE_SCHEMA, 'table', TG_TABLE_NAME, 'keys', record_keys);
+    IF TG_ARGV[1] = 'row' THEN
+        message := message || jsonb_build_object('row', record_data);
+    END IF;
+
+    IF octet_length(message::text) > {MAX_NOTIFY_BYTES} THEN
+        INSERT INTO public.{OUTBOX_TABLE} (channel, payload) VALUES (TG_ARGV[0], message) RETURNING id INTO outbox_id;
+        message := jsonb_build_object('op', TG_OP, 'schema', TG_TABLE_SCHEMA, 'table', TG_TABLE_NAME,
+                                      'outbox', outbox_id);
+    END IF;
+
+    PERFORM pg_notify(TG_ARGV[0], message::text);
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+'''
+
+
+@dataclass(frozen=True)
+class ChangeFeed:
+    """Declare the change feed of a table.
+
+    Args:
+        channel: The notification channel. Defaults to the table name.
+        include_row: Send the whole row in messages, not only the primary key.
+        operations: The operations notified.
+    """
+
+    channel: t.Optional[str] = None
+    include_row: bool = False
+    operations: t.Tuple[str, ...] = ('INSERT', 'UPDATE', 'DELETE')
+
+
+@dataclass
+class ChangeEvent:
+    """Represent a change notified by the change feed."""
+
+    channel: str
+    op: str
+    schema: str
+    table: str
+    keys: t.Dict[str, t.Any] = field(default_factory=dict)
+    row: t.Optional[t.Dict[str, t.Any]] = None
+
+    @property
+    def identity(self) -> t.Tuple[str, str, str]:
+        """Identify the changed row, used to de-duplicate the events."""
+        return self.schema, self.table, json.dumps(self.keys, sort_keys=True)
+
+
+def notify_changes(table: Table, feed: t.Optional[ChangeFeed] = None) -> Table:
+    """Mark a SQLAlchemy table to notify its changes.
+
+    The trigger is created along with the table (``create-schema`` or ``db.create_all()``)
+    and by the command ``create-triggers`` for the existing tables.
+
+    Args:
+        table: The table which changes are notified.
+        feed: The change feed declaration.
+    """
+    table.info[CHANGE_FEED_INFO_KEY] = feed or ChangeFeed()
+
+    if not event.contains(table, 'after_create', _create_trigger_after_create):
+        event.listen(table, 'after_create', _create_trigger_after_create)
+
+    return table
+
+
+def get_change_feed(table: Table) -> t.Optional[ChangeFeed]:
+    """Retrieve the change feed declaration of a table, if any."""
+    return table.info.get(CHANGE_FEED_INFO_KEY)
+
+
+def channel_name(table: Table) -> str:
+    """Retrieve the notification channel of a table."""
+    feed = get_change_feed(table)
+    return (feed.channel if feed is not None else None) or table.name
+
+
+def change_feed_tables(metadata) -> t.List[Table]:
+    """List the tables declared with change feed in a metadata."""
+    return [table for table in metadata.sorted_tables if get_change_feed(table) is not None]
+
+
+def change_feed_trigger_name(table: Table) -> str:
+    """Retrieve the name of the change feed trigger of a table."""
+    return f'{table.name}_bdc_change_feed'
+
+
+def create_notify_function(connection: Connection):
+    """Create (or replace) the generic notify trigger function and the outbox table."""
+    connection.exec_driver_sql(_FUNCTION_SQL)
+
+
+def create_change_feed_trigger(table: Table, connection: Connection):
+    """Create (or replace) the change feed trigger of a table.
+
+    Args:
+        table: The table declared with :func:`~bdc_db.changefeed.notify_changes`.
+        connection: The SQLAlchemy connection.
+    """
+    feed = get_change_feed(table)
+    if feed is None:
+        raise ValueError(f'Table {table} does not declare a change feed')
+
+    preparer = connection.dialect.identifier_preparer
+    trigger = preparer.quote(change_feed_trigger_name(table))
+    arguments = [channel_name(table), 'row' if feed.include_row else 'keys']
+    arguments.extend(column.name for column in table.primary_key.columns)
+    literals = ', '.join("'{}'".format(value.replace("'", "''")) for value in arguments)
+
+    connection.exec_driver_sql(f'DROP TRIGGER IF EXISTS {trigger} ON {preparer.format_table(table)}')
+    connection.exec_driver_sql(
+        f'CREATE TRIGGER {trigger} AFTER {" OR ".join(feed.operations)} ON {preparer.format_table(table)} '
+        f'FOR EACH ROW EXECUTE FUNCTION public.{NOTIFY_FUNCTION}({literals})'
+    )
+
+
+def _create_trigger_after_create(table: Table, connection, **kwargs):
+    create_notify_function(connection)
+    create_change_feed_trigger(table, connection)
+
+
+def parse_event(channel: str, payload: str) -> t.Tuple[ChangeEvent, t.Optional[int]]:
+    """Parse a notification payload, returning the event and its outbox id (if stored in outbox)."""
+    message = json.loads(payload)
+    change = ChangeEvent(channel=channel, op=message['op'], schema=message['schema'], table=message['table'],
+                         keys=message.get('keys') or {}, row=message.get('row'))
+    return change, message.get('outbox')
+
+
+class ChangeFeedConsumer:
+    """Listen the change feed channels and hand the events to a callback in batches.
+
+    The events are collected until ``batch_size`` events or ``batch_interval`` seconds.
+    With ``deduplicate``, only the last event of each row (same table and keys) is kept.
+
+    Examples:
+        .. code-block:: python
+
+            from bdc_db.changefeed import ChangeFeedConsumer
+
+            def reindex(events):
+                for change in events:
+                    print(change.op, change.table, change.keys)
+
+            consumer = ChangeFeedConsumer(db.engine, ['item'], reindex)
+            consumer.run()  # or: await consumer.run_async()
+
+    Args:
+        engine: The SQLAlchemy active database engine.
+        channels: The channels to listen.
+        callback: Function (or coroutine function in ``run_async``) called with the list of events.
+        batch_size: The maximum number of events per callback.
+        batch_interval: Maximum seconds to wait before handing a non-empty batch.
+        deduplicate: Keep only the last event of each row in a batch.
+        delete_outbox: Remove the outbox messages once read. Disable it when several consumers listen the same channel.
+    """
+
+    def __init__(self, engine: Engine, channels: t.Sequence[str], callback: t.Callable[[t.List[ChangeEvent]], t.Any],
+                 batch_size: int = 100, batch_interval: float = 0.5, deduplicate: bool = True,
+                 delete_outbox: bool = True):
+        """Build a new change feed consumer."""
+        self.engine = engine
+        self.channels = list(channels)
+        self.callback = callback
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.deduplicate = deduplicate
+        self.delete_outbox = delete_outbox
+        self.stopped = threading.Event()
+        self.ready = threading.Event()
+
+    def stop(self):
+        """Stop the consumer loop after the current batch."""
+        self.stopped.set()
+
+    def _listen(self, connection: Connection):
+        preparer = connection.dialect.identifier_preparer
+        for channel in self.channels:
+            connection.exec_driver_sql(f'LISTEN {preparer.quote(channel)}')
+        self.ready.set()
+
+    def _collect(self, connection: Connection, timeout: float) -> t.List[ChangeEvent]:
+        events, outbox = [], dict()
+        for channel, payload in poll_notifications(connection.connection.dbapi_connection, timeout):
+            change, outbox_id = parse_event(channel, payload)
+            if outbox_id is not None:
+                outbox[outbox_id] = len(events)
+            events.append(change)
+
+        if outbox:
+            rows = connection.execute(
+                text(f'SELECT id, channel, payload::text AS payload FROM public.{OUTBOX_TABLE} WHERE id = ANY(:ids)'),
+                dict(ids=list(outbox))
+            ).all()
+            for row in rows:
+                events[outbox[row.id]] = parse_event(row.channel, row.payload)[0]
+            if self.delete_outbox:
+                connection.execute(text(f'DELETE FROM public.{OUTBOX_TABLE} WHERE id = ANY(:ids)'),
+                                   dict(ids=list(outbox)))
+
+        return events
+
+    def _batch(self, events: t.List[ChangeEvent]) -> t.List[ChangeEvent]:
+        if not self.deduplicate:
+            return events
+        unique: t.Dict[t.Any, ChangeEvent] = dict()
+        for change in events:
+            unique.pop(change.identity, None)
+            unique[change.identity] = change
+        return list(unique.values())
+
+    def _poll(self, connection: Connection, pending: t.List[ChangeEvent], started: float) -> bool:
+        """Collect the new events and check if the pending batch is ready."""
+        timeout = self.batch_interval if not pending else max(0.0, started + self.batch_interval - time.monotonic())
+        pending.extend(self._collect(connection, timeout))
+        return bool(pending) and (len(pending) >= self.batch_size or
+                                  time.monotonic() - started >= self.batch_interval or self.stopped.is_set())
+
+    def run(self):
+        """Consume the events until :meth:`~bdc_db.changefeed.ChangeFeedConsumer.stop` is called."""
+        with self.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+            self._listen(connection)
+            pending, started = [], time.monotonic()
+
+            while not self.stopped.is_set() or pending:
+                if not pending:
+                    started = time.monotonic()
+                if self._poll(connection, pending, started):
+                    batch, pending = pending[:self.batch_size], pending[self.batch_size:]
+                    self.callback(self._batch(batch))
+                    started = time.monotonic()
+
+    async def run_async(self):
+        """Consume the events in asyncio until :meth:`~bdc_db.changefeed.ChangeFeedConsumer.stop` is called.
+
+        The connection is polled in a worker thread, so any driver works. The callback may be a coroutine function.
+        """
+        # asyncio.to_thread is not available in Python 3.8
+        loop = asyncio.get_running_loop()
+        connection = await loop.run_in_executor(
+            None, lambda: self.engine.connect().execution_options(isolation_level='AUTOCOMMIT')
+        )
+        try:
+            await loop.run_in_executor(None, self._listen, connection)
+            pending, started = [], time.monotonic()
+
+            while not self.stopped.is_set() or pending:
+                if not pending:
+                    started = time.monotonic()
+                if await loop.run_in_executor(None, self._poll, connection, pending, started):
+                    batch, pending = pending[:self.batch_size], pending[self.batch_size:]
+                    result = self.callback(self._batch(batch))
+                    if inspect.isawaitable(result):
+                        await result
+                    started = time.monotonic()
+        finally:
+            await loop.run_in_executor(None, connection.close)
@@ -18,6 +18,11 @@
 
 """Command-Line Interface for BDC database management."""
 
+import datetime
+import json
+import os
+from dataclasses import asdict
+
 import click
 from flask import current_app
 from flask.cli import FlaskGroup, with_appcontext
@@ -26,7 +31,22 @@ from sqlalchemy_utils.functions import (create_database, database_exists,
                                         drop_database)
 
 from . import create_app as _create_app
+from .audit import audit_jsonb, jsonb_columns
+from .bulkload import BulkLoad, recover_bulk_load
+from .changefeed import (change_feed_tables, channel_name,
+                         create_change_feed_trigger, create_notify_function)
+from .columnar import FORMATS, export_table, import_table
 from .db import db as _db
+from .dump import COMPRESSIONS, COPY_FORMATS, dump_tables, restore_tables
+from .indexes import (build_indexes, compile_create_index, invalid_indexes,
+                      missing_indexes, rebuild_index)
+from .maintenance import maintain_tables, table_stats
+from .partitioning import (create_partitions, detach_partitions,
+                           list_partitions, partitioned_tables)
+from .report import format_bytes, table_report
+from .slowlog import clear_records, load_records
+from .spatial import (ORDERS, geometry_columns, optimize_statements,
+                      spatial_optimize)
 from .utils import delete_trigger, execute, has_schema, list_triggers
 
 
@@ -211,6 +231,16 @@ def create_triggers(verbose):
 
             click.secho(f'Triggers from "{module_name}" registered', bold=True, fg='green')
 
+        feed_tables = change_feed_tables(_db.metadata)
+        if feed_tables:
+            connection = _db.session.connection()
+            create_notify_function(connection)
+
+            for table in feed_tables:
+                create_change_feed_trigger(table, connection)
+                click.secho(f'\t-> Change feed of "{table.fullname}" on channel "{channel_name(table)}"',
+                            bold=True, fg='green')
+
     _db.session.commit()
 
 
@@ -302,3 +332,557 @@ def load_file(verbose, file: click.File):
     _db.session.commit()
 
     click.secho(f'File {file.name} loaded!', bold=True, fg='green')
+
+
+def _get_partitioned_tables(names):
+    """Retrieve the partitioned tables from ``db.metadata``, optionally filtered by table names."""
+    tables = partitioned_tables(_db.metadata)
+    if names:
+        tables = [table for table in tables if table.name in names or table.fullname in names]
+    return tables
+
+
+@db.group()
+def partitions():
+    """Manage the partitions of the partitioned tables."""
+
+
+@partitions.command('premake')
+@click.option('-t', '--table', 'tables', multiple=True, help='Restrict to the given tables.')
+@click.option('-a', '--ahead', type=click.INT, default=None,
+              help='Number of future partitions. Defaults to the table declaration.')
+@with_appcontext
+def premake_partitions(tables, ahead):
+    """Create the current and future partitions of the partitioned tables."""
+    for table in _get_partitioned_tables(tables):
+        click.secho(f'Creating partitions of {table.fullname}...', bold=True, fg='yellow')
+
+        with _db.engine.begin() as conn:
+            names = create_partitions(table, conn, ahead=ahead)
+
+        for name in names:
+            click.secho(f'\t-> {name}', bold=True, fg='green')
+
+
+def _remove_partitions(tables, older_than, drop, concurrently):
+    context_msg = 'dropped' if drop else 'detached'
+    for table in _get_partitioned_tables(tables):
+        removed = detach_partitions(table, _db.engine, older_than.date(), drop=drop, concurrently=concurrently)
+
+        for partition in removed:
+            click.secho(f'The partition "{partition.name}" was {context_msg}. (from table {table.fullname})',
+                        bold=True, fg='green')
+
+
+@partitions.command('detach')
+@click.option('-t', '--table', 'tables', multiple=True, help='Restrict to the given tables.')
+@click.option('-o', '--older-than', type=click.DateTime(formats=['%Y-%m-%d']), required=True,
+              help='Detach the partitions whose upper bound is before this date.')
+@click.option('-c', '--concurrently', is_flag=True, default=False,
+              help='Detach without blocking the queries (PostgreSQL 14+).')
+@with_appcontext
+def detach_old_partitions(tables, older_than: datetime.datetime, concurrently):
+    """Detach the range partitions older than a given date (The data is kept)."""
+    _remove_partitions(tables, older_than, drop=False, concurrently=concurrently)
+
+
+@partitions.command('drop')
+@click.option('-t', '--table', 'tables', multiple=True, help='Restrict to the given tables.')
+@click.option('-o', '--older-than', type=click.DateTime(formats=['%Y-%m-%d']), required=True,
+              help='Drop the partitions whose upper bound is before this date.')
+@click.option('-f', '--force', is_flag=True, callback=abort_if_false,
+              expose_value=False,
+              prompt='Are you sure you want to drop the partitions (all data will be lost)?')
+@with_appcontext
+def drop_old_partitions(tables, older_than: datetime.datetime):
+    """Drop the range partitions older than a given date."""
+    _remove_partitions(tables, older_than, drop=True, concurrently=False)
+
+
+@partitions.command('sizes')
+@click.option('-t', '--table', 'tables', multiple=True, help='Restrict to the given tables.')
+@with_appcontext
+def partition_sizes(tables):
+    """Show the size and estimated rows of each partition."""
+    for table in _get_partitioned_tables(tables):
+        click.secho(f'Partitions of {table.fullname}:', bold=True, fg='green')
+
+        with _db.engine.connect() as conn:
+            entries = list_partitions(table, conn)
+
+        for partition in entries:
+            click.secho(f'\t-> {partition.name}: {partition.bound} - '
+                        f'{partition.total_bytes} bytes, ~{partition.estimated_rows} rows')
+
+
+@db.group()
+def indexes():
+    """Manage the indexes declared in the models without blocking the writes."""
+
+
+@indexes.command('status')
+@with_appcontext
+def indexes_status():
+    """List the declared indexes missing in database and the invalid indexes."""
+    with _db.engine.connect() as conn:
+        missing = missing_indexes(_db.metadata, conn)
+        invalid = invalid_indexes(conn)
+
+    if not missing and not invalid:
+        click.secho('All indexes are up to date.', bold=True, fg='green')
+
+    for index in missing:
+        click.secho(f'\t-> Missing index "{index.name}" on {index.table.fullname}', bold=True, fg='yellow')
+
+    for index in invalid:
+        click.secho(f'\t-> Invalid index "{index.schema}.{index.index_name}" on {index.table_name}',
+                    bold=True, fg='red')
+
+
+@indexes.command('create')
+@click.option('-j', '--jobs', type=click.INT, default=2, help='Number of parallel index builds.')
+@click.option('-i', '--interval', type=click.FLOAT, default=5.0, help='Seconds between progress reports.')
+@click.option('-p', '--preview', help='Preview the missing indexes (Do not create).',
+              type=click.BOOL, is_flag=True, default=False)
+@with_appcontext
+def create_indexes(jobs, interval, preview):
+    """Create the missing indexes using ``CREATE INDEX CONCURRENTLY``."""
+    with _db.engine.connect() as conn:
+        missing = missing_indexes(_db.metadata, conn)
+
+    if not missing:
+        click.secho('No missing index.', bold=True, fg='green')
+        return
+
+    for index in missing:
+        click.secho(f'\t-> {index.name} on {index.table.fullname}', bold=True, fg='yellow')
+
+    if preview:
+        return
+
+    def _report(progress):
+        for entry in progress:
+            click.secho(f'\t{entry.index_name or "-"} on {entry.table_name}: '
+                        f'{entry.phase} ({entry.percent:.1f}%)')
+
+    results = build_indexes(missing, _db.engine, jobs=jobs, on_progress=_report, interval=interval)
+
+    failed = False
+    for name, error in results.items():
+        if error is None:
+            click.secho(f'Index "{name}" created!', bold=True, fg='green')
+        else:
+            failed = True
+            click.secho(f'Index "{name}" failed: {error}', bold=True, fg='red')
+
+    if failed:
+        raise click.exceptions.Exit(1)
+
+
+@indexes.command('rebuild-invalid')
+@click.option('-p', '--preview', help='Preview the invalid indexes (Do not rebuild).',
+              type=click.BOOL, is_flag=True, default=False)
+@with_appcontext
+def rebuild_invalid_indexes(preview):
+    """Rebuild the invalid indexes using ``REINDEX INDEX CONCURRENTLY``."""
+    with _db.engine.connect() as conn:
+        invalid = invalid_indexes(conn)
+
+    if not invalid:
+        click.secho('No invalid index.', bold=True, fg='green')
+        return
+
+    context_msg = 'will be' if preview else 'was'
+    for index in invalid:
+        if not preview:
+            rebuild_index(index.schema, index.index_name, _db.engine)
+        click.secho(f'The index "{index.schema}.{index.index_name}" {context_msg} rebuilt.',
+                    bold=True, fg='yellow' if preview else 'green')
+
+
+def _get_table(name: str):
+    """Retrieve a table from ``db.metadata`` by name or qualified name (``schema.table``)."""
+    if name in _db.metadata.tables:
+        return _db.metadata.tables[name]
+
+    tables = [table for table in _db.metadata.tables.values() if table.name == name]
+    if len(tables) != 1:
+        raise click.BadParameter(f'Table "{name}" not found or ambiguous in models.', param_hint='--table')
+    return tables[0]
+
+
+@db.command('export')
+@click.option('-t', '--table', 'table_name', required=True, help='The table name (schema.table).')
+@click.option('-o', '--output', type=click.Path(dir_okay=False, writable=True), required=True,
+              help='The output file. Use the extension ".arrow" for Arrow IPC or ".parquet" for Parquet.')
+@click.option('--format', 'file_format', type=click.Choice(FORMATS), default=None,
+              help='The file format. Defaults to the output extension.')
+@click.option('-b', '--batch-size', type=click.INT, default=10000, help='Number of rows per record batch.')
+@with_appcontext
+def export_table_file(table_name, output, file_format, batch_size):
+    """Export a table into an Arrow IPC or Parquet file."""
+    table = _get_table(table_name)
+
+    click.secho(f'Exporting {table.fullname} into {output}...', bold=True, fg='yellow')
+
+    result = export_table(table, output, _db.engine, file_format=file_format, batch_size=batch_size)
+
+    click.secho(f'{result.rows} rows exported in {result.elapsed:.2f}s '
+                f'({result.rows_per_second:.0f} rows/s).', bold=True, fg='green')
+
+
+@db.command('import')
+@click.option('-t', '--table', 'table_name', required=True, help='The table name (schema.table).')
+@click.option('-i', '--input', 'input_file', type=click.Path(exists=True, dir_okay=False), required=True,
+              help='The Arrow IPC or Parquet file to import.')
+@click.option('--format', 'file_format', type=click.Choice(FORMATS), default=None,
+              help='The file format. Defaults to the input extension.')
+@click.option('-b', '--batch-size', type=click.INT, default=10000, help='Number of rows per insert batch.')
+@click.option('--truncate', is_flag=True, default=False, help='Remove the table rows before import.')
+@with_appcontext
+def import_table_file(table_name, input_file, file_format, batch_size, truncate):
+    """Import an Arrow IPC or Parquet file into a table."""
+    table = _get_table(table_name)
+
+    click.secho(f'Importing {input_file} into {table.fullname}...', bold=True, fg='yellow')
+
+    result = import_table(table, input_file, _db.engine, file_format=file_format,
+                          batch_size=batch_size, truncate=truncate)
+
+    click.secho(f'{result.rows} rows imported in {result.elapsed:.2f}s '
+                f'({result.rows_per_second:.0f} rows/s).', bold=True, fg='green')
+
+
+@db.command('dump')
+@click.option('-n', '--namespace', 'namespaces', multiple=True,
+              help='Restrict to the tables of the given namespaces (schemas).')
+@click.option('-o', '--output', type=click.Path(dir_okay=False, writable=True), required=True,
+              help='The output tar archive.')
+@click.option('-c', '--compression', type=click.Choice(COMPRESSIONS), default='gzip',
+              help='The compression of each table file.')
+@click.option('-j', '--jobs', type=click.INT, default=4, help='Number of tables dumped in parallel.')
+@click.option('--format', 'copy_format', type=click.Choice(COPY_FORMATS), default='text',
+              help='The COPY format. The binary format is faster, but it requires the same column types on restore.')
+@with_appcontext
+def dump(namespaces, output, compression, jobs, copy_format):
+    """Dump the table rows of the models into a tar archive using COPY."""
+    tables = [table for table in _db.metadata.sorted_tables if not namespaces or table.schema in namespaces]
+
+    click.secho(f'Dumping {len(tables)} tables into {output}...', bold=True, fg='yellow')
+
+    result = dump_tables(tables, output, _db.engine, compression=compression, jobs=jobs, copy_format=copy_format)
+
+    for entry in result.tables:
+        click.secho(f'\t-> {entry.table}: {entry.rows} rows')
+
+    click.secho(f'{result.rows} rows dumped in {result.elapsed:.2f}s.', bold=True, fg='green')
+
+
+@db.command('restore')
+@click.option('-i', '--input', 'input_file', type=click.Path(exists=True, dir_okay=False), required=True,
+              help='The tar archive created by "db dump".')
+@click.option('--clean', is_flag=True, default=False, help='Remove the rows of the dumped tables before restore.')
+@click.option('--cascade', is_flag=True, default=False,
+              help='With --clean, also remove the rows of the tables which reference the dumped tables.')
+@with_appcontext
+def restore(input_file, clean, cascade):
+    """Restore a tar archive created by "db dump" in foreign key order."""
+    click.secho(f'Restoring {input_file}...', bold=True, fg='yellow')
+
+    result = restore_tables(input_file, _db.metadata.tables, _db.engine, clean=clean, cascade=cascade)
+
+    for entry in result.tables:
+        click.secho(f'\t-> {entry.table}: {entry.rows} rows')
+
+    click.secho(f'{result.rows} rows restored in {result.elapsed:.2f}s.', bold=True, fg='green')
+
+
+@db.group('bulk-load')
+def bulk_load():
+    """Load data with the registered triggers and secondary indexes suspended."""
+
+
+@bulk_load.command('run')
+@click.option('-t', '--table', 'table_names', multiple=True, required=True, help='The tables to load.')
+@click.option('-f', '--file', 'files', type=click.File('r'), multiple=True, required=True,
+              help='The SQL files which load the data.')
+@click.option('--keep-indexes', is_flag=True, default=False, help='Do not drop the secondary indexes.')
+@click.option('--synchronous-commit', is_flag=True, default=False,
+              help='Keep synchronous_commit enabled in the load transaction.')
+@click.option('--no-defer-constraints', is_flag=True, default=False, help='Do not defer the constraints.')
+@with_appcontext
+def bulk_load_run(table_names, files, keep_indexes, synchronous_commit, no_defer_constraints):
+    """Execute SQL files in bulk-load mode."""
+    tables = [_get_table(name) for name in table_names]
+
+    loader = BulkLoad(tables, _db.engine, drop_indexes=not keep_indexes,
+                      synchronous_commit=synchronous_commit, defer_constraints=not no_defer_constraints)
+
+    with loader as conn:
+        for index in loader.journal.indexes:
+            click.secho(f'\t-> Index "{index.name}" dropped.', fg='yellow')
+        for _, table_name, trigger_name in loader.journal.triggers:
+            click.secho(f'\t-> Trigger "{trigger_name}" on {table_name} disabled.', fg='yellow')
+
+        for file in files:
+            click.secho(f'Loading file {file.name}...', bold=True, fg='yellow')
+            execute(file.read(), conn)
+
+    click.secho('Bulk load finished. Triggers and indexes restored.', bold=True, fg='green')
+
+
+@bulk_load.command('recover')
+@with_appcontext
+def bulk_load_recover():
+    """Restore the triggers and indexes left suspended by the crashed bulk loads."""
+    journals = recover_bulk_load(_db.engine)
+    if not journals:
+        click.secho('No bulk load to recover.', bold=True, fg='green')
+        return
+
+    for journal in journals:
+        click.secho(f'Bulk load of {", ".join(journal.tables)} (started at {journal.started}) recovered: '
+                    f'{len(journal.triggers)} triggers and {len(journal.indexes)} indexes restored.',
+                    bold=True, fg='green')
+
+
+@db.command('validate-jsonb')
+@click.option('-t', '--table', 'table_names', multiple=True,
+              help='Restrict to the JSONB columns of the given tables. Defaults to all the models.')
+@click.option('-j', '--jobs', type=click.INT, default=4, help='Number of validation processes.')
+@click.option('-b', '--batch-size', type=click.INT, default=5000, help='Number of rows validated per chunk.')
+@click.option('--checkpoint', type=click.Path(dir_okay=False, writable=True), default=None,
+              help='Save the progress into this file and resume from it when it exists.')
+@click.option('--restart', is_flag=True, default=False, help='Ignore the existing checkpoint and start again.')
+@click.option('-o', '--output', type=click.Path(dir_okay=False, writable=True), default=None,
+              help='Write the report of violations as JSON.')
+@with_appcontext
+def validate_jsonb(table_names, jobs, batch_size, checkpoint, restart, output):
+    """Validate the stored JSONB documents against their current JSONSchemas."""
+    tables = [_get_table(name) for name in table_names]
+    columns = [column for column in jsonb_columns(_db.metadata) if not tables or column.table in tables]
+
+    if not columns:
+        click.secho('No JSONB column found.', bold=True, fg='yellow')
+        return
+
+    if restart and checkpoint and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+
+    click.secho(f'Validating {len(columns)} JSONB columns...', bold=True, fg='yellow')
+
+    result = audit_jsonb(columns, _db.engine, jobs=jobs, chunk_size=batch_size, checkpoint=checkpoint)
+
+    per_schema = dict()
+    for audit in result:
+        per_schema.setdefault(audit.schema, []).append(audit)
+
+    for schema, audits in per_schema.items():
+        invalid = sum(audit.invalid for audit in audits)
+        click.secho(f'{schema}: {sum(audit.rows for audit in audits)} rows, {invalid} invalid',
+                    bold=True, fg='red' if invalid else 'green')
+        for audit in audits:
+            for violation in audit.violations:
+                click.secho(f'\t-> {audit.name} {violation.keys}: {violation.message}', fg='red')
+
+    if output:
+        with open(output, 'w') as fd:
+            json.dump({schema: [asdict(audit) for audit in audits] for schema, audits in per_schema.items()},
+                      fd, indent=2, default=str)
+
+
+@db.command('maintain')
+@click.option('-n', '--namespace', 'namespaces', multiple=True,
+              help='Restrict to the tables of the given namespaces (schemas).')
+@click.option('-t', '--table', 'table_names', multiple=True, help='Restrict to the given tables.')
+@click.option('--vacuum', is_flag=True, default=False, help='Run "VACUUM (ANALYZE)" instead of "ANALYZE".')
+@click.option('-j', '--jobs', type=click.INT, default=2, help='Number of parallel connections.')
+@click.option('--budget', type=click.FLOAT, default=None,
+              help='Time budget in seconds. The tables not started in time are skipped.')
+@click.option('--all', 'all_tables', is_flag=True, default=False,
+              help='Include the tables without dead tuples and modifications since the last analyze.')
+@click.option('-p', '--preview', help='Preview the tables in priority order (Do not run).',
+              type=click.BOOL, is_flag=True, default=False)
+@with_appcontext
+def maintain(namespaces, table_names, vacuum, jobs, budget, all_tables, preview):
+    """Run ANALYZE or VACUUM on the tables of the models, ordered by dead tuples and modifications."""
+    tables = [_get_table(name) for name in table_names] or [
+        table for table in _db.metadata.sorted_tables if not namespaces or table.schema in namespaces
+    ]
+
+    if preview:
+        with _db.engine.connect() as conn:
+            stats = sorted(table_stats(tables, conn), key=lambda entry: entry.priority, reverse=True)
+        for entry in stats:
+            click.secho(f'\t-> {entry.name}: {entry.dead_tuples} dead tuples, {entry.modifications} modifications, '
+                        f'last analyze {entry.last_analyze}')
+        return
+
+    operation = 'vacuum' if vacuum else 'analyze'
+    click.secho(f'Running {operation} on {len(tables)} tables...', bold=True, fg='yellow')
+
+    def _report(result):
+        if result.skipped:
+            click.secho(f'\t-> {result.before.name}: skipped (time budget exceeded)', fg='yellow')
+        elif result.error:
+            click.secho(f'\t-> {result.before.name}: {result.error}', fg='red')
+        else:
+            click.secho(f'\t-> {result.before.name}: done in {result.elapsed:.2f}s', fg='green')
+
+    results = maintain_tables(tables, _db.engine, operation, jobs=jobs, budget=budget,
+                              only_changed=not all_tables, on_result=_report)
+
+    for result in results:
+        if result.after is None or result.skipped or result.error:
+            continue
+        click.secho(f'{result.before.name}: dead tuples {result.before.dead_tuples} -> {result.after.dead_tuples}, '
+                    f'modifications {result.before.modifications} -> {result.after.modifications}')
+
+    click.secho(f'{sum(1 for result in results if not result.skipped and not result.error)} of '
+                f'{len(results)} tables maintained.', bold=True, fg='green')
+
+
+@db.command('report')
+@click.option('-n', '--namespace', 'namespaces', multiple=True,
+              help='Report all tables of the given namespaces (schemas).')
+@click.option('-t', '--table', 'table_names', multiple=True, help='Restrict to the given tables.')
+@click.option('--format', 'output_format', type=click.Choice(['table', 'json']), default='table',
+              help='The output format.')
+@click.option('--no-indexes', is_flag=True, default=False, help='Do not report the indexes.')
+@with_appcontext
+def report(namespaces, table_names, output_format, no_indexes):
+    """Report the size, bloat, scans and cache hit ratio of the tables and the unused or duplicate indexes."""
+    if table_names or namespaces:
+        tables = [_get_table(name) for name in table_names]
+    else:
+        tables = _db.metadata.sorted_tables
+        namespaces = current_app.extensions['bdc-db'].namespaces
+
+    with _db.engine.connect() as conn:
+        entries = table_report(conn, tables, namespaces, include_indexes=not no_indexes)
+
+    if output_format == 'json':
+        click.echo(json.dumps([dict(asdict(entry), bloat_ratio=entry.bloat_ratio) for entry in entries],
+                              indent=2, default=str))
+        return
+
+    def _percent(value):
+        return '-' if value is None else f'{100 * value:.1f}%'
+
+    click.secho(f'{"Table":40} {"Total":>10} {"Table":>10} {"Indexes":>10} {"Rows":>12} {"Dead":>10} '
+                f'{"Bloat":>10} {"Seq scans":>10} {"Idx scans":>10} {"Cache hit":>10}', bold=True)
+    for entry in entries:
+        click.secho(f'{entry.name:40} {format_bytes(entry.total_bytes):>10} {format_bytes(entry.table_bytes):>10} '
+                    f'{format_bytes(entry.indexes_bytes):>10} {entry.estimated_rows:>12} {entry.dead_tuples:>10} '
+                    f'{_percent(entry.bloat_ratio):>10} {entry.seq_scans:>10} {entry.idx_scans:>10} '
+                    f'{_percent(entry.cache_hit_ratio):>10}')
+
+        for index in entry.indexes:
+            notes = []
+            if index.unused:
+                notes.append('unused')
+            if index.duplicate_of:
+                notes.append(f'duplicate of {index.duplicate_of}')
+            click.secho(f'\t-> {index.index_name}: {format_bytes(index.size_bytes)}, {index.scans} scans, '
+                        f'cache hit {_percent(index.cache_hit_ratio)} {", ".join(notes)}'.rstrip(),
+                        fg='yellow' if notes else None)
+
+
+@db.command('slow-queries')
+@click.option('-d', '--dir', 'directory', type=click.Path(file_okay=False), default=None,
+              help='The directory written by the application processes. Defaults to BDC_DB_SLOW_QUERY_DIR.')
+@click.option('-l', '--limit', type=click.INT, default=20, help='Number of statements shown.')
+@click.option('--plan', is_flag=True, default=False, help='Show the captured EXPLAIN plans.')
+@click.option('--clear', is_flag=True, default=False, help='Remove the record files of all processes.')
+@with_appcontext
+def slow_queries(directory, limit, plan, clear):
+    """List the slow statements recorded by the application (BDC_DB_SLOW_QUERY_THRESHOLD), the slowest first."""
+    directory = directory or current_app.config.get('BDC_DB_SLOW_QUERY_DIR')
+    if not directory:
+        click.secho('Set BDC_DB_SLOW_QUERY_DIR (or --dir) to read the slow statements.', bold=True, fg='red')
+        raise click.Abort()
+
+    if clear:
+        removed = clear_records(directory) if os.path.isdir(directory) else 0
+        click.secho(f'Slow statements removed ({removed} files).', bold=True, fg='green')
+        return
+
+    records = load_records(directory) if os.path.isdir(directory) else []
+    if not records:
+        click.secho('No slow statement recorded.', bold=True, fg='yellow')
+        return
+
+    records = sorted(records, key=lambda record: record.duration, reverse=True)
+
+    for record in records[:limit]:
+        click.secho(f'{record.duration * 1000:.1f} ms at {record.timestamp} - {record.location}', bold=True, fg='red')
+        click.secho(f'\t{record.statement}')
+        click.secho(f'\tParameters: {record.parameters}', fg='yellow')
+        if plan and record.plan is not None:
+            click.secho(json.dumps(record.plan, indent=2))
+        elif plan and record.explain_error:
+            click.secho(f'\tEXPLAIN failed: {record.explain_error}', fg='red')
+
+
+@db.command('spatial-optimize')
+@click.option('-t', '--table', 'table_names', multiple=True,
+              help='Restrict to the given tables. Defaults to all the models with geometry columns.')
+@click.option('--order', type=click.Choice(ORDERS), default='spatial',
+              help='Physical order: geohash of the geometries or first time column then geohash.')
+@click.option('--no-cluster', is_flag=True, default=False, help='Only create the missing indexes (no CLUSTER).')
+@click.option('--no-brin', is_flag=True, default=False, help='Do not create the BRIN indexes of the time columns.')
+@click.option('-s', '--samples', type=click.INT, default=20,
+              help='Number of bounding box queries measured before and after (0 to skip).')
+@click.option('-p', '--preview', help='Preview the statements (Do not run).',
+              type=click.BOOL, is_flag=True, default=False)
+@with_appcontext
+def optimize_spatial(table_names, order, no_cluster, no_brin, samples, preview):
+    """Create the spatial and BRIN indexes and cluster the geometry tables along the geohash curve."""
+    tables = [_get_table(name) for name in table_names] or None
+    columns = geometry_columns(_db.metadata, tables)
+
+    if not columns:
+        click.secho('No geometry column found.', bold=True, fg='yellow')
+        return
+
+    if preview:
+        with _db.engine.connect() as conn:
+            missing = missing_indexes(_db.metadata, conn)
+
+        seen = set()
+        for column in columns:
+            if column.table in seen:
+                continue
+            seen.add(column.table)
+            click.secho(f'{column.table.fullname} ({column.name}):', bold=True)
+            for index in missing:
+                if index.table is column.table:
+                    click.secho(f'\t-> {compile_create_index(index, _db.engine.dialect)}')
+            for statement in optimize_statements(column, _db.engine.dialect, order, not no_cluster, not no_brin):
+                click.secho(f'\t-> {statement}')
+        return
+
+    click.secho('The tables are locked (ACCESS EXCLUSIVE) while clustered.', bold=True, fg='yellow')
+
+    def _report(result):
+        if result.error:
+            click.secho(f'\t-> {result.table}: {result.error}', fg='red')
+            return
+
+        click.secho(f'\t-> {result.table}: done in {result.elapsed:.2f}s', fg='green')
+        for statement in result.statements:
+            click.secho(f'\t\t{statement}')
+        if result.before is not None and result.after is not None:
+            click.secho(f'\t\tmedian {result.before.median:.2f} ms -> {result.after.median:.2f} ms, '
+                        f'p95 {result.before.p95:.2f} ms -> {result.after.p95:.2f} ms '
+                        f'({result.after.queries} queries)', bold=True)
+
+    try:
+        results = spatial_optimize(columns, _db.engine, order=order, cluster=not no_cluster, brin=not no_brin,
+                                   samples=samples, on_result=_report)
+    except RuntimeError as e:
+        click.secho(str(e), bold=True, fg='red')
+        raise click.Abort()
+
+    click.secho(f'{sum(1 for result in results if not result.error)} of {len(results)} tables optimized.',
+                bold=True, fg='green')
@@ -0,0 +1,282 @@
+#
+# This file is part of BDC-DB.
+# Copyright (C) 2023 INPE.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/gpl-3.0.html>.
+#
+
+"""Export and import tables as Apache Arrow IPC or Parquet files.
+
+This module requires `pyarrow <https://arrow.apache.org/docs/python/>`_, installed
+with the extra ``bdc-db[arrow]``.
+
+.. versionadded:: 0.9.0
+"""
+
+import decimal
+import json
+import time
+import typing as t
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+
+from sqlalchemy import Table, insert, select, types
+from sqlalchemy.engine import Engine
+
+from .utils import reset_sequences
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover
+    pa = pq = None
+
+FORMATS = ('parquet', 'arrow')
+"""The supported file formats."""
+
+TABLE_METADATA_KEY = b'bdc_db.table'
+"""Key of the Arrow schema metadata which stores the source table name."""
+
+
+@dataclass
+class TransferResult:
+    """Represent the summary of an export or import of a table."""
+
+    table: str
+    path: str
+    rows: int = 0
+    batches: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        """Retrieve the throughput of operation."""
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+
+def _require_pyarrow():
+    if pa is None:  # pragma: no cover
+        raise ImportError('The columnar export requires "pyarrow". Install it with "pip install bdc-db[arrow]"')
+
+
+def _python_type(column_type) -> t.Optional[type]:
+    try:
+        return column_type.python_type
+    except NotImplementedError:
+        return None
+
+
+def _is_json(column_type) -> bool:
+    return isinstance(getattr(column_type, 'impl_instance', column_type), types.JSON)
+
+
+def arrow_type(column_type) -> 'pa.DataType':
+    """Map a SQLAlchemy column type to the Arrow data type.
+
+    The JSON and JSONB values are stored as JSON strings. The types without
+    an Arrow equivalent are stored as their string representation.
+
+    Note:
+        A ``Numeric`` without precision accepts any number of digits, more than
+        the Arrow decimal types hold, so its values are stored as strings to keep
+        them exact. They are read back as :class:`decimal.Decimal` on import.
+    """
+    _require_pyarrow()
+
+    column_type = getattr(column_type, 'impl_instance', column_type)
+    if isinstance(column_type, types.Boolean):
+        return pa.bool_()
+    if isinstance(column_type, types.SmallInteger):
+        return pa.int16()
+    if isinstance(column_type, types.BigInteger):
+        return pa.int64()
+    if isinstance(column_type, types.Integer):
+        return pa.int32()
+    if isinstance(column_type, types.Numeric) and not column_type.asdecimal:
+        return pa.float64()
+    if isinstance(column_type, types.Numeric) and column_type.precision:
+        return pa.decimal128(column_type.precision, column_type.scale or 0)
+    if isinstance(column_type, types.DateTime):
+        return pa.timestamp('us', tz='UTC' if column_type.timezone else None)
+    if isinstance(column_type, types.Date):
+        return pa.date32()
+    if isinstance(column_type, types.Time):
+        return pa.time64('us')
+    if isinstance(column_type, types.Interval):
+        return pa.duration('us')
+    if isinstance(column_type, types.LargeBinary):
+        return pa.binary()
+    if isinstance(column_type, types.ARRAY):
+        return pa.list_(arrow_type(column_type.item_type))
+    return pa.string()
+
+
+def arrow_schema(table: Table) -> 'pa.Schema':
+    """Build the Arrow schema of a SQLAlchemy table."""
+    _require_pyarrow()
+
+    fields = [pa.field(column.name, arrow_type(column.type), nullable=column.nullable) for column in table.columns]
+    return pa.schema(fields, metadata={TABLE_METADATA_KEY: table.fullname.encode()})
+
+
+def _guess_format(path: t.Union[str, Path], file_format: t.Optional[str]) -> str:
+    file_format = file_format or ('arrow' if Path(path).suffix in ('.arrow', '.feather', '.ipc') else 'parquet')
+    if file_format not in FORMATS:
+        raise ValueError(f'Invalid format "{file_format}". Expected one of {FORMATS}')
+    return file_format
+
+
+def _is_generated(column) -> bool:
+    return column.computed is not None or (column.identity is not None and bool(column.identity.always))
+
+
+def _export_converter(column, data_type) -> t.Optional[t.Callable[[t.Any], t.Any]]:
+    if _is_json(column.type):
+        return json.dumps
+    if pa.types.is_string(data_type):
+        return str
+    return None
+
+
+def export_table(table: Table, path: t.Union[str, Path], engine: Engine, file_format: t.Optional[str] = None,
+                 batch_size: int = 10000) -> TransferResult:
+    """Export the rows of a table into an Arrow IPC or Parquet file.
+
+    The rows are read by a server-side cursor and written in record batches of
+    ``batch_size`` rows, keeping the memory bounded for large tables.
+
+    Args:
+        table: The SQLAlchemy table, usually from ``db.metadata``.
+        path: The output file path.
+        engine: The SQLAlchemy active database engine.
+        file_format: The output format (``parquet`` or ``arrow``). Defaults to the file extension.
+        batch_size: The number of rows per record batch.
+    """
+    _require_pyarrow()
+
+    file_format = _guess_format(path, file_format)
+    schema = arrow_schema(table)
+    converters = {
+        column.name: _export_converter(column, schema.field(column.name).type)
+        for column in table.columns
+    }
+
+    result = TransferResult(table=table.fullname, path=str(path))
+    start = time.perf_counter()
+
+    if file_format == 'parquet':
+        writer = pq.ParquetWriter(str(path), schema)
+    else:
+        writer = pa.ipc.new_file(str(path), schema)
+
+    try:
+        with engine.connect() as conn:
+            query_result = conn.execution_options(yield_per=batch_size).execute(select(table))
+
+            for partition in query_result.mappings().partitions(batch_size):
+                data = {name: [] for name in converters}
+                for row in partition:
+                    for name, converter in converters.items():
+                        value = row[name]
+                        data[name].append(converter(value) if converter and value is not None else value)
+
+                writer.write_batch(pa.RecordBatch.from_pydict(data, schema=schema))
+                result.rows += len(partition)
+                result.batches += 1
+    finally:
+        writer.close()
+
+    result.elapsed = time.perf_counter() - start
+
+    return result
+
+
+def _iter_batches(path: t.Union[str, Path], file_format: str, batch_size: int) -> t.Iterator['pa.RecordBatch']:
+    if file_format == 'parquet':
+        yield from pq.ParquetFile(str(path)).iter_batches(batch_size=batch_size)
+        return
+
+    with pa.memory_map(str(path)) as source:
+        reader = pa.ipc.open_file(source)
+        for i in range(reader.num_record_batches):
+            batch = reader.get_batch(i)
+            for offset in range(0, batch.num_rows, batch_size):
+                yield batch.slice(offset, batch_size)
+
+
+def import_table(table: Table, path: t.Union[str, Path], engine: Engine, file_format: t.Optional[str] = None,
+                 batch_size: int = 10000, truncate: bool = False) -> TransferResult:
+    """Import the rows of an Arrow IPC or Parquet file into a table.
+
+    The file is read in record batches of ``batch_size`` rows and all of them
+    are inserted in a single transaction. The :class:`~bdc_db.sqltypes.JSONB`
+    values are validated against their JSONSchema.
+
+    The generated columns (``GENERATED ALWAYS``, computed or identity) are not
+    imported, since PostgreSQL rejects explicit values for them. The serial and
+    identity sequences are moved past the imported values at the end.
+
+    Args:
+        table: The SQLAlchemy table, usually from ``db.metadata``.
+        path: The input file path.
+        engine: The SQLAlchemy active database engine.
+        file_format: The input format (``parquet`` or ``arrow``). Defaults to the file extension.
+        batch_size: The number of rows per insert batch.
+        truncate: Remove the table rows before import.
+    """
+    _require_pyarrow()
+
+    file_format = _guess_format(path, file_format)
+    columns = [column for column in table.columns if not _is_generated(column)]
+    generated = {column.name for column in table.columns if _is_generated(column)}
+    json_columns = {column.name for column in columns if _is_json(column.type)}
+    uuid_columns = {column.name for column in columns if _python_type(column.type) is uuid.UUID}
+    decimal_columns = {
+        column.name for column in columns
+        if _python_type(column.type) is decimal.Decimal and pa.types.is_string(arrow_type(column.type))
+    }
+
+    result = TransferResult(table=table.fullname, path=str(path))
+    start = time.perf_counter()
+
+    with engine.begin() as conn:
+        if truncate:
+            conn.execute(table.delete())
+
+        for batch in _iter_batches(path, file_format, batch_size):
+            rows = batch.to_pylist()
+            for row in rows:
+                for name in generated.intersection(row):
+                    del row[name]
+                for name in json_columns.intersection(row):
+                    if row[name] is not None:
+                        row[name] = json.loads(row[name])
+                for name in uuid_columns.intersection(row):
+                    if row[name] is not None:
+                        row[name] = uuid.UUID(row[name])
+                for name in decimal_columns.intersection(row):
+                    if row[name] is not None:
+                        row[name] = decimal.Decimal(row[name])
+
+            if rows:
+                conn.execute(insert(table), rows)
+            result.rows += len(rows)
+            result.batches += 1
+
+        reset_sequences(table, conn)
+
+    result.elapsed = time.perf_counter() - start
+
+    return result
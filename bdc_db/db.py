@@ -18,6 +18,8 @@
 
 """Database instance using Flask-SQLAlchemy extension."""
 
+from flask_sqlalchemy.model import Model as _Model
+from sqlalchemy import Column
 from sqlalchemy import MetaData as _MetaData
 
 from ._compat import SQLAlchemyDB
@@ -36,5 +38,20 @@ metadata = _MetaData(naming_convention=NAMING_CONVENTION)
 """Default database metadata object holding associated schema constructs."""
 
 
-db = SQLAlchemyDB(metadata=metadata)
+class Model(_Model):
+    """Base class of the models, which defers the large columns when a model is declared.
+
+    See :func:`bdc_db.models.defer_large_columns`.
+    """
+
+    def __init_subclass__(cls, **kwargs):
+        """Defer the large columns before the class is mapped."""
+        if any(isinstance(value, Column) for value in vars(cls).values()):
+            # Imported on use since the models module depends on this one
+            from .models import defer_large_columns
+            defer_large_columns(cls)
+        super().__init_subclass__(**kwargs)
+
+
+db = SQLAlchemyDB(metadata=metadata, model_class=Model)
 """Shared database instance using Flask-SQLAlchemy extension."""
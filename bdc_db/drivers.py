@@ -0,0 +1,86 @@
+#
+# This file is part of BDC-DB.
+# Copyright (C) 2023 INPE.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/gpl-3.0.html>.
+#
+
+"""Choose and configure the PostgreSQL driver (psycopg2 or psycopg 3).
+
+.. versionadded:: 0.9.0
+"""
+
+import typing as t
+
+from sqlalchemy.engine import make_url
+
+DRIVERS = ('psycopg2', 'psycopg')
+"""The supported values of ``BDC_DB_DRIVER``. The psycopg 3 driver (``psycopg``) is opt-in."""
+
+
+def resolve_database_uri(uri: str, driver: str = 'psycopg2') -> str:
+    """Set the driver of a PostgreSQL database URI.
+
+    An URI with an explicit driver, like ``postgresql+psycopg://``, is kept as is.
+
+    Args:
+        uri: The SQLAlchemy database URI.
+        driver: The driver name, one of :data:`~bdc_db.drivers.DRIVERS`.
+    """
+    if driver not in DRIVERS:
+        raise ValueError(f'Invalid database driver "{driver}". Expected one of {DRIVERS}')
+
+    url = make_url(uri)
+    if url.get_backend_name() != 'postgresql' or '+' in url.drivername:
+        return uri
+
+    return url.set(drivername=f'postgresql+{driver}').render_as_string(hide_password=False)
+
+
+def parse_prepare_threshold(value: t.Any) -> t.Optional[int]:
+    """Parse the ``BDC_DB_PREPARE_THRESHOLD`` value (``none`` or ``off`` disables the prepared statements)."""
+    if value is None or isinstance(value, int):
+        return value
+    if str(value).lower() in ('none', 'off', ''):
+        return None
+    return int(value)
+
+
+def engine_options(uri: str, options: t.Dict[str, t.Any], prepare_threshold: t.Any = 'default') -> t.Dict[str, t.Any]:
+    """Build the engine options with the driver specific connection arguments.
+
+    For psycopg 3, the ``prepare_threshold`` sets how many times a query runs before
+    it is prepared on server. ``None`` disables the prepared statements (required
+    with PgBouncer in transaction mode) and ``'default'`` keeps the driver default.
+
+    Args:
+        uri: The SQLAlchemy database URI, with the driver resolved.
+        options: The SQLAlchemy engine options.
+        prepare_threshold: The psycopg 3 prepare threshold.
+    """
+    if make_url(uri).get_driver_name() != 'psycopg' or prepare_threshold == 'default':
+        return options
+
+    options = dict(options)
+    connect_args = dict(options.get('connect_args', {}))
+    connect_args.setdefault('prepare_threshold', parse_prepare_threshold(prepare_threshold))
+    options['connect_args'] = connect_args
+
+    return options
+
+
+def is_psycopg3(executor: t.Any) -> bool:
+    """Check if an engine, connection or session uses the psycopg 3 driver."""
+    bind = executor.get_bind() if hasattr(executor, 'get_bind') else executor
+    return bind.dialect.driver == 'psycopg'
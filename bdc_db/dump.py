@@ -0,0 +1,299 @@
+#
+# This file is part of BDC-DB.
+# Copyright (C) 2023 INPE.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/gpl-3.0.html>.
+#
+
+"""Dump and restore the tables managed by BDC-DB using ``COPY``.
+
+A dump is an (uncompressed) tar archive with one compressed ``COPY`` text file per table
+and a ``manifest.json`` which describes the tables in foreign key order.
+
+.. versionadded:: 0.9.0
+"""
+
+import datetime
+import gzip
+import json
+import re
+import tarfile
+import tempfile
+import time
+import typing as t
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+from sqlalchemy import Table, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import CreateIndex, DropIndex, sort_tables
+
+from .partitioning import get_partition_spec
+from .utils import reset_sequences
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+MANIFEST_NAME = 'manifest.json'
+"""The name of manifest file inside the dump archive."""
+
+COMPRESSIONS = ('gzip', 'zstd', 'none')
+"""The supported compression of table files."""
+
+COPY_FORMATS = ('text', 'binary')
+"""The supported ``COPY`` formats. The binary format is faster, but it requires the same column types on restore."""
+
+_SUFFIXES = dict(gzip='.copy.gz', zstd='.copy.zst', none='.copy')
+_SNAPSHOT_ID = re.compile(r'^[0-9A-Fa-f-]+$')
+_CHUNK_SIZE = 1024 * 1024
+
+
+@dataclass
+class TableDump:
+    """Represent a table file of a dump."""
+
+    table: str
+    file: str
+    columns: t.List[str]
+    rows: int = 0
+
+
+@dataclass
+class DumpResult:
+    """Represent the summary of :func:`~bdc_db.dump.dump_tables` or :func:`~bdc_db.dump.restore_tables`."""
+
+    path: str
+    compression: str
+    tables: t.List[TableDump] = field(default_factory=list)
+    elapsed: float = 0.0
+
+    @property
+    def rows(self) -> int:
+        """Retrieve the total number of rows."""
+        return sum(entry.rows for entry in self.tables)
+
+
+def _compressed_writer(path: Path, compression: str):
+    if compression == 'gzip':
+        return gzip.open(path, 'wb', compresslevel=3)
+    if compression == 'zstd':
+        return _zstd().ZstdCompressor().stream_writer(open(path, 'wb'))
+    return open(path, 'wb')
+
+
+def _compressed_reader(fileobj, compression: str):
+    if compression == 'gzip':
+        return gzip.GzipFile(fileobj=fileobj, mode='rb')
+    if compression == 'zstd':
+        return _zstd().ZstdDecompressor().stream_reader(fileobj)
+    return fileobj
+
+
+def _zstd():
+    if zstandard is None:  # pragma: no cover
+        raise ImportError('The zstd compression requires "zstandard". Install it with "pip install bdc-db[zstd]"')
+    return zstandard
+
+
+def _copy_columns(table: Table) -> t.List[str]:
+    """List the columns written by ``COPY``, except the generated ones."""
+    return [column.name for column in table.columns if column.computed is None]
+
+
+def _copy_out(dbapi_connection, statement: str, fileobj) -> int:
+    """Run ``COPY ... TO STDOUT`` with psycopg2 or psycopg 3, returning the number of rows."""
+    cursor = dbapi_connection.cursor()
+    try:
+        if hasattr(cursor, 'copy_expert'):
+            cursor.copy_expert(statement, fileobj, size=_CHUNK_SIZE)
+        else:
+            with cursor.copy(statement) as copy:
+                for data in copy:
+                    fileobj.write(data)
+        return cursor.rowcount
+    finally:
+        cursor.close()
+
+
+def _copy_in(dbapi_connection, statement: str, fileobj):
+    """Run ``COPY ... FROM STDIN`` with psycopg2 or psycopg 3."""
+    cursor = dbapi_connection.cursor()
+    try:
+        if hasattr(cursor, 'copy_expert'):
+            cursor.copy_expert(statement, fileobj, size=_CHUNK_SIZE)
+        else:
+            with cursor.copy(statement) as copy:
+                while data := fileobj.read(_CHUNK_SIZE):
+                    copy.write(data)
+    finally:
+        cursor.close()
+
+
+def _dump_table(table: Table, engine: Engine, snapshot: str, directory: Path, compression: str,
+                copy_format: str) -> TableDump:
+    preparer = engine.dialect.identifier_preparer
+    columns = _copy_columns(table)
+    column_list = ', '.join(preparer.quote(name) for name in columns)
+    source = preparer.format_table(table)
+    if get_partition_spec(table) is not None:
+        # COPY TO does not support the partitioned tables directly
+        source = f'(SELECT {column_list} FROM {source})'
+    else:
+        source = f'{source} ({column_list})'
+
+    entry = TableDump(table=table.fullname, file=f'{table.fullname}{_SUFFIXES[compression]}', columns=columns)
+
+    with engine.connect().execution_options(isolation_level='REPEATABLE READ') as conn:
+        conn.execute(text(f"SET TRANSACTION SNAPSHOT '{snapshot}'"))
+
+        with _compressed_writer(directory / entry.file, compression) as output:
+            entry.rows = _copy_out(conn.connection.dbapi_connection,
+                                   f'COPY {source} TO STDOUT (FORMAT {copy_format})', output)
+
+        conn.rollback()
+
+    return entry
+
+
+def dump_tables(tables: t.Sequence[Table], path: t.Union[str, Path], engine: Engine,
+                compression: str = 'gzip', jobs: int = 4, copy_format: str = 'text') -> DumpResult:
+    """Dump the rows of tables into a tar archive using ``COPY ... TO STDOUT``.
+
+    The tables are dumped in parallel by ``jobs`` connections which share the same
+    exported snapshot, so the dump is consistent as a single transaction.
+
+    Args:
+        tables: The tables to dump, usually ``db.metadata.sorted_tables``.
+        path: The output archive path.
+        engine: The SQLAlchemy active database engine.
+        compression: The compression of each table file: ``gzip``, ``zstd`` or ``none``.
+        jobs: The number of parallel connections.
+        copy_format: The ``COPY`` format: ``text`` or ``binary``.
+    """
+    if compression not in COMPRESSIONS:
+        raise ValueError(f'Invalid compression "{compression}". Expected one of {COMPRESSIONS}')
+    if copy_format not in COPY_FORMATS:
+        raise ValueError(f'Invalid COPY format "{copy_format}". Expected one of {COPY_FORMATS}')
+
+    result = DumpResult(path=str(path), compression=compression)
+    start = time.perf_counter()
+
+    with tempfile.TemporaryDirectory() as directory, \
+            engine.connect().execution_options(isolation_level='REPEATABLE READ') as coordinator:
+        snapshot = coordinator.execute(text('SELECT pg_export_snapshot()')).scalar()
+        if not _SNAPSHOT_ID.match(snapshot):  # pragma: no cover
+            raise RuntimeError(f'Unexpected snapshot identifier "{snapshot}"')
+
+        with ThreadPoolExecutor(max_workers=max(jobs, 1)) as pool:
+            futures = [
+                pool.submit(_dump_table, table, engine, snapshot, Path(directory), compression, copy_format)
+                for table in tables
+            ]
+            result.tables = [future.result() for future in futures]
+
+        coordinator.rollback()
+
+        manifest = dict(
+            version=1,
+            created=datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            compression=compression,
+            format=copy_format,
+            tables=[asdict(entry) for entry in result.tables]
+        )
+        manifest_path = Path(directory) / MANIFEST_NAME
+        manifest_path.write_text(json.dumps(manifest, indent=2))
+
+        with tarfile.open(path, 'w') as archive:
+            archive.add(manifest_path, arcname=MANIFEST_NAME)
+            for entry in result.tables:
+                archive.add(Path(directory) / entry.file, arcname=entry.file)
+
+    result.elapsed = time.perf_counter() - start
+
+    return result
+
+
+def read_manifest(path: t.Union[str, Path]) -> t.Dict[str, t.Any]:
+    """Read the manifest of a dump archive."""
+    with tarfile.open(path, 'r') as archive:
+        return json.load(archive.extractfile(MANIFEST_NAME))
+
+
+def restore_tables(path: t.Union[str, Path], tables: t.Mapping[str, Table], engine: Engine,
+                   clean: bool = False, cascade: bool = False) -> DumpResult:
+    """Restore a dump archive using ``COPY ... FROM STDIN`` in a single transaction.
+
+    The tables are loaded in foreign key order. The secondary indexes declared in
+    the table models are dropped before loading the rows and created again after
+    them, except the unique ones which check the loaded rows like the constraints.
+    The serial and identity sequences are moved past the restored values.
+
+    Args:
+        path: The dump archive path.
+        tables: Map of table name (``schema.table``) and the SQLAlchemy table, usually ``db.metadata.tables``.
+        engine: The SQLAlchemy active database engine.
+        clean: Remove the rows of the dumped tables before restore.
+        cascade: When cleaning, also remove the rows of the tables which reference the dumped tables
+            by foreign keys. Without it, these references make the restore fail.
+    """
+    start = time.perf_counter()
+    manifest = read_manifest(path)
+    entries = [TableDump(**entry) for entry in manifest['tables']]
+
+    copy_format = manifest.get('format', 'text')
+    if copy_format not in COPY_FORMATS:
+        raise ValueError(f'Invalid COPY format "{copy_format}" in manifest')
+
+    unknown = [entry.table for entry in entries if entry.table not in tables]
+    if unknown:
+        raise ValueError(f'The tables {", ".join(unknown)} are not declared in the models.')
+
+    # The manifest follows the order given to dump, which may not respect the foreign keys
+    order = {table: position for position, table in enumerate(sort_tables([tables[entry.table] for entry in entries]))}
+    entries.sort(key=lambda entry: order[tables[entry.table]])
+
+    result = DumpResult(path=str(path), compression=manifest['compression'], tables=entries)
+    preparer = engine.dialect.identifier_preparer
+
+    with engine.begin() as conn, tarfile.open(path, 'r') as archive:
+        if clean and entries:
+            # A single statement, since TRUNCATE checks the foreign keys between the given tables together
+            names = ', '.join(preparer.format_table(tables[entry.table]) for entry in entries)
+            conn.execute(text(f'TRUNCATE {names}{" CASCADE" if cascade else ""}'))
+
+        for entry in entries:
+            table = tables[entry.table]
+            # The unique indexes are kept, so the duplicated rows fail on load instead of on rebuild
+            indexes = sorted((index for index in table.indexes if not index.unique), key=lambda i: str(i.name))
+            for index in indexes:
+                conn.execute(DropIndex(index, if_exists=True))
+
+            column_list = ', '.join(preparer.quote(name) for name in entry.columns)
+            statement = f'COPY {preparer.format_table(table)} ({column_list}) FROM STDIN ' \
+                        f'(FORMAT {copy_format})'
+
+            with _compressed_reader(archive.extractfile(entry.file), result.compression) as source:
+                _copy_in(conn.connection.dbapi_connection, statement, source)
+
+            for index in indexes:
+                conn.execute(CreateIndex(index, if_not_exists=True))
+
+            reset_sequences(table, conn)
+
+    result.elapsed = time.perf_counter() - start
+
+    return result
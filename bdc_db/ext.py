@@ -21,7 +21,7 @@
 import importlib.resources
 from importlib.metadata import entry_points
 from pathlib import Path
-from typing import Dict, Iterable, List
+from typing import Dict, Iterable, List, Optional
 
 from flask import current_app
 from flask_alembic import Alembic
@@ -29,7 +29,15 @@ from invenio_jsonschemas import InvenioJSONSchemas
 from sqlalchemy.orm import configure_mappers
 
 from . import config as _config
+from . import drivers as _drivers
 from .db import db as _db
+from .ingest import BulkIngestSession
+from .partitioning import partitioned_tables
+from .querystats import QueryTracker
+from .schemas import SchemaRegistry, set_default_registry
+from .slowlog import SlowQueryLog
+from .slowlog import create_blueprint as create_slowlog_blueprint
+from .utils import execute
 
 
 def alembic_include_object(object, name, type_, reflected, compare_to):  # pragma: no cover
@@ -51,9 +59,35 @@ def alembic_include_object(object, name, type_, reflected, compare_to):  # pragm
     """
     exclude_tables = current_app.config.get('ALEMBIC_EXCLUDE_TABLES', [])
 
+    if type_ == 'table' and reflected and compare_to is None and _is_partition(object):
+        return False
+
     return not ((type_ == 'table') and (name in exclude_tables))
 
 
+def _is_partition(table) -> bool:
+    """Check if a reflected table is a partition of a partitioned table declared in ``db.metadata``."""
+    parents = {(parent.schema, parent.name) for parent in partitioned_tables(_db.metadata)}
+    if not parents:
+        return False
+
+    row = execute(
+        "SELECT pn.nspname AS schema, p.relname AS name, pn.nspname = current_schema() AS is_default"
+        "  FROM pg_class c"
+        "  JOIN pg_namespace n ON n.oid = c.relnamespace"
+        "  JOIN pg_inherits i ON i.inhrelid = c.oid"
+        "  JOIN pg_class p ON p.oid = i.inhparent"
+        "  JOIN pg_namespace pn ON pn.oid = p.relnamespace "
+        " WHERE c.relispartition AND c.relname = :name AND n.nspname = coalesce(:schema, current_schema())",
+        _db.engine,
+        dict(name=table.name, schema=table.schema)
+    ).first()
+    if row is None:
+        return False
+
+    return (row.schema, row.name) in parents or (row.is_default and (None, row.name) in parents)
+
+
 class BrazilDataCubeDB:
     """Database management extension for Brazil Data Cube applications and services.
 
@@ -65,6 +99,9 @@ class BrazilDataCubeDB:
     scripts: Dict[str, Dict[str, str]] = None
     namespaces: List[str] = []
     schemas: InvenioJSONSchemas = None
+    schema_registry: SchemaRegistry = None
+    slow_queries: Optional[SlowQueryLog] = None
+    query_tracker: Optional[QueryTracker] = None
 
     def __init__(self, app=None, **kwargs):
         """Initialize the database management extension.
@@ -151,6 +188,12 @@ class BrazilDataCubeDB:
 
         self.schemas = InvenioJSONSchemas(app, entry_point_group=kwargs.get('entry_point_jsonschemas', 'bdc.schemas'))
 
+        # Share the loaded schemas with the validation outside application context (scripts and workers)
+        self.schema_registry = SchemaRegistry(self.schemas.schemas, host=app.config['JSONSCHEMAS_HOST'],
+                                              endpoint=app.config['JSONSCHEMAS_ENDPOINT'],
+                                              url_scheme=app.config['JSONSCHEMAS_URL_SCHEME'])
+        set_default_registry(self.schema_registry)
+
         # Add BDC-DB extension to Flask extension list
         app.extensions['bdc-db'] = self
 
@@ -177,6 +220,29 @@ class BrazilDataCubeDB:
 
         app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options or _config.SQLALCHEMY_ENGINE_OPTIONS)
 
+        app.config.setdefault('BDC_DB_DEFER_LARGE_COLUMNS', _config.BDC_DB_DEFER_LARGE_COLUMNS)
+
+        app.config.setdefault('BDC_DB_BULK_LOAD_JOURNAL_DIR', _config.BDC_DB_BULK_LOAD_JOURNAL_DIR)
+
+        app.config.setdefault('BDC_DB_DRIVER', _config.BDC_DB_DRIVER)
+
+        app.config.setdefault('BDC_DB_PREPARE_THRESHOLD', _config.BDC_DB_PREPARE_THRESHOLD)
+
+        for key in ('THRESHOLD', 'EXPLAIN', 'BUFFER', 'DIR', 'ENDPOINT'):
+            app.config.setdefault(f'BDC_DB_SLOW_QUERY_{key}', getattr(_config, f'BDC_DB_SLOW_QUERY_{key}'))
+
+        for key in ('BDC_DB_QUERY_TRACKING', 'BDC_DB_NPLUSONE_THRESHOLD', 'BDC_DB_NPLUSONE_RAISE',
+                    'BDC_DB_QUERY_BUDGET', 'BDC_DB_QUERY_TIME_BUDGET'):
+            app.config.setdefault(key, getattr(_config, key))
+
+        # Choose the PostgreSQL driver and its connection arguments
+        database_uri = _drivers.resolve_database_uri(app.config['SQLALCHEMY_DATABASE_URI'],
+                                                     app.config['BDC_DB_DRIVER'])
+        app.config['SQLALCHEMY_DATABASE_URI'] = database_uri
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = _drivers.engine_options(database_uri,
+                                                                          app.config['SQLALCHEMY_ENGINE_OPTIONS'],
+                                                                          app.config['BDC_DB_PREPARE_THRESHOLD'])
+
         # Initialize Flask-SQLAlchemy extension.
         database = kwargs.get('db', _db)
         database.init_app(app)
@@ -190,6 +256,57 @@ class BrazilDataCubeDB:
         # Initialize the inter-mapper relationships of all loaded mappers.
         configure_mappers()
 
+        if app.config['BDC_DB_SLOW_QUERY_THRESHOLD'] is not None:
+            self.init_slow_queries(app, database, guard=kwargs.get('slow_query_guard'))
+
+        if app.config['BDC_DB_QUERY_TRACKING']:
+            self.init_query_tracker(app, database)
+
+    def init_slow_queries(self, app, database=_db, guard=None):
+        """Record the slow statements of the application engine.
+
+        .. versionadded:: 0.9.0
+
+        Args:
+            app: Flask application
+            database: The Flask-SQLAlchemy instance.
+            guard: The ``before_request`` function of the endpoint ``BDC_DB_SLOW_QUERY_ENDPOINT``,
+                which denies the unauthorized requests. Required when the endpoint is set.
+        """
+        if app.config['BDC_DB_SLOW_QUERY_ENDPOINT'] and guard is None:
+            raise RuntimeError('The endpoint BDC_DB_SLOW_QUERY_ENDPOINT exposes the SQL statements and it requires '
+                               'a guard, like BrazilDataCubeDB(app, slow_query_guard=admin_only).')
+
+        self.slow_queries = SlowQueryLog(threshold=float(app.config['BDC_DB_SLOW_QUERY_THRESHOLD']),
+                                         explain=app.config['BDC_DB_SLOW_QUERY_EXPLAIN'],
+                                         maxsize=app.config['BDC_DB_SLOW_QUERY_BUFFER'],
+                                         directory=app.config['BDC_DB_SLOW_QUERY_DIR'])
+        with app.app_context():
+            self.slow_queries.install(database.engine)
+
+        if app.config['BDC_DB_SLOW_QUERY_ENDPOINT']:
+            app.register_blueprint(create_slowlog_blueprint(self.slow_queries, guard),
+                                   url_prefix=app.config['BDC_DB_SLOW_QUERY_ENDPOINT'])
+
+    def init_query_tracker(self, app, database=_db):
+        """Detect N+1 queries and enforce the query budget on the requests of the application.
+
+        .. versionadded:: 0.9.0
+
+        Args:
+            app: Flask application
+            database: The Flask-SQLAlchemy instance.
+        """
+        max_queries = app.config['BDC_DB_QUERY_BUDGET']
+        max_duration = app.config['BDC_DB_QUERY_TIME_BUDGET']
+
+        self.query_tracker = QueryTracker(threshold=int(app.config['BDC_DB_NPLUSONE_THRESHOLD']),
+                                          raise_on_repeat=app.config['BDC_DB_NPLUSONE_RAISE'],
+                                          max_queries=int(max_queries) if max_queries is not None else None,
+                                          max_duration=float(max_duration) if max_duration is not None else None)
+        with app.app_context():
+            self.query_tracker.init_app(app, database.engine)
+
     def load_namespaces(self, entry_point: str = 'bdc_db.namespaces'):
         """Load application namespaces dynamically using entry points.
 
@@ -271,4 +388,16 @@ class BrazilDataCubeDB:
         """Register trigger command to BDC-DB."""
         self.scripts.setdefault(module_name, dict())
 
-        self.scripts[module_name][trigger_name] = path
\ No newline at end of file
+        self.scripts[module_name][trigger_name] = path
+
+    @staticmethod
+    def bulk_session(session=None, **kwargs) -> BulkIngestSession:
+        """Create a memory-bounded session to ingest a large number of objects.
+
+        .. versionadded:: 0.9.0
+
+        Args:
+            session: The SQLAlchemy session. Defaults to ``db.session``.
+            kwargs: Extra arguments to :class:`~bdc_db.ingest.BulkIngestSession`.
+        """
+        return BulkIngestSession(session or _db.session, **kwargs)
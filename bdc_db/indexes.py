@@ -0,0 +1,282 @@
+#
+# This file is part of BDC-DB.
+# Copyright (C) 2023 INPE.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/gpl-3.0.html>.
+#
+
+"""Manage the indexes declared in SQLAlchemy metadata without blocking the writes.
+
+.. versionadded:: 0.9.0
+"""
+
+import typing as t
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass
+
+from sqlalchemy import Index, MetaData, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import CreateIndex
+
+from .partitioning import get_partition_spec, list_partitions
+from .utils import execute
+
+
+@dataclass
+class IndexResult:
+    """Represent an index found in the database catalog."""
+
+    schema: str
+    table_name: str
+    index_name: str
+    valid: bool
+    definition: str
+
+
+@dataclass
+class IndexProgress:
+    """Represent a row of ``pg_stat_progress_create_index``."""
+
+    pid: int
+    table_name: str
+    index_name: t.Optional[str]
+    command: str
+    phase: str
+    blocks_total: int
+    blocks_done: int
+    tuples_total: int
+    tuples_done: int
+
+    @property
+    def percent(self) -> float:
+        """Estimate the progress of the current phase in percent."""
+        if self.blocks_total:
+            return 100.0 * self.blocks_done / self.blocks_total
+        if self.tuples_total:
+            return 100.0 * self.tuples_done / self.tuples_total
+        return 0.0
+
+
+def list_indexes(executor) -> t.List[IndexResult]:
+    """List the indexes of user tables available in database.
+
+    Args:
+        executor: The SQLAlchemy engine or connection.
+    """
+    query_result = execute(
+        "SELECT n.nspname AS schema,"
+        "       t.relname AS table_name,"
+        "       c.relname AS index_name,"
+        "       i.indisvalid AS valid,"
+        "       pg_get_indexdef(i.indexrelid) AS definition"
+        "  FROM pg_index i"
+        "  JOIN pg_class c ON c.oid = i.indexrelid"
+        "  JOIN pg_class t ON t.oid = i.indrelid"
+        "  JOIN pg_namespace n ON n.oid = c.relnamespace "
+        " WHERE n.nspname NOT IN ('pg_catalog', 'information_schema') "
+        "   AND n.nspname NOT LIKE 'pg_toast%' "
+        "ORDER BY schema, table_name, index_name",
+        executor
+    )
+
+    return [
+        IndexResult(row.schema, row.table_name, row.index_name, row.valid, row.definition)
+        for row in query_result
+    ]
+
+
+def _index_schema(index: Index, default_schema: str) -> str:
+    return index.table.schema or default_schema
+
+
+def _existing_tables(executor) -> t.List[t.Any]:
+    return list(execute(
+        "SELECT table_schema AS schema, table_name AS name FROM information_schema.tables "
+        " WHERE table_schema NOT IN ('pg_catalog', 'information_schema')",
+        executor
+    ))
+
+
+def missing_indexes(metadata: MetaData, executor) -> t.List[Index]:
+    """Compare the indexes declared in metadata with the database catalog.
+
+    The index names follow the :data:`bdc_db.db.NAMING_CONVENTION`.
+
+    Args:
+        metadata: The SQLAlchemy metadata (usually ``db.metadata``).
+        executor: The SQLAlchemy engine or connection.
+
+    Returns:
+        The declared indexes which do not exist in database.
+    """
+    default_schema = execute('SELECT current_schema()', executor).scalar()
+    existing = {(index.schema, index.index_name) for index in list_indexes(executor)}
+    tables = {(table.schema or default_schema, table.name) for table in _existing_tables(executor)}
+
+    missing = []
+    for table in metadata.sorted_tables:
+        if (table.schema or default_schema, table.name) not in tables:
+            continue
+        for index in sorted(table.indexes, key=lambda i: str(i.name)):
+            if (_index_schema(index, default_schema), str(index.name)) not in existing:
+                missing.append(index)
+
+    return missing
+
+
+def invalid_indexes(executor) -> t.List[IndexResult]:
+    """List the invalid indexes, usually left by a failed ``CREATE INDEX CONCURRENTLY``.
+
+    Args:
+        executor: The SQLAlchemy engine or connection.
+    """
+    return [index for index in list_indexes(executor) if not index.valid]
+
+
+def compile_create_index(index: Index, dialect, concurrently: bool = True) -> str:
+    """Compile the ``CREATE INDEX [CONCURRENTLY] IF NOT EXISTS`` statement of an index."""
+    options = index.dialect_options['postgresql']
+    previous = options['concurrently']
+    options['concurrently'] = concurrently
+    try:
+        return str(CreateIndex(index, if_not_exists=True).compile(dialect=dialect))
+    finally:
+        options['concurrently'] = previous
+
+
+def create_index_concurrently(index: Index, engine: Engine):
+    """Build an index without locking the table against writes.
+
+    PostgreSQL does not support ``CREATE INDEX CONCURRENTLY`` on partitioned tables. In this case,
+    the index is created on the parent table only (invalid), each partition index is built
+    concurrently and then attached to the parent index, which becomes valid after the last one.
+
+    Args:
+        index: The SQLAlchemy index declaration.
+        engine: The SQLAlchemy active database engine.
+    """
+    if get_partition_spec(index.table) is not None:
+        return _create_partitioned_index(index, engine)
+
+    statement = compile_create_index(index, engine.dialect)
+
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        conn.execute(text(statement))
+
+
+def _create_partitioned_index(index: Index, engine: Engine):
+    preparer = engine.dialect.identifier_preparer
+    table = index.table
+    schema = f'{preparer.quote_schema(table.schema)}.' if table.schema else ''
+    parent_table = preparer.format_table(table)
+    parent_index = f'{schema}{preparer.quote(str(index.name))}'
+
+    statement = compile_create_index(index, engine.dialect, concurrently=False)
+
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        conn.execute(text(statement.replace(f' ON {parent_table} ', f' ON ONLY {parent_table} ', 1)))
+
+        for partition in list_partitions(table, conn):
+            name = f'{partition.name}_{index.name}'[:63]
+            child_table = f'{schema}{preparer.quote(partition.name)}'
+            child = compile_create_index(index, engine.dialect)
+            child = child.replace(f' ON {parent_table} ', f' ON {child_table} ', 1)
+            child = child.replace(f' {preparer.quote(str(index.name))} ', f' {preparer.quote(name)} ', 1)
+            conn.execute(text(child))
+            conn.execute(text(f'ALTER INDEX {parent_index} ATTACH PARTITION {schema}{preparer.quote(name)}'))
+
+
+def rebuild_index(schema: str, name: str, engine: Engine):
+    """Rebuild an index using ``REINDEX INDEX CONCURRENTLY`` (PostgreSQL 12+).
+
+    Args:
+        schema: The index schema.
+        name: The index name.
+        engine: The SQLAlchemy active database engine.
+    """
+    preparer = engine.dialect.identifier_preparer
+
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        conn.execute(text(f'REINDEX INDEX CONCURRENTLY {preparer.quote_schema(schema)}.{preparer.quote(name)}'))
+
+
+def index_progress(executor) -> t.List[IndexProgress]:
+    """Retrieve the progress of the index builds running on database.
+
+    Args:
+        executor: The SQLAlchemy engine or connection.
+    """
+    query_result = execute(
+        "SELECT p.pid,"
+        "       p.relid::regclass::text AS table_name,"
+        "       NULLIF(p.index_relid, 0)::regclass::text AS index_name,"
+        "       p.command,"
+        "       p.phase,"
+        "       p.blocks_total, p.blocks_done,"
+        "       p.tuples_total, p.tuples_done"
+        "  FROM pg_stat_progress_create_index p "
+        " WHERE p.datid = (SELECT oid FROM pg_database WHERE datname = current_database())",
+        executor
+    )
+
+    return [
+        IndexProgress(row.pid, row.table_name, row.index_name, row.command, row.phase,
+                      row.blocks_total, row.blocks_done, row.tuples_total, row.tuples_done)
+        for row in query_result
+    ]
+
+
+def build_indexes(indexes: t.Iterable[Index], engine: Engine, jobs: int = 2,
+                  on_progress: t.Optional[t.Callable[[t.List[IndexProgress]], None]] = None,
+                  interval: float = 1.0) -> t.Dict[str, t.Optional[Exception]]:
+    """Build several indexes concurrently.
+
+    The indexes of the same table are built sequentially, since PostgreSQL does not run two
+    ``CREATE INDEX CONCURRENTLY`` on one table at once. Different tables are built in parallel
+    by ``jobs`` connections.
+
+    Args:
+        indexes: The index declarations to build.
+        engine: The SQLAlchemy active database engine.
+        jobs: The number of parallel connections.
+        on_progress: Callback called every ``interval`` seconds with the current progress.
+        interval: Seconds between each progress report.
+
+    Returns:
+        Map of index name and the error raised while building it (``None`` on success).
+    """
+    per_table: t.Dict[t.Any, t.List[Index]] = dict()
+    for index in indexes:
+        per_table.setdefault(index.table, list()).append(index)
+
+    results: t.Dict[str, t.Optional[Exception]] = dict()
+
+    def _build(table_indexes: t.List[Index]):
+        for entry in table_indexes:
+            try:
+                create_index_concurrently(entry, engine)
+                results[str(entry.name)] = None
+            except Exception as e:
+                results[str(entry.name)] = e
+
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as pool:
+        pending = {pool.submit(_build, table_indexes) for table_indexes in per_table.values()}
+
+        while pending:
+            _, pending = wait(pending, timeout=interval)
+            if on_progress is not None and pending:
+                with engine.connect() as conn:
+                    on_progress(index_progress(conn))
+
+    return results
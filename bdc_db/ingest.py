@@ -0,0 +1,174 @@
+#
+# This file is part of BDC-DB.
+# Copyright (C) 2023 INPE.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/gpl-3.0.html>.
+#
+
+"""Memory-bounded session mode for long ingestion jobs.
+
+.. versionadded:: 0.9.0
+"""
+
+import sys
+import time
+import typing as t
+from dataclasses import dataclass
+
+from sqlalchemy import inspect
+
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    resource = None
+
+
+def peak_rss() -> int:
+    """Retrieve the peak resident set size of current process in bytes (``0`` when not supported)."""
+    if resource is None:  # pragma: no cover
+        return 0
+
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes while macOS reports bytes
+    return usage if sys.platform == 'darwin' else usage * 1024
+
+
+def estimate_size(value: t.Any) -> int:
+    """Estimate the memory size in bytes of a value, including the nested dicts and lists."""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(estimate_size(key) + estimate_size(item) for key, item in value.items())
+    elif isinstance(value, (list, tuple, set)):
+        size += sum(estimate_size(item) for item in value)
+    return size
+
+
+@dataclass
+class IngestStats:
+    """Represent the progress of a :class:`~bdc_db.ingest.BulkIngestSession`."""
+
+    objects: int = 0
+    batches: int = 0
+    commits: int = 0
+    elapsed: float = 0.0
+    peak_rss: int = 0
+
+    @property
+    def objects_per_second(self) -> float:
+        """Retrieve the ingestion throughput."""
+        return self.objects / self.elapsed if self.elapsed else 0.0
+
+
+class BulkIngestSession:
+    """Wrap a SQLAlchemy session to ingest objects in constant memory.
+
+    The pending objects are flushed every ``flush_every`` objects or ``max_bytes`` estimated bytes
+    and then expunged from the session along with the objects flushed by cascade (like children
+    of relationships), so the identity map does not grow during the job. The objects loaded
+    before the bulk session started are kept.
+    The :class:`~bdc_db.sqltypes.JSONB` values are validated on flush as usual.
+
+    Examples:
+        .. code-block:: python
+
+            from flask import current_app
+
+            ext = current_app.extensions['bdc-db']
+
+            with ext.bulk_session(flush_every=5000, commit_every=10, on_stats=print) as bulk:
+                for entry in entries:
+                    bulk.add(Item(**entry))
+
+    Args:
+        session: The SQLAlchemy session.
+        flush_every: Flush after this number of objects.
+        max_bytes: Flush once the estimated size of the pending objects reaches this value.
+        commit_every: Commit every this number of batches. Defaults to commit only at the end.
+        on_stats: Callback called with :class:`~bdc_db.ingest.IngestStats` after each batch.
+    """
+
+    def __init__(self, session, flush_every: int = 1000, max_bytes: int = 64 * 1024 * 1024,
+                 commit_every: t.Optional[int] = None,
+                 on_stats: t.Optional[t.Callable[[IngestStats], None]] = None):
+        """Build a new bulk ingest session."""
+        self.session = session
+        self.flush_every = flush_every
+        self.max_bytes = max_bytes
+        self.commit_every = commit_every
+        self.on_stats = on_stats
+        self.stats = IngestStats()
+        self._pending: t.List[t.Any] = []
+        self._pending_bytes = 0
+        self._start = time.perf_counter()
+        self._kept = set(session.identity_map.keys())
+
+    def add(self, instance: t.Any):
+        """Add an object to the session, flushing the batch when full."""
+        self.session.add(instance)
+        self._pending.append(instance)
+        self._pending_bytes += estimate_size(inspect(instance).dict)
+
+        if len(self._pending) >= self.flush_every or self._pending_bytes >= self.max_bytes:
+            self.flush()
+
+    def add_all(self, instances: t.Iterable[t.Any]):
+        """Add several objects to the session."""
+        for instance in instances:
+            self.add(instance)
+
+    def flush(self):
+        """Flush and expunge the pending objects, committing when required."""
+        if not self._pending:
+            return
+
+        self.session.flush()
+
+        for key, instance in list(self.session.identity_map.items()):
+            if key not in self._kept:
+                self.session.expunge(instance)
+
+        self.stats.objects += len(self._pending)
+        self.stats.batches += 1
+        self._pending = []
+        self._pending_bytes = 0
+
+        if self.commit_every and self.stats.batches % self.commit_every == 0:
+            self.commit()
+
+        self._report()
+
+    def commit(self):
+        """Commit the current transaction."""
+        self.session.commit()
+        self.stats.commits += 1
+
+    def _report(self):
+        self.stats.elapsed = time.perf_counter() - self._start
+        self.stats.peak_rss = peak_rss()
+
+        if self.on_stats is not None:
+            self.on_stats(self.stats)
+
+    def __enter__(self) -> 'BulkIngestSession':
+        """Start the bulk ingest."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Flush and commit the remaining objects or rollback on errors."""
+        if exc_type is not None:
+            self.session.rollback()
+            return
+
+        self.flush()
+        self.commit()
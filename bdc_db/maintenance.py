@@ -0,0 +1,186 @@
+#
+# This file is part of BDC-DB.
+# Copyright (C) 2023 INPE.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/gpl-3.0.html>.
+#
+
+"""Orchestrate ``ANALYZE`` and ``VACUUM`` over the tables of the models.
+
+.. versionadded:: 0.9.0
+"""
+
+import datetime
+import time
+import typing as t
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from sqlalchemy import Table
+from sqlalchemy.engine import Engine
+
+from .utils import execute
+
+OPERATIONS = ('analyze', 'vacuum')
+"""The supported maintenance operations. ``vacuum`` runs ``VACUUM (ANALYZE)``."""
+
+
+@dataclass
+class TableStats:
+    """Represent the activity of a table from ``pg_stat_user_tables`` (summed over its partitions)."""
+
+    schema: str
+    table_name: str
+    live_tuples: int = 0
+    dead_tuples: int = 0
+    modifications: int = 0
+    last_vacuum: t.Optional[datetime.datetime] = None
+    last_analyze: t.Optional[datetime.datetime] = None
+
+    @property
+    def priority(self) -> int:
+        """Order the tables by the work pending on them."""
+        return self.dead_tuples + self.modifications
+
+    @property
+    def name(self) -> str:
+        """Retrieve the qualified table name."""
+        return f'{self.schema}.{self.table_name}'
+
+
+@dataclass
+class MaintenanceResult:
+    """Represent the maintenance of a table."""
+
+    before: TableStats
+    operation: str
+    after: t.Optional[TableStats] = None
+    elapsed: float = 0.0
+    error: t.Optional[str] = None
+    skipped: bool = False
+
+
+def table_stats(tables: t.Sequence[Table], executor) -> t.List[TableStats]:
+    """Retrieve the activity statistics of tables.
+
+    The statistics of partitioned tables are summed over their partitions.
+
+    Args:
+        tables: The SQLAlchemy tables.
+        executor: The SQLAlchemy engine or connection.
+    """
+    default_schema = execute('SELECT current_schema()', executor).scalar()
+    names = [f'{table.schema or default_schema}.{table.name}' for table in tables]
+    if not names:
+        return []
+
+    query_result = execute(
+        "SELECT n.nspname AS schema,"
+        "       c.relname AS table_name,"
+        "       coalesce(sum(s.n_live_tup), 0)::bigint AS live_tuples,"
+        "       coalesce(sum(s.n_dead_tup), 0)::bigint AS dead_tuples,"
+        "       coalesce(sum(s.n_mod_since_analyze), 0)::bigint AS modifications,"
+        "       max(greatest(s.last_vacuum, s.last_autovacuum)) AS last_vacuum,"
+        "       max(greatest(s.last_analyze, s.last_autoanalyze)) AS last_analyze"
+        "  FROM pg_class c"
+        "  JOIN pg_namespace n ON n.oid = c.relnamespace"
+        "  CROSS JOIN LATERAL (SELECT c.oid AS relid UNION SELECT relid FROM pg_partition_tree(c.oid)) p"
+        "  LEFT JOIN pg_stat_user_tables s ON s.relid = p.relid "
+        " WHERE c.relkind IN ('r', 'p') AND n.nspname || '.' || c.relname = ANY(:names) "
+        "GROUP BY n.nspname, c.relname",
+        executor,
+        dict(names=names)
+    )
+
+    return [
+        TableStats(row.schema, row.table_name, row.live_tuples, row.dead_tuples, row.modifications,
+                   row.last_vacuum, row.last_analyze)
+        for row in query_result
+    ]
+
+
+def maintain_tables(tables: t.Sequence[Table], engine: Engine, operation: str = 'analyze', jobs: int = 2,
+                    budget: t.Optional[float] = None, only_changed: bool = True,
+                    on_result: t.Optional[t.Callable[[MaintenanceResult], None]] = None) -> t.List[MaintenanceResult]:
+    """Run ``ANALYZE`` or ``VACUUM (ANALYZE)`` on tables with parallel connections.
+
+    The tables with more dead tuples and modifications since the last analyze run first.
+    With ``budget``, no table starts after the time is over and the running statements are
+    limited by ``statement_timeout`` to the remaining time.
+
+    Examples:
+        .. code-block:: python
+
+            from bdc_db.db import db
+            from bdc_db.maintenance import maintain_tables
+
+            for result in maintain_tables(db.metadata.sorted_tables, db.engine, 'vacuum', jobs=4, budget=600):
+                print(result.before.name, result.before.dead_tuples, result.after.dead_tuples)
+
+    Args:
+        tables: The SQLAlchemy tables.
+        engine: The SQLAlchemy active database engine.
+        operation: ``analyze`` or ``vacuum``.
+        jobs: The number of parallel connections.
+        budget: The time budget in seconds.
+        only_changed: Skip the tables without dead tuples and modifications which were already analyzed.
+        on_result: Callback called with the result of each table once finished.
+
+    Returns:
+        The result of each table, in priority order.
+    """
+    if operation not in OPERATIONS:
+        raise ValueError(f'Invalid operation "{operation}". Expected one of {OPERATIONS}')
+
+    with engine.connect() as conn:
+        stats = table_stats(tables, conn)
+
+    stats = [
+        entry for entry in sorted(stats, key=lambda entry: entry.priority, reverse=True)
+        if not only_changed or entry.priority > 0 or entry.last_analyze is None
+    ]
+    deadline = time.monotonic() + budget if budget is not None else None
+    preparer = engine.dialect.identifier_preparer
+    command = 'ANALYZE' if operation == 'analyze' else 'VACUUM (ANALYZE)'
+
+    def _maintain(entry: TableStats) -> MaintenanceResult:
+        result = MaintenanceResult(entry, operation)
+        remaining = deadline - time.monotonic() if deadline is not None else None
+        if remaining is not None and remaining <= 0:
+            result.skipped = True
+        else:
+            start = time.perf_counter()
+            try:
+                with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+                    if remaining is not None:
+                        execute(f'SET statement_timeout = {int(remaining * 1000)}', conn)
+                    execute(f'{command} {preparer.quote_schema(entry.schema)}.{preparer.quote(entry.table_name)}',
+                            conn)
+            except Exception as e:
+                result.error = str(e)
+            result.elapsed = time.perf_counter() - start
+
+        if on_result is not None:
+            on_result(result)
+        return result
+
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as pool:
+        results = list(pool.map(_maintain, stats))
+
+    with engine.connect() as conn:
+        after = {entry.name: entry for entry in table_stats(tables, conn)}
+    for result in results:
+        result.after = after.get(result.before.name)
+
+    return results
@@ -18,9 +18,185 @@
 
 """Define the models associated with BDC-DB."""
 
-from sqlalchemy import Column, Integer, String
+import threading
+import typing as t
+import weakref
 
+from flask import current_app, has_app_context
+from sqlalchemy import Column, Integer, Select, String, event, inspect, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import (Load, Session, deferred, object_session, undefer,
+                            undefer_group)
+
+from .changefeed import notify_changes
 from .db import db
+from .partitioning import partition_table
+from .sqltypes import JSONB
+
+try:
+    import pyproj
+except ImportError:  # pragma: no cover
+    pyproj = None
+
+DEFERRED_GROUP = 'bdc_large'
+"""Name of the deferred column group which holds the large columns (JSONB and text) of the models."""
+
+DEFERRED_INFO_KEY = 'bdc_deferred'
+"""Key used in ``Column.info`` to mark a large column to be deferred by default."""
+
+
+def is_large_column(column: Column) -> bool:
+    """Check if a column must be deferred by default.
+
+    The :class:`~bdc_db.sqltypes.JSONB` columns follow the ``deferred`` type argument and are
+    deferred when it is not set. Any other column is deferred when it has ``info={'bdc_deferred': True}``.
+
+    .. versionadded:: 0.9.0
+    """
+    if isinstance(column.type, JSONB) and column.type.deferred is not None:
+        return column.type.deferred
+    return isinstance(column.type, JSONB) or column.info.get(DEFERRED_INFO_KEY, False)
+
+
+def defer_large_columns(model: t.Any):
+    """Declare the large columns of a model class as deferred, before the class is mapped.
+
+    It is called for each subclass of ``db.Model`` and only covers the columns declared as
+    class attributes. The columns are loaded with the rows when ``BDC_DB_DEFER_LARGE_COLUMNS``
+    is disabled in the current application, except the ones with ``JSONB(..., deferred=True)``.
+
+    .. versionadded:: 0.9.0
+
+    Args:
+        model: The model class being declared.
+    """
+    for key, value in list(vars(model).items()):
+        if not isinstance(value, Column) or value.primary_key or not is_large_column(value):
+            continue
+
+        setattr(model, key, deferred(value, group=DEFERRED_GROUP))
+
+
+def undefer_large(entity: t.Optional[t.Any] = None):
+    """Build a loader option which loads the large columns along with the rows.
+
+    Use it in bulk paths that read the large columns of every row, avoiding one extra
+    query per row on first access.
+
+    .. versionadded:: 0.9.0
+
+    Examples:
+        .. code-block:: python
+
+            from bdc_db.models import undefer_large
+
+            items = db.session.query(Item).options(undefer_large()).all()
+
+    Args:
+        entity: Restrict the option to this model. Defaults to all the models in query.
+    """
+    if entity is not None:
+        return Load(entity).undefer_group(DEFERRED_GROUP)
+    return undefer_group(DEFERRED_GROUP)
+
+
+def _follows_config(column: Column) -> bool:
+    return not isinstance(column.type, JSONB) or column.type.deferred is None
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _load_large_columns(orm_context):
+    """Load the large columns with the rows when ``BDC_DB_DEFER_LARGE_COLUMNS`` is disabled in the current app."""
+    if not orm_context.is_select or not isinstance(orm_context.statement, Select) or not has_app_context():
+        return
+    if current_app.config.get('BDC_DB_DEFER_LARGE_COLUMNS', True):
+        return
+
+    options = []
+    for description in orm_context.statement.column_descriptions:
+        entity = description['entity']
+        # Only the full entities load their deferred columns
+        if entity is None or description['expr'] is not entity:
+            continue
+        for prop in inspect(entity).mapper.column_attrs:
+            if prop.deferred and prop.group == DEFERRED_GROUP and _follows_config(prop.columns[0]):
+                options.append(undefer(getattr(entity, prop.key)))
+
+    if options:
+        orm_context.statement = orm_context.statement.options(*options)
+
+
+class PartitionedMixin:
+    """Mixin to declare a model stored in a PostgreSQL partitioned table.
+
+    Set ``__partition__`` with a :class:`~bdc_db.partitioning.RangePartition` or
+    :class:`~bdc_db.partitioning.ListPartition`. The command ``create-schema`` creates
+    the partitioned parent table and the initial partitions. Use the command group
+    ``db partitions`` to manage the partitions later.
+
+    .. versionadded:: 0.9.0
+
+    Note:
+        PostgreSQL requires the partition key column to be part of the primary key.
+
+    Examples:
+        .. code-block:: python
+
+            from bdc_db.db import db
+            from bdc_db.models import PartitionedMixin
+            from bdc_db.partitioning import RangePartition
+
+
+            class Item(PartitionedMixin, db.Model):
+                __partition__ = RangePartition('start_date', interval='month', premake=3)
+
+                id = db.Column(db.Integer, primary_key=True)
+                start_date = db.Column(db.Date, primary_key=True)
+    """
+
+    __partition__ = None
+
+
+@event.listens_for(PartitionedMixin, 'instrument_class', propagate=True)
+def _prepare_partitioned_table(mapper, class_):
+    """Set the partition declaration of a model into its table."""
+    spec = getattr(class_, '__partition__', None)
+    if spec is not None and mapper.local_table is not None and mapper.inherits is None:
+        partition_table(mapper.local_table, spec)
+
+
+class ChangeFeedMixin:
+    """Mixin to declare a model which notifies its changes through ``LISTEN/NOTIFY``.
+
+    Set ``__change_feed__`` with a :class:`~bdc_db.changefeed.ChangeFeed`. The trigger is created
+    along with the table and by the command ``create-triggers``. Use
+    :class:`~bdc_db.changefeed.ChangeFeedConsumer` to consume the events.
+
+    .. versionadded:: 0.9.0
+
+    Examples:
+        .. code-block:: python
+
+            from bdc_db.changefeed import ChangeFeed
+            from bdc_db.db import db
+            from bdc_db.models import ChangeFeedMixin
+
+
+            class Item(ChangeFeedMixin, db.Model):
+                __change_feed__ = ChangeFeed(channel='item_changes', include_row=True)
+
+                id = db.Column(db.Integer, primary_key=True)
+    """
+
+    __change_feed__ = None
+
+
+@event.listens_for(ChangeFeedMixin, 'instrument_class', propagate=True)
+def _prepare_change_feed_table(mapper, class_):
+    """Set the change feed declaration of a model into its table."""
+    feed = getattr(class_, '__change_feed__', None)
+    if feed is not None and mapper.local_table is not None and mapper.inherits is None:
+        notify_changes(mapper.local_table, feed)
 
 
 class SpatialRefSys(db.Model):
@@ -37,5 +213,226 @@ class SpatialRefSys(db.Model):
     srid = Column(Integer, primary_key=True)
     auth_name = Column(String)
     auth_srid = Column(String)
-    srtext = Column(String)
-    proj4text = Column(String)
+    srtext = Column(String, info={DEFERRED_INFO_KEY: True})
+    proj4text = Column(String, info={DEFERRED_INFO_KEY: True})
+
+
+_SRID_CHANGES_KEY = 'bdc_srid_changes'
+
+_srid_registries: 'weakref.WeakSet[SRIDRegistry]' = weakref.WeakSet()
+
+_default_srid_registry: t.Optional['SRIDRegistry'] = None
+
+
+class SpatialReference(t.NamedTuple):
+    """Represent a row of ``spatial_ref_sys`` kept by :class:`~bdc_db.models.SRIDRegistry`.
+
+    .. versionadded:: 0.9.0
+    """
+
+    srid: int
+    auth_name: t.Optional[str]
+    auth_srid: t.Optional[str]
+    srtext: t.Optional[str]
+    proj4text: t.Optional[str]
+
+
+def _require_pyproj():
+    if pyproj is None:  # pragma: no cover
+        raise ImportError('The CRS lookup requires "pyproj". Install it with "pip install bdc-db[geo]"')
+
+
+class SRIDRegistry:
+    """Process-wide cache of the spatial references of ``spatial_ref_sys``.
+
+    The table is bulk loaded in a single query on first lookup (or only the ``srids`` in use,
+    the others being loaded on demand) and kept as tuples in memory. The parsed
+    ``pyproj.CRS`` objects are memoized per SRID.
+
+    The changes of :class:`~bdc_db.models.SpatialRefSys` committed by a session refresh
+    the affected SRIDs of every registry. The changes made by other processes may be
+    propagated with :class:`~bdc_db.cache.NotifyInvalidator` or with :meth:`~bdc_db.models.SRIDRegistry.refresh`.
+
+    .. versionadded:: 0.9.0
+
+    Examples:
+        .. code-block:: python
+
+            from bdc_db.models import get_srid_registry
+
+            registry = get_srid_registry()
+
+            proj4 = registry.get(4326).proj4text
+            transformer = pyproj.Transformer.from_crs(registry.crs(4326), registry.crs(100001), always_xy=True)
+
+    Args:
+        engine: The SQLAlchemy engine. Defaults to the engine of the current app (``db.engine``).
+        srids: Load only these SRIDs at once instead of the whole table.
+    """
+
+    def __init__(self, engine: t.Optional[Engine] = None, srids: t.Optional[t.Iterable[int]] = None):
+        """Build a new SRID registry."""
+        self.engine = engine
+        self.srids = frozenset(srids) if srids is not None else None
+        self._references: t.Dict[int, SpatialReference] = dict()
+        self._crs: t.Dict[int, t.Any] = dict()
+        self._missing: t.Set[int] = set()
+        self._loaded = False
+        self._lock = threading.RLock()
+        _srid_registries.add(self)
+
+    def load(self, srids: t.Optional[t.Iterable[int]] = None) -> int:
+        """Load the spatial references from database in a single query.
+
+        Args:
+            srids: Load only these SRIDs. Defaults to the registry ``srids`` or the whole table.
+
+        Returns:
+            The number of loaded spatial references.
+        """
+        initial = srids is None
+        srids = self.srids if initial else frozenset(srids)
+
+        statement = select(SpatialRefSys.srid, SpatialRefSys.auth_name, SpatialRefSys.auth_srid,
+                           SpatialRefSys.srtext, SpatialRefSys.proj4text)
+        if srids is not None:
+            statement = statement.where(SpatialRefSys.srid.in_(sorted(srids)))
+
+        engine = self.engine if self.engine is not None else db.engine
+        with engine.connect() as conn:
+            references = [SpatialReference(*row) for row in conn.execute(statement)]
+
+        with self._lock:
+            for reference in references:
+                self._references[reference.srid] = reference
+                self._crs.pop(reference.srid, None)
+                self._missing.discard(reference.srid)
+            if initial:
+                self._loaded = True
+
+        return len(references)
+
+    def get(self, srid: int) -> SpatialReference:
+        """Retrieve the spatial reference of a SRID.
+
+        A missing SRID is remembered until the next refresh, so repeated lookups do not hit the database.
+
+        Raises:
+            KeyError: When the SRID does not exist in ``spatial_ref_sys``.
+        """
+        reference = self._references.get(srid)
+        if reference is not None:
+            return reference
+        if srid in self._missing:
+            raise KeyError(f'SRID {srid} not found in spatial_ref_sys')
+
+        with self._lock:
+            if not self._loaded:
+                self.load()
+            if srid not in self._references and srid not in self._missing:
+                self.load([srid])
+
+            reference = self._references.get(srid)
+            if reference is None:
+                self._missing.add(srid)
+
+        if reference is None:
+            raise KeyError(f'SRID {srid} not found in spatial_ref_sys')
+        return reference
+
+    def crs(self, srid: int) -> 'pyproj.CRS':
+        """Retrieve the parsed ``pyproj.CRS`` of a SRID, from ``srtext`` or ``proj4text``.
+
+        Raises:
+            KeyError: When the SRID does not exist in ``spatial_ref_sys``.
+        """
+        crs = self._crs.get(srid)
+        if crs is not None:
+            return crs
+
+        _require_pyproj()
+        reference = self.get(srid)
+
+        with self._lock:
+            crs = self._crs.get(srid)
+            if crs is None:
+                if reference.srtext:
+                    crs = pyproj.CRS.from_wkt(reference.srtext)
+                elif reference.proj4text:
+                    crs = pyproj.CRS.from_proj4(reference.proj4text)
+                else:
+                    crs = pyproj.CRS.from_authority(reference.auth_name, reference.auth_srid)
+                self._crs[srid] = crs
+        return crs
+
+    def refresh(self, srids: t.Optional[t.Iterable[int]] = None):
+        """Drop the cached spatial references, loaded again on next lookup.
+
+        Args:
+            srids: Drop only these SRIDs. Defaults to the whole registry.
+        """
+        with self._lock:
+            if srids is None:
+                self._references.clear()
+                self._crs.clear()
+                self._missing.clear()
+                self._loaded = False
+                return
+
+            for srid in srids:
+                self._references.pop(srid, None)
+                self._crs.pop(srid, None)
+                self._missing.discard(srid)
+
+    def invalidate(self, tables: t.Iterable[str]):
+        """Refresh the registry when ``spatial_ref_sys`` is one of the given tables (``schema.table``).
+
+        It allows the registry to be started by :class:`~bdc_db.cache.NotifyInvalidator`.
+        """
+        if SpatialRefSys.__table__.fullname in set(tables):
+            self.refresh()
+
+    def __contains__(self, srid: int) -> bool:
+        """Check if a SRID exists in ``spatial_ref_sys``."""
+        try:
+            self.get(srid)
+        except KeyError:
+            return False
+        return True
+
+
+def get_srid_registry() -> SRIDRegistry:
+    """Retrieve the process-wide :class:`~bdc_db.models.SRIDRegistry`, bound to the current app engine.
+
+    .. versionadded:: 0.9.0
+    """
+    global _default_srid_registry
+    if _default_srid_registry is None:
+        _default_srid_registry = SRIDRegistry()
+    return _default_srid_registry
+
+
+@event.listens_for(SpatialRefSys, 'after_insert')
+@event.listens_for(SpatialRefSys, 'after_update')
+@event.listens_for(SpatialRefSys, 'after_delete')
+def _track_srid_changes(mapper, connection, target):
+    """Keep the changed SRIDs until the session commits."""
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault(_SRID_CHANGES_KEY, set()).add(target.srid)
+
+
+@event.listens_for(Session, 'after_commit')
+def _refresh_srid_registries(session):
+    """Refresh the changed SRIDs in every registry."""
+    srids = session.info.pop(_SRID_CHANGES_KEY, None)
+    if srids:
+        for registry in list(_srid_registries):
+            registry.refresh(srids)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_srid_changes(session, previous_transaction):
+    """Forget the changed SRIDs when the outermost transaction rolls back, keeping them on savepoint rollback."""
+    if not previous_transaction.nested and not session.in_transaction():
+        session.info.pop(_SRID_CHANGES_KEY, None)
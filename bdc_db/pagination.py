@@ -0,0 +1,303 @@
+#
+# This file is part of BDC-DB.
+# Copyright (C) 2023 INPE.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/gpl-3.0.html>.
+#
+
+"""Keyset (seek) pagination for listing queries.
+
+.. versionadded:: 0.9.0
+"""
+
+import datetime
+import decimal
+import hashlib
+import typing as t
+import uuid
+from dataclasses import dataclass, field
+
+from flask import current_app
+from itsdangerous import BadData, URLSafeSerializer
+from sqlalchemy import Table, and_, false, or_, select, tuple_
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.elements import UnaryExpression
+
+from .db import db as _db
+from .utils import key_values, single_entity
+
+CURSOR_SALT = 'bdc-db-keyset'
+"""The salt used to sign the pagination cursors."""
+
+
+@dataclass(frozen=True)
+class SortKey:
+    """Represent a column of the pagination order.
+
+    The ``nulls_first`` follows the PostgreSQL default when not specified:
+    ``NULLS LAST`` for ascending and ``NULLS FIRST`` for descending order.
+    """
+
+    column: t.Any
+    descending: bool = False
+    nulls_first: t.Optional[bool] = None
+
+    @classmethod
+    def parse(cls, expression: t.Any) -> 'SortKey':
+        """Build a sort key from an order by expression, like ``Item.id.desc().nulls_last()``."""
+        descending, nulls_first = False, None
+        expression = expression.__clause_element__() if hasattr(expression, '__clause_element__') else expression
+
+        while isinstance(expression, UnaryExpression) and expression.modifier is not None:
+            if expression.modifier is operators.desc_op:
+                descending = True
+            elif expression.modifier is operators.nulls_first_op:
+                nulls_first = True
+            elif expression.modifier is operators.nulls_last_op:
+                nulls_first = False
+            expression = expression.element
+
+        return cls(expression, descending, nulls_first)
+
+    @property
+    def nullable(self) -> bool:
+        """Check if the sort column may have NULL values (expressions are considered nullable)."""
+        return getattr(self.column, 'nullable', True)
+
+    @property
+    def nulls_before(self) -> bool:
+        """Check if the NULL values come before the others."""
+        return self.descending if self.nulls_first is None else self.nulls_first
+
+    def order_by(self):
+        """Build the order by clause of this key."""
+        clause = self.column.desc() if self.descending else self.column.asc()
+        if self.nulls_first is not None:
+            clause = clause.nulls_first() if self.nulls_first else clause.nulls_last()
+        return clause
+
+    def after(self, value: t.Any):
+        """Build the condition for the values coming after ``value`` in this order."""
+        if value is None:
+            return self.column.is_not(None) if self.nulls_before else false()
+
+        condition = self.column < value if self.descending else self.column > value
+        if not self.nulls_before and self.nullable:
+            condition = or_(condition, self.column.is_(None))
+        return condition
+
+    def bound(self, value: t.Any):
+        """Build the inclusive range condition of the first key, which lets the index seek to ``value``.
+
+        Returns:
+            The condition or ``None`` when the NULL values come after ``value``.
+        """
+        if value is None or (self.nullable and not self.nulls_before):
+            return None
+        return self.column <= value if self.descending else self.column >= value
+
+    def equals(self, value: t.Any):
+        """Build the equality condition of this key, including NULL."""
+        return self.column.is_(None) if value is None else self.column == value
+
+
+@dataclass
+class KeysetPage:
+    """Represent a page of :func:`~bdc_db.pagination.paginate_keyset`."""
+
+    items: t.List[t.Any] = field(default_factory=list)
+    next_cursor: t.Optional[str] = None
+
+    @property
+    def has_next(self) -> bool:
+        """Check if there are more items after this page."""
+        return self.next_cursor is not None
+
+
+def keyset_condition(keys: t.Sequence[SortKey], values: t.Sequence[t.Any]):
+    """Build the condition which selects the rows after the given key values.
+
+    When the keys share a direction over NOT NULL columns, it is a row comparison like
+    ``(a, b) > (:a, :b)``, which PostgreSQL resolves with an index seek. Otherwise, the
+    comparison is expanded for mixed directions and NULL values, like
+    ``a >= :a AND ((a > :a) OR (a = :a AND b < :b))`` for ``ORDER BY a, b DESC``,
+    where the leading range on the first key still bounds the index scan.
+    """
+    same_direction = len({key.descending for key in keys}) == 1
+    if same_direction and not any(key.nullable for key in keys) and not any(value is None for value in values):
+        columns, literals = tuple_(*[key.column for key in keys]), tuple_(*values)
+        return columns < literals if keys[0].descending else columns > literals
+
+    conditions = []
+    for position, key in enumerate(keys):
+        previous = [keys[i].equals(values[i]) for i in range(position)]
+        conditions.append(and_(*previous, key.after(values[position])))
+
+    condition = or_(*conditions)
+    bound = keys[0].bound(values[0])
+    return and_(bound, condition) if bound is not None else condition
+
+
+def _index_keys(expressions: t.Iterable[t.Any]) -> t.List[SortKey]:
+    return [SortKey.parse(expression) for expression in expressions]
+
+
+def _supports_order(index_keys: t.Sequence[SortKey], keys: t.Sequence[SortKey]) -> bool:
+    """Check if an index order (or its backward scan) starts with the sort keys."""
+    if len(index_keys) < len(keys):
+        return False
+
+    for backward in (False, True):
+        if all(
+            index_key.column._deannotate() is key.column._deannotate()
+            and (index_key.descending != backward) == key.descending
+            and (not key.nullable or (index_key.nulls_before != backward) == key.nulls_before)
+            for index_key, key in zip(index_keys, keys)
+        ):
+            return True
+    return False
+
+
+def has_supporting_index(keys: t.Sequence[SortKey]) -> bool:
+    """Check if a primary key, unique constraint or index starts with the sort columns in the same order.
+
+    The index may be scanned backward, so ``ORDER BY a DESC, b DESC`` is supported by an index on
+    ``(a, b)``, but mixed directions like ``ORDER BY a, b DESC`` require an index on ``(a, b DESC)``.
+    The indexes are looked up in the table declaration (``db.metadata``), not in database.
+    """
+    table = getattr(keys[0].column._deannotate(), 'table', None)
+    if not isinstance(table, Table):
+        return False
+
+    candidates = [list(table.primary_key.columns)]
+    candidates.extend(list(index.expressions) for index in table.indexes)
+    candidates.extend(list(constraint.columns) for constraint in table.constraints
+                      if hasattr(constraint, 'columns'))
+
+    return any(_supports_order(_index_keys(candidate), keys) for candidate in candidates)
+
+
+def _serializer(secret_key: t.Optional[str]) -> URLSafeSerializer:
+    return URLSafeSerializer(secret_key or current_app.config['SECRET_KEY'], salt=CURSOR_SALT)
+
+
+def _fingerprint(keys: t.Sequence[SortKey]) -> str:
+    spec = ','.join(f'{key.column}:{int(key.descending)}:{key.nulls_before}' for key in keys)
+    return hashlib.sha1(spec.encode()).hexdigest()[:8]
+
+
+def _encode_value(value: t.Any) -> t.Any:
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, (decimal.Decimal, uuid.UUID)):
+        return str(value)
+    return value
+
+
+def _decode_value(key: SortKey, value: t.Any) -> t.Any:
+    if value is None:
+        return None
+    try:
+        python_type = key.column.type.python_type
+    except NotImplementedError:
+        return value
+
+    if python_type in (datetime.datetime, datetime.date, datetime.time):
+        return python_type.fromisoformat(value)
+    if python_type in (decimal.Decimal, uuid.UUID):
+        return python_type(value)
+    return value
+
+
+def encode_cursor(keys: t.Sequence[SortKey], values: t.Sequence[t.Any], secret_key: t.Optional[str] = None) -> str:
+    """Build the opaque and signed cursor token for the given key values."""
+    return _serializer(secret_key).dumps([_fingerprint(keys), [_encode_value(value) for value in values]])
+
+
+def decode_cursor(keys: t.Sequence[SortKey], cursor: str, secret_key: t.Optional[str] = None) -> t.List[t.Any]:
+    """Retrieve the key values of a cursor token.
+
+    Raises:
+        ValueError: When the cursor is invalid, tampered or built for another order.
+    """
+    try:
+        fingerprint, values = _serializer(secret_key).loads(cursor)
+    except (BadData, TypeError, ValueError) as e:
+        raise ValueError('Invalid pagination cursor') from e
+
+    if fingerprint != _fingerprint(keys) or len(values) != len(keys):
+        raise ValueError('The pagination cursor does not match the query order')
+
+    return [_decode_value(key, value) for key, value in zip(keys, values)]
+
+
+def paginate_keyset(query: t.Any, order_by: t.Sequence[t.Any], cursor: t.Optional[str] = None, per_page: int = 20,
+                    session: t.Optional[t.Any] = None, secret_key: t.Optional[str] = None,
+                    check_index: bool = True) -> KeysetPage:
+    """Retrieve a page of a query using keyset pagination.
+
+    Unlike ``OFFSET``, the cost of each page does not depend on its depth: the next page
+    starts right after the sort key values of the last item, which are carried by an opaque
+    cursor signed with the application ``SECRET_KEY``.
+
+    .. versionadded:: 0.9.0
+
+    Examples:
+        .. code-block:: python
+
+            from bdc_db.pagination import paginate_keyset
+
+            page = paginate_keyset(select(Item), [Item.start_date.desc(), Item.id], cursor=request.args.get('cursor'))
+
+            return dict(features=[item.name for item in page.items], next=page.next_cursor)
+
+    Note:
+        The sort columns must be unique together, usually ending with the primary key.
+
+    Raises:
+        ValueError: When the cursor is invalid or no index supports the order (``check_index``).
+
+    Args:
+        query: The SQLAlchemy model or ``select`` statement.
+        order_by: The unique sort columns, optionally with ``desc()``, ``nulls_first()`` or ``nulls_last()``.
+        cursor: The cursor of the previous page. ``None`` retrieves the first page.
+        per_page: The number of items per page.
+        session: The SQLAlchemy session or connection. Defaults to ``db.session``.
+        secret_key: The key to sign the cursors. Defaults to ``SECRET_KEY`` of Flask app.
+        check_index: Check if a primary key, unique constraint or index of ``db.metadata`` starts
+            with the sort columns.
+    """
+    session = session if session is not None else _db.session
+    statement = select(query) if isinstance(query, Table) or hasattr(query, '__mapper__') else query
+    keys = [SortKey.parse(expression) for expression in order_by]
+
+    if not keys:
+        raise ValueError('The keyset pagination requires at least one sort column')
+    if check_index and not has_supporting_index(keys):
+        raise ValueError(f'There is no index for the order {", ".join(str(key.column) for key in keys)}')
+
+    statement = statement.order_by(None).order_by(*[key.order_by() for key in keys])
+    if cursor is not None:
+        statement = statement.where(keyset_condition(keys, decode_cursor(keys, cursor, secret_key)))
+
+    entity = single_entity(statement)
+    result = session.execute(statement.limit(per_page + 1))
+    items = result.scalars().all() if entity is not None else result.all()
+
+    page = KeysetPage(items=items[:per_page])
+    if len(items) > per_page:
+        columns = [key.column for key in keys]
+        page.next_cursor = encode_cursor(keys, key_values(page.items[-1], columns, entity), secret_key)
+
+    return page
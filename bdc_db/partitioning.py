@@ -0,0 +1,309 @@
+#
+# This file is part of BDC-DB.
+# Copyright (C) 2023 INPE.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/gpl-3.0.html>.
+#
+
+"""Declarative support for PostgreSQL table partitioning.
+
+.. versionadded:: 0.9.0
+"""
+
+import re
+import typing as t
+from dataclasses import dataclass
+from datetime import date, timedelta
+
+from sqlalchemy import MetaData, Table, event, literal, text
+from sqlalchemy.engine import Engine
+
+from .utils import execute
+
+PARTITION_INFO_KEY = 'bdc_partition'
+"""Key used in ``Table.info`` to store the partition declaration of a table."""
+
+_RANGE_BOUND = re.compile(r"FROM \('([^']*)'\) TO \('([^']*)'\)")
+
+
+def _add_months(value: date, months: int) -> date:
+    month = value.month - 1 + months
+    return date(value.year + month // 12, month % 12 + 1, 1)
+
+
+@dataclass(frozen=True)
+class RangePartition:
+    """Declare a table partitioned by a time range.
+
+    Each partition holds one ``interval`` (``day``, ``week``, ``month`` or ``year``) and is named
+    ``<table>_p<period>``, like ``item_p202301`` for monthly partitions.
+
+    Args:
+        column: The partition key column name. It must be part of the table primary key.
+        interval: The time span of each partition.
+        start: The first partition created by ``create-schema``. Defaults to the current period.
+        premake: Number of future partitions created ahead of the current period.
+        default: Create a ``DEFAULT`` partition for rows outside of any range.
+    """
+
+    column: str
+    interval: str = 'month'
+    start: t.Optional[date] = None
+    premake: int = 3
+    default: bool = False
+
+    def __post_init__(self):
+        """Check the partition interval."""
+        if self.interval not in ('day', 'week', 'month', 'year'):
+            raise ValueError(f'Invalid partition interval "{self.interval}"')
+
+    @property
+    def partition_by(self) -> str:
+        """Represent the ``PARTITION BY`` clause of the parent table."""
+        return f'RANGE ({self.column})'
+
+    def truncate(self, value: date) -> date:
+        """Return the first day of the period that contains the given date."""
+        if self.interval == 'year':
+            return date(value.year, 1, 1)
+        if self.interval == 'month':
+            return date(value.year, value.month, 1)
+        if self.interval == 'week':
+            return value - timedelta(days=value.weekday())
+        return value
+
+    def next(self, value: date) -> date:
+        """Return the first day of the period after the given period start."""
+        if self.interval == 'year':
+            return date(value.year + 1, 1, 1)
+        if self.interval == 'month':
+            return _add_months(value, 1)
+        if self.interval == 'week':
+            return value + timedelta(days=7)
+        return value + timedelta(days=1)
+
+    def suffix(self, value: date) -> str:
+        """Return the partition name suffix for the period starting on the given date."""
+        if self.interval == 'year':
+            return value.strftime('p%Y')
+        if self.interval == 'month':
+            return value.strftime('p%Y%m')
+        return value.strftime('p%Y%m%d')
+
+    def partitions(self, start: date, end: date) -> t.Iterator[t.Tuple[str, str]]:
+        """Iterate over the name suffix and bound clause of each partition between two dates."""
+        current = self.truncate(start)
+        while current <= end:
+            upper = self.next(current)
+            yield self.suffix(current), f"FOR VALUES FROM ('{current.isoformat()}') TO ('{upper.isoformat()}')"
+            current = upper
+
+
+@dataclass(frozen=True)
+class ListPartition:
+    """Declare a table partitioned by a list of values.
+
+    Each value gets its own partition named ``<table>_<value>``.
+
+    Args:
+        column: The partition key column name. It must be part of the table primary key.
+        values: The values which have a dedicated partition.
+        default: Create a ``DEFAULT`` partition for any other value.
+    """
+
+    column: str
+    values: t.Tuple[t.Any, ...] = ()
+    default: bool = True
+
+    @property
+    def partition_by(self) -> str:
+        """Represent the ``PARTITION BY`` clause of the parent table."""
+        return f'LIST ({self.column})'
+
+    def partitions(self, dialect) -> t.Iterator[t.Tuple[str, str]]:
+        """Iterate over the name suffix and bound clause of each partition."""
+        for value in self.values:
+            bound = literal(value).compile(dialect=dialect, compile_kwargs=dict(literal_binds=True))
+            yield re.sub(r'\W+', '_', str(value)).strip('_').lower(), f'FOR VALUES IN ({bound})'
+
+
+PartitionSpec = t.Union[RangePartition, ListPartition]
+
+
+@dataclass
+class PartitionResult:
+    """Represent a partition attached to a partitioned table."""
+
+    schema: str
+    name: str
+    bound: str
+    total_bytes: int
+    estimated_rows: int
+
+    @property
+    def upper(self) -> t.Optional[date]:
+        """Retrieve the exclusive upper date of a range partition."""
+        match = _RANGE_BOUND.search(self.bound or '')
+        if match is None:
+            return None
+        return date.fromisoformat(match.group(2)[:10])
+
+
+def partition_table(table: Table, spec: PartitionSpec) -> Table:
+    """Mark a SQLAlchemy table as partitioned.
+
+    The table is created as a partitioned parent and the initial partitions of ``spec``
+    are created right after it (``create-schema`` or ``db.create_all()``).
+
+    Args:
+        table: The table to partition.
+        spec: The partitioning declaration.
+    """
+    table.dialect_options['postgresql']['partition_by'] = spec.partition_by
+    table.info[PARTITION_INFO_KEY] = spec
+
+    if not event.contains(table, 'after_create', _create_initial_partitions):
+        event.listen(table, 'after_create', _create_initial_partitions)
+
+    return table
+
+
+def get_partition_spec(table: Table) -> t.Optional[PartitionSpec]:
+    """Retrieve the partition declaration of a table, if any."""
+    return table.info.get(PARTITION_INFO_KEY)
+
+
+def partitioned_tables(metadata: MetaData) -> t.List[Table]:
+    """List the partitioned tables declared in a metadata, in foreign key order."""
+    return [table for table in metadata.sorted_tables if get_partition_spec(table) is not None]
+
+
+def _qualified_name(table: Table, name: str, dialect) -> str:
+    preparer = dialect.identifier_preparer
+    if table.schema:
+        return f'{preparer.quote_schema(table.schema)}.{preparer.quote(name)}'
+    return preparer.quote(name)
+
+
+def _create_initial_partitions(table: Table, connection, **kwargs):
+    spec = get_partition_spec(table)
+    start = spec.start if isinstance(spec, RangePartition) else None
+    create_partitions(table, connection, start=start)
+
+
+def create_partitions(table: Table, executor, start: t.Optional[date] = None,
+                      ahead: t.Optional[int] = None, reference: t.Optional[date] = None) -> t.List[str]:
+    """Create the missing partitions of a partitioned table.
+
+    For range partitions, creates one partition per period from ``start`` (defaults to the
+    period of ``reference``) up to ``ahead`` periods after ``reference``.
+
+    Args:
+        table: The partitioned table.
+        executor: The SQLAlchemy engine or connection.
+        start: The first period to create.
+        ahead: Number of future periods. Defaults to the ``premake`` of declaration.
+        reference: The reference date for current period. Defaults to today.
+
+    Returns:
+        The list of partition names.
+    """
+    spec = get_partition_spec(table)
+    if spec is None:
+        raise ValueError(f'Table {table} is not partitioned')
+
+    dialect = executor.dialect
+    if isinstance(spec, RangePartition):
+        reference = spec.truncate(reference or date.today())
+        end = reference
+        for _ in range(spec.premake if ahead is None else ahead):
+            end = spec.next(end)
+        partitions = list(spec.partitions(start or reference, end))
+    else:
+        partitions = list(spec.partitions(dialect))
+
+    if spec.default:
+        partitions.append(('default', 'DEFAULT'))
+
+    parent = _qualified_name(table, table.name, dialect)
+    names = []
+    for suffix, bound in partitions:
+        name = f'{table.name}_{suffix}'
+        execute(f'CREATE TABLE IF NOT EXISTS {_qualified_name(table, name, dialect)} '
+                f'PARTITION OF {parent} {bound}', executor)
+        names.append(name)
+
+    return names
+
+
+def list_partitions(table: Table, executor) -> t.List[PartitionResult]:
+    """List the partitions attached to a partitioned table with theirs sizes.
+
+    Args:
+        table: The partitioned table.
+        executor: The SQLAlchemy engine or connection.
+    """
+    result = execute(
+        "SELECT n.nspname AS schema,"
+        "       c.relname AS name,"
+        "       pg_get_expr(c.relpartbound, c.oid) AS bound,"
+        "       pg_total_relation_size(c.oid) AS total_bytes,"
+        "       greatest(c.reltuples, 0)::bigint AS estimated_rows"
+        "  FROM pg_inherits i"
+        "  JOIN pg_class c ON c.oid = i.inhrelid"
+        "  JOIN pg_namespace n ON n.oid = c.relnamespace "
+        " WHERE i.inhparent = CAST(:parent AS regclass) "
+        "ORDER BY c.relname",
+        executor,
+        dict(parent=_qualified_name(table, table.name, executor.dialect))
+    )
+
+    return [
+        PartitionResult(row.schema, row.name, row.bound, row.total_bytes, row.estimated_rows)
+        for row in result
+    ]
+
+
+def detach_partitions(table: Table, engine: Engine, older_than: date,
+                      drop: bool = False, concurrently: bool = False) -> t.List[PartitionResult]:
+    """Detach (and optionally drop) the range partitions entirely before a given date.
+
+    Args:
+        table: The partitioned table.
+        engine: The SQLAlchemy active database engine.
+        older_than: Partitions whose upper bound is lower or equal this date are removed.
+        drop: Drop the partition table once detached.
+        concurrently: Use ``DETACH PARTITION ... CONCURRENTLY`` (PostgreSQL 14+).
+
+    Returns:
+        The removed partitions.
+    """
+    removed = [
+        partition for partition in list_partitions(table, engine)
+        if partition.upper is not None and partition.upper <= older_than
+    ]
+
+    parent = _qualified_name(table, table.name, engine.dialect)
+    options = dict(isolation_level='AUTOCOMMIT') if concurrently else dict()
+
+    with engine.connect().execution_options(**options) as conn:
+        for partition in removed:
+            child = _qualified_name(table, partition.name, engine.dialect)
+            conn.execute(text(f'ALTER TABLE {parent} DETACH PARTITION {child}'
+                              f'{" CONCURRENTLY" if concurrently else ""}'))
+            if drop:
+                conn.execute(text(f'DROP TABLE {child}'))
+        conn.commit()
+
+    return removed
@@ -0,0 +1,371 @@
+#
+# This file is part of BDC-DB.
+# Copyright (C) 2023 INPE.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/gpl-3.0.html>.
+#
+
+"""Pytest plugin with a cached template database and transactional tests for BDC-DB applications.
+
+Enable it in the ``conftest.py`` of the application::
+
+    pytest_plugins = ['bdc_db.pytest_plugin']
+
+The database schema (namespaces, tables, triggers and change feeds) is built once into a
+template database named after a hash of the metadata and triggers. Each pytest session
+(and each ``pytest-xdist`` worker) clones its own database from the template with
+``CREATE DATABASE ... TEMPLATE`` and each test runs inside a transaction rolled back at the end.
+
+.. versionadded:: 0.9.0
+"""
+
+import hashlib
+import os
+import typing as t
+import uuid
+
+import pytest
+from flask import Flask
+from flask_sqlalchemy.session import Session as _Session
+from sqlalchemy import MetaData, create_engine
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.orm import scoped_session, sessionmaker
+from sqlalchemy.pool import NullPool
+from sqlalchemy.schema import CreateIndex, CreateSchema, CreateTable
+
+from . import config as _config
+from .changefeed import (change_feed_tables, create_change_feed_trigger,
+                         create_notify_function, get_change_feed)
+from .db import db as _db
+from .drivers import resolve_database_uri
+from .ext import BrazilDataCubeDB
+from .partitioning import get_partition_spec
+from .utils import execute
+from .version import __version__
+
+TEMPLATE_SUFFIX = '_tpl_'
+"""Part of the template database name between the database name and the schema hash."""
+
+MAINTENANCE_DATABASE = 'postgres'
+"""Database used to create and drop the template and test databases."""
+
+_REBUILD_KEY = pytest.StashKey[str]()
+
+
+class _SavepointSession(_Session):
+    """Session bound to the connection of the test transaction instead of the app engine."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        return bind if bind is not None else self.bind
+
+
+def schema_hash(metadata: MetaData, ext: t.Optional[BrazilDataCubeDB] = None) -> str:
+    """Compute a hash of the database schema declared by the metadata and the extension triggers.
+
+    Args:
+        metadata: The SQLAlchemy metadata (usually ``db.metadata``).
+        ext: The extension with the namespaces and triggers.
+
+    Returns:
+        The first 12 hexadecimal digits of the SHA-256 of the DDL.
+    """
+    dialect = postgresql.dialect()
+    digest = hashlib.sha256(__version__.encode())
+
+    for table in metadata.sorted_tables:
+        digest.update(str(CreateTable(table).compile(dialect=dialect)).encode())
+        for index in sorted(table.indexes, key=lambda i: str(i.name)):
+            digest.update(str(CreateIndex(index).compile(dialect=dialect)).encode())
+        digest.update(repr((get_partition_spec(table), get_change_feed(table))).encode())
+
+    if ext is not None:
+        digest.update(repr(sorted(ext.namespaces)).encode())
+        for module_name in sorted(ext.triggers):
+            for file_name, script in sorted(ext.triggers[module_name].items()):
+                with open(script, 'rb') as fd:
+                    digest.update(f'{module_name}/{file_name}'.encode())
+                    digest.update(fd.read())
+
+    return digest.hexdigest()[:12]
+
+
+def build_schema(connection, metadata: MetaData, ext: t.Optional[BrazilDataCubeDB] = None):
+    """Create the PostGIS extension (when available), namespaces, tables, triggers and change feeds.
+
+    Args:
+        connection: The SQLAlchemy connection within a transaction.
+        metadata: The SQLAlchemy metadata (usually ``db.metadata``).
+        ext: The extension with the namespaces and triggers.
+    """
+    if execute("SELECT count(*) FROM pg_available_extensions WHERE name = 'postgis'", connection).scalar():
+        execute('CREATE EXTENSION IF NOT EXISTS postgis', connection)
+
+    for namespace in (ext.namespaces if ext is not None else []):
+        connection.execute(CreateSchema(namespace, if_not_exists=True))
+
+    metadata.create_all(connection)
+
+    if ext is not None:
+        for entry in ext.triggers.values():
+            for script in entry.values():
+                with open(script) as fd:
+                    execute(fd.read(), connection)
+
+    feed_tables = change_feed_tables(metadata)
+    if feed_tables:
+        create_notify_function(connection)
+        for table in feed_tables:
+            create_change_feed_trigger(table, connection)
+
+
+def _admin_engine(url) -> Engine:
+    return create_engine(url.set(database=MAINTENANCE_DATABASE), isolation_level='AUTOCOMMIT', poolclass=NullPool)
+
+
+def _list_templates(conn, url) -> t.List[str]:
+    return execute('SELECT datname FROM pg_database WHERE starts_with(datname, :prefix)',
+                   conn, dict(prefix=f'{url.database}{TEMPLATE_SUFFIX}')).scalars().all()
+
+
+def _drop_template(conn, name: str):
+    preparer = conn.dialect.identifier_preparer
+    execute(f'ALTER DATABASE {preparer.quote(name)} WITH IS_TEMPLATE false', conn)
+    execute(f'DROP DATABASE {preparer.quote(name)} WITH (FORCE)', conn)
+
+
+def ensure_template(url: str, key: str, metadata: MetaData, ext: t.Optional[BrazilDataCubeDB] = None,
+                    rebuild: t.Optional[str] = None) -> str:
+    """Create the template database of a schema hash, unless it already exists.
+
+    The creation is serialized by an advisory lock, so parallel workers build it once.
+    A template left incomplete by an interrupted build is created again, and the templates
+    of the previous schema hashes are dropped once the new one is built.
+
+    Args:
+        url: The database URI. The template is named after its database.
+        key: The schema hash, like :func:`~bdc_db.pytest_plugin.schema_hash`.
+        metadata: The SQLAlchemy metadata (usually ``db.metadata``).
+        ext: The extension with the namespaces and triggers.
+        rebuild: Build the template again unless it was built with this token, shared by the
+            workers of a test session so only the first one rebuilds it.
+
+    Returns:
+        The template database name.
+    """
+    url = make_url(url)
+    prefix = f'{url.database}{TEMPLATE_SUFFIX}'
+    name = f'{prefix}{key}'[:63]
+    admin = _admin_engine(url)
+    preparer = admin.dialect.identifier_preparer
+
+    try:
+        with admin.connect() as conn:
+            execute('SELECT pg_advisory_lock(hashtext(:name))', conn, dict(name=prefix))
+            try:
+                row = execute('SELECT datistemplate, shobj_description(oid, \'pg_database\') AS token '
+                              '  FROM pg_database WHERE datname = :name', conn, dict(name=name)).first()
+                complete = row.datistemplate if row is not None else None
+                if complete and rebuild is not None and row.token != rebuild:
+                    _drop_template(conn, name)
+                    complete = None
+                elif complete is False:
+                    execute(f'DROP DATABASE {preparer.quote(name)} WITH (FORCE)', conn)
+
+                if not complete:
+                    execute(f'CREATE DATABASE {preparer.quote(name)}', conn)
+                    template = create_engine(url.set(database=name), poolclass=NullPool)
+                    try:
+                        with template.begin() as template_conn:
+                            build_schema(template_conn, metadata, ext)
+                    finally:
+                        template.dispose()
+                    if rebuild is not None:
+                        token = rebuild.replace("'", "''")
+                        execute(f"COMMENT ON DATABASE {preparer.quote(name)} IS '{token}'", conn)
+                    # Mark the template complete
+                    execute(f'ALTER DATABASE {preparer.quote(name)} WITH IS_TEMPLATE true', conn)
+
+                    for stale in _list_templates(conn, url):
+                        if stale != name:
+                            _drop_template(conn, stale)
+            finally:
+                execute('SELECT pg_advisory_unlock(hashtext(:name))', conn, dict(name=prefix))
+    finally:
+        admin.dispose()
+
+    return name
+
+
+def drop_templates(url: str) -> t.List[str]:
+    """Drop the template databases of a database URI, whatever their schema hash.
+
+    Returns:
+        The names of the dropped templates.
+    """
+    url = make_url(url)
+    admin = _admin_engine(url)
+    try:
+        with admin.connect() as conn:
+            names = _list_templates(conn, url)
+            for name in names:
+                _drop_template(conn, name)
+    finally:
+        admin.dispose()
+    return names
+
+
+def clone_database(url: str, template: str):
+    """Drop and create a database as a copy of a template database.
+
+    Args:
+        url: The URI of the database to create.
+        template: The template database name.
+    """
+    url = make_url(url)
+    admin = _admin_engine(url)
+    preparer = admin.dialect.identifier_preparer
+    try:
+        with admin.connect() as conn:
+            execute(f'DROP DATABASE IF EXISTS {preparer.quote(url.database)} WITH (FORCE)', conn)
+            execute(f'CREATE DATABASE {preparer.quote(url.database)} TEMPLATE {preparer.quote(template)}', conn)
+    finally:
+        admin.dispose()
+
+
+def drop_database(url: str):
+    """Drop a database, closing its connections."""
+    url = make_url(url)
+    admin = _admin_engine(url)
+    try:
+        with admin.connect() as conn:
+            execute(f'DROP DATABASE IF EXISTS {admin.dialect.identifier_preparer.quote(url.database)} WITH (FORCE)',
+                    conn)
+    finally:
+        admin.dispose()
+
+
+def worker_database_uri(uri: str, worker: t.Optional[str] = None) -> str:
+    """Build the URI of the test database of a ``pytest-xdist`` worker (``<database>_test_<worker>``).
+
+    Args:
+        uri: The database URI.
+        worker: The worker id. Defaults to ``PYTEST_XDIST_WORKER`` or ``main``.
+    """
+    worker = worker or os.environ.get('PYTEST_XDIST_WORKER', 'main')
+    url = make_url(uri)
+    return url.set(database=f'{url.database}_test_{worker}'[:63]).render_as_string(hide_password=False)
+
+
+def pytest_addoption(parser):
+    """Add the BDC-DB options."""
+    group = parser.getgroup('bdc-db')
+    group.addoption('--bdc-db-url', dest='bdc_db_url', default=None,
+                    help='The database URI used to name the template and test databases.')
+    group.addoption('--bdc-db-rebuild', dest='bdc_db_rebuild', action='store_true', default=False,
+                    help='Build the template database again.')
+    parser.addini('bdc_db_url', 'The database URI used to name the template and test databases.')
+
+
+def _database_uri(config, app_config: t.Dict[str, t.Any]) -> str:
+    uri = (config.getoption('bdc_db_url') or config.getini('bdc_db_url')
+           or app_config.get('SQLALCHEMY_DATABASE_URI') or _config.SQLALCHEMY_DATABASE_URI)
+    return resolve_database_uri(uri, app_config.get('BDC_DB_DRIVER', _config.BDC_DB_DRIVER))
+
+
+def _rebuild_token(config) -> t.Optional[str]:
+    if hasattr(config, 'workerinput'):
+        return config.workerinput.get('bdc_db_rebuild')
+    return config.stash.get(_REBUILD_KEY, None)
+
+
+def pytest_configure(config):
+    """Create the token of ``--bdc-db-rebuild`` once, in the main process.
+
+    The template is rebuilt by the fixture :func:`~bdc_db.pytest_plugin.bdc_db_app`, which knows
+    the database URI of ``bdc_db_config``.
+    """
+    if config.getoption('bdc_db_rebuild', False) and not hasattr(config, 'workerinput'):
+        config.stash[_REBUILD_KEY] = uuid.uuid4().hex
+
+
+@pytest.hookimpl(optionalhook=True)
+def pytest_configure_node(node):
+    """Share the rebuild token with the ``pytest-xdist`` workers."""
+    token = _rebuild_token(node.config)
+    if token is not None:
+        node.workerinput['bdc_db_rebuild'] = token
+
+
+@pytest.fixture(scope='session')
+def bdc_db_config() -> t.Dict[str, t.Any]:
+    """Flask configuration of the test application. Override it to customize the application."""
+    return dict()
+
+
+@pytest.fixture(scope='session')
+def bdc_db_app_factory() -> t.Callable[[t.Dict[str, t.Any]], Flask]:
+    """Build the test application from a config. Override it to use the application factory."""
+    def _factory(config: t.Dict[str, t.Any]) -> Flask:
+        app = Flask('bdc_db_tests')
+        app.config.update(config)
+        BrazilDataCubeDB(app)
+        return app
+
+    return _factory
+
+
+@pytest.fixture(scope='session')
+def bdc_db_app(request, bdc_db_config, bdc_db_app_factory) -> t.Iterator[Flask]:
+    """Create the test database of this session (or worker) from the template and yield the application."""
+    uri = _database_uri(request.config, bdc_db_config)
+    test_uri = worker_database_uri(uri)
+
+    app = bdc_db_app_factory(dict(bdc_db_config, SQLALCHEMY_DATABASE_URI=test_uri))
+
+    with app.app_context():
+        ext = app.extensions['bdc-db']
+        template = ensure_template(uri, schema_hash(_db.metadata, ext), _db.metadata, ext,
+                                   rebuild=_rebuild_token(request.config))
+        clone_database(test_uri, template)
+
+    yield app
+
+    with app.app_context():
+        _db.engine.dispose()
+    drop_database(test_uri)
+
+
+@pytest.fixture
+def bdc_db_session(bdc_db_app):
+    """Run the test inside a transaction rolled back at the end, binding ``db.session`` to it.
+
+    The session commits and rollbacks are turned into savepoints of this transaction.
+    The statements executed by other connections (like ``db.engine.connect()``) are not isolated.
+    """
+    with bdc_db_app.app_context():
+        connection = _db.engine.connect()
+        transaction = connection.begin()
+        session = _db.session
+        # Built with the public Flask-SQLAlchemy ``Session`` and ``Query`` instead of its private session factory
+        factory = sessionmaker(class_=_SavepointSession, db=_db, query_cls=_db.Query, bind=connection,
+                               join_transaction_mode='create_savepoint')
+        _db.session = scoped_session(factory)
+        try:
+            yield _db.session
+        finally:
+            _db.session.remove()
+            _db.session = session
+            transaction.rollback()
+            connection.close()
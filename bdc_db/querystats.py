@@ -0,0 +1,175 @@
+#
+# This file is part of BDC-DB.
+# Copyright (C) 2023 INPE.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/gpl-3.0.html>.
+#
+
+"""Detect N+1 query patterns and enforce a query budget per Flask request.
+
+.. versionadded:: 0.9.0
+"""
+
+import re
+import time
+import typing as t
+import warnings
+from collections import Counter
+from dataclasses import dataclass, field
+
+from flask import g, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .slowlog import caller_frames
+
+_PLACEHOLDERS = re.compile(r"%\(\w+\)s|%s|\$\d+|(?<!:):\w+|\?")
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_IN_LISTS = re.compile(r"\bin\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_SPACES = re.compile(r'\s+')
+
+
+class NPlusOneWarning(UserWarning):
+    """Warn about a statement repeated several times in the same request."""
+
+
+class QueryBudgetError(RuntimeError):
+    """Raised when a request exceeds the query budget or repeats a statement with ``raise_on_repeat``."""
+
+
+def fingerprint(statement: str) -> str:
+    """Normalize a statement, replacing the parameters and literals by ``?`` and collapsing ``IN`` lists.
+
+    Examples:
+        .. code-block:: python
+
+            fingerprint("SELECT * FROM item WHERE id IN (%(id_1)s, %(id_2)s) AND name = 'a'")
+            # 'SELECT * FROM item WHERE id IN (?) AND name = ?'
+    """
+    statement = _PLACEHOLDERS.sub('?', statement)
+    statement = _LITERALS.sub('?', statement)
+    statement = _IN_LISTS.sub('IN (?)', statement)
+    return _SPACES.sub(' ', statement).strip()
+
+
+@dataclass
+class RequestQueryStats:
+    """Represent the statements executed by a request."""
+
+    count: int = 0
+    duration: float = 0.0
+    fingerprints: t.Counter[str] = field(default_factory=Counter)
+    repeated: t.Dict[str, str] = field(default_factory=dict)
+    """Map of the repeated fingerprints and the code location of the repetition."""
+
+
+class QueryTracker:
+    """Track the statements of an engine per Flask request.
+
+    A statement fingerprint repeated more than ``threshold`` times in a request, usually a lazy load
+    inside a loop, warns with :class:`~bdc_db.querystats.NPlusOneWarning` (or raises with
+    ``raise_on_repeat``). The optional budget raises :class:`~bdc_db.querystats.QueryBudgetError`
+    once a request executes more than ``max_queries`` statements or spends ``max_duration`` seconds
+    on database. The responses get the ``Server-Timing`` header with the database time and statement count.
+
+    Examples:
+        .. code-block:: python
+
+            from bdc_db.db import db
+            from bdc_db.querystats import QueryTracker
+
+            tracker = QueryTracker(threshold=5, max_queries=50)
+            tracker.init_app(app, db.engine)
+
+    Args:
+        threshold: The number of repetitions of a fingerprint allowed in a request.
+        raise_on_repeat: Raise instead of warn when a fingerprint exceeds the threshold.
+        max_queries: The maximum number of statements of a request.
+        max_duration: The maximum database time of a request in seconds.
+        server_timing: Add the ``Server-Timing`` header to the responses.
+    """
+
+    def __init__(self, threshold: int = 5, raise_on_repeat: bool = False, max_queries: t.Optional[int] = None,
+                 max_duration: t.Optional[float] = None, server_timing: bool = True):
+        """Build a new query tracker."""
+        self.threshold = threshold
+        self.raise_on_repeat = raise_on_repeat
+        self.max_queries = max_queries
+        self.max_duration = max_duration
+        self.server_timing = server_timing
+        self.engine: t.Optional[Engine] = None
+
+    def init_app(self, app, engine: Engine):
+        """Track the statements of an engine during the requests of an application."""
+        self.engine = engine
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+
+    def uninstall(self):
+        """Stop tracking the statements of the engine."""
+        if self.engine is None:
+            return
+        event.remove(self.engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.remove(self.engine, 'after_cursor_execute', self._after_cursor_execute)
+        self.engine = None
+
+    @staticmethod
+    def current() -> t.Optional[RequestQueryStats]:
+        """Retrieve the statistics of the current request, if tracked."""
+        return g.get('_bdc_query_stats') if has_request_context() else None
+
+    def _start_request(self):
+        g._bdc_query_stats = RequestQueryStats()
+
+    def _finish_request(self, response):
+        stats = self.current()
+        if stats is not None and self.server_timing:
+            response.headers.add('Server-Timing', f'db;dur={stats.duration * 1000:.1f};desc="{stats.count} queries"')
+        return response
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if self.current() is not None:
+            context._bdc_query_start = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        stats = self.current()
+        start = getattr(context, '_bdc_query_start', None)
+        if stats is None or start is None:
+            return
+
+        stats.count += 1
+        stats.duration += time.perf_counter() - start
+        key = fingerprint(statement)
+        stats.fingerprints[key] += 1
+
+        if stats.fingerprints[key] > self.threshold and key not in stats.repeated:
+            frame = next(iter(caller_frames(1, ignored=(__file__,))), None)
+            location = f'{frame.filename}:{frame.lineno} in {frame.name}' if frame is not None else ''
+            stats.repeated[key] = location
+            message = f'Statement executed {stats.fingerprints[key]} times in the request (N+1 query?) ' \
+                      f'at {location}: {key}'
+            if self.raise_on_repeat:
+                raise QueryBudgetError(message)
+            if frame is None:
+                warnings.warn(message, NPlusOneWarning)
+            else:
+                # Point the warning at the user code issuing the statement, not at the event listener
+                warnings.warn_explicit(message, NPlusOneWarning, frame.filename, frame.lineno)
+
+        if self.max_queries is not None and stats.count > self.max_queries:
+            raise QueryBudgetError(f'Request exceeded the budget of {self.max_queries} statements')
+        if self.max_duration is not None and stats.duration > self.max_duration:
+            raise QueryBudgetError(f'Request exceeded the database time budget of {self.max_duration}s')
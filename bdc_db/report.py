@@ -0,0 +1,266 @@
+#
+# This file is part of BDC-DB.
+# Copyright (C) 2023 INPE.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/gpl-3.0.html>.
+#
+
+"""Report the size, bloat and index usage of the managed tables.
+
+.. versionadded:: 0.9.0
+"""
+
+import math
+import typing as t
+from dataclasses import dataclass, field
+
+from sqlalchemy import Table
+
+from .utils import execute
+
+PAGE_HEADER_BYTES = 24
+"""The header size of a heap page."""
+
+TUPLE_OVERHEAD_BYTES = 28
+"""The tuple header (23 bytes, aligned to 24) plus its item pointer (4 bytes)."""
+
+_MANAGED_RELATIONS = (
+    "WITH managed AS ("
+    "    SELECT c.oid FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace"
+    "     WHERE c.relkind IN ('r', 'p')"
+    "       AND (n.nspname = ANY(:namespaces) OR n.nspname || '.' || c.relname = ANY(:names))"
+    "), tree AS ("
+    "    SELECT oid AS relid FROM managed"
+    "    UNION SELECT p.relid FROM managed m CROSS JOIN LATERAL pg_partition_tree(m.oid) p"
+    ") "
+)
+
+
+@dataclass
+class IndexReport:
+    """Represent the size and usage of an index."""
+
+    schema: str
+    table_name: str
+    index_name: str
+    size_bytes: int
+    scans: int
+    unique: bool
+    primary: bool
+    definition: str
+    cache_hit_ratio: t.Optional[float] = None
+    duplicate_of: t.Optional[str] = None
+
+    @property
+    def unused(self) -> bool:
+        """Check if the index was never scanned and does not enforce uniqueness."""
+        return self.scans == 0 and not self.unique and not self.primary
+
+
+@dataclass
+class TableReport:
+    """Represent the size, bloat and usage of a table."""
+
+    schema: str
+    table_name: str
+    total_bytes: int
+    table_bytes: int
+    indexes_bytes: int
+    toast_bytes: int
+    estimated_rows: int
+    live_tuples: int
+    dead_tuples: int
+    seq_scans: int
+    idx_scans: int
+    cache_hit_ratio: t.Optional[float] = None
+    bloat_bytes: t.Optional[int] = None
+    indexes: t.List[IndexReport] = field(default_factory=list)
+
+    @property
+    def name(self) -> str:
+        """Retrieve the qualified table name."""
+        return f'{self.schema}.{self.table_name}'
+
+    @property
+    def bloat_ratio(self) -> t.Optional[float]:
+        """Retrieve the estimated bloat as a fraction of the table size."""
+        if self.bloat_bytes is None or not self.table_bytes:
+            return None
+        return self.bloat_bytes / self.table_bytes
+
+
+def format_bytes(value: t.Optional[float]) -> str:
+    """Format a size in bytes as a human readable value, like ``1.5 MB``."""
+    if value is None:
+        return '-'
+    for unit in ('B', 'kB', 'MB', 'GB', 'TB'):
+        if abs(value) < 1024 or unit == 'TB':
+            return f'{value:.0f} {unit}' if unit == 'B' else f'{value:.1f} {unit}'
+        value /= 1024
+
+
+def _ratio(hits: t.Optional[int], reads: t.Optional[int]) -> t.Optional[float]:
+    total = (hits or 0) + (reads or 0)
+    return (hits or 0) / total if total else None
+
+
+def estimate_bloat(pages: int, rows: float, row_width: t.Optional[float], fillfactor: int,
+                   block_size: int) -> t.Optional[int]:
+    """Estimate the bloat of a table in bytes from its pages, rows and average row width (``pg_stats``).
+
+    Returns:
+        The bytes above the expected size or ``None`` when the table was not analyzed.
+    """
+    if row_width is None:
+        return None
+    usable = (block_size - PAGE_HEADER_BYTES) * fillfactor / 100
+    expected_pages = math.ceil(rows * (row_width + TUPLE_OVERHEAD_BYTES) / usable)
+    return max(pages - expected_pages, 0) * block_size
+
+
+def _table_filter(tables: t.Sequence[Table], namespaces: t.Sequence[str], executor) -> t.Dict[str, t.List[str]]:
+    default_schema = execute('SELECT current_schema()', executor).scalar()
+    names = [f'{table.schema or default_schema}.{table.name}' for table in tables]
+    return dict(names=names, namespaces=list(namespaces))
+
+
+def index_report(executor, tables: t.Sequence[Table] = (), namespaces: t.Sequence[str] = ()) -> t.List[IndexReport]:
+    """Report the indexes of the managed tables (and their partitions).
+
+    An index is a duplicate when another index of the same table has the same access method,
+    columns, operator classes, collations, sort options, expressions and predicate.
+    The primary key and unique indexes are kept.
+
+    Args:
+        executor: The SQLAlchemy engine or connection.
+        tables: The SQLAlchemy tables.
+        namespaces: Include all tables of these namespaces (schemas).
+    """
+    return _index_report(executor, _table_filter(tables, namespaces, executor))
+
+
+def _index_report(executor, table_filter: t.Dict[str, t.List[str]]) -> t.List[IndexReport]:
+    query_result = execute(
+        _MANAGED_RELATIONS +
+        "SELECT n.nspname AS schema,"
+        "       t.relname AS table_name,"
+        "       c.relname AS index_name,"
+        "       pg_relation_size(c.oid) AS size_bytes,"
+        "       coalesce(s.idx_scan, 0) AS scans,"
+        "       i.indisunique AS is_unique,"
+        "       i.indisprimary AS is_primary,"
+        "       pg_get_indexdef(i.indexrelid) AS definition,"
+        "       concat_ws(' ', i.indrelid::text, am.amname, i.indkey::text, i.indclass::text,"
+        "                 i.indcollation::text, i.indoption::text,"
+        "                 pg_get_expr(i.indexprs, i.indrelid), pg_get_expr(i.indpred, i.indrelid)) AS signature,"
+        "       io.idx_blks_hit AS hits,"
+        "       io.idx_blks_read AS reads"
+        "  FROM pg_index i"
+        "  JOIN pg_class c ON c.oid = i.indexrelid"
+        "  JOIN pg_am am ON am.oid = c.relam"
+        "  JOIN pg_class t ON t.oid = i.indrelid"
+        "  JOIN pg_namespace n ON n.oid = t.relnamespace"
+        "  LEFT JOIN pg_stat_user_indexes s ON s.indexrelid = i.indexrelid"
+        "  LEFT JOIN pg_statio_user_indexes io ON io.indexrelid = i.indexrelid "
+        " WHERE i.indrelid IN (SELECT relid FROM tree) "
+        "ORDER BY schema, table_name, NOT i.indisprimary, NOT i.indisunique, index_name",
+        executor,
+        table_filter
+    )
+
+    indexes, signatures = [], dict()
+    for row in query_result:
+        index = IndexReport(row.schema, row.table_name, row.index_name, row.size_bytes, row.scans,
+                            row.is_unique, row.is_primary, row.definition, _ratio(row.hits, row.reads))
+        original = signatures.setdefault(row.signature, index)
+        if original is not index:
+            index.duplicate_of = original.index_name
+        indexes.append(index)
+
+    return indexes
+
+
+def table_report(executor, tables: t.Sequence[Table] = (), namespaces: t.Sequence[str] = (),
+                 include_indexes: bool = True) -> t.List[TableReport]:
+    """Report the size, estimated bloat, scans and cache hit ratio of the managed tables.
+
+    The partitions of partitioned tables are reported as tables. The reports are ordered by total size.
+
+    Examples:
+        .. code-block:: python
+
+            from bdc_db.db import db
+            from bdc_db.report import format_bytes, table_report
+
+            with db.engine.connect() as conn:
+                for entry in table_report(conn, db.metadata.sorted_tables):
+                    print(entry.name, format_bytes(entry.total_bytes), entry.bloat_ratio)
+
+    Args:
+        executor: The SQLAlchemy engine or connection.
+        tables: The SQLAlchemy tables.
+        namespaces: Include all tables of these namespaces (schemas).
+        include_indexes: Add the report of the indexes of each table.
+    """
+    table_filter = _table_filter(tables, namespaces, executor)
+    query_result = execute(
+        _MANAGED_RELATIONS +
+        "SELECT n.nspname AS schema,"
+        "       c.relname AS table_name,"
+        "       pg_total_relation_size(c.oid) AS total_bytes,"
+        "       pg_relation_size(c.oid) AS table_bytes,"
+        "       pg_indexes_size(c.oid) AS indexes_bytes,"
+        "       coalesce(pg_total_relation_size(nullif(c.reltoastrelid, 0)), 0) AS toast_bytes,"
+        "       c.relpages AS pages,"
+        "       greatest(c.reltuples, 0)::bigint AS estimated_rows,"
+        "       coalesce(s.n_live_tup, 0) AS live_tuples,"
+        "       coalesce(s.n_dead_tup, 0) AS dead_tuples,"
+        "       coalesce(s.seq_scan, 0) AS seq_scans,"
+        "       coalesce(s.idx_scan, 0) AS idx_scans,"
+        "       io.heap_blks_hit AS hits,"
+        "       io.heap_blks_read AS reads,"
+        "       (SELECT sum(st.avg_width) FROM pg_stats st"
+        "         WHERE st.schemaname = n.nspname AND st.tablename = c.relname) AS row_width,"
+        "       coalesce((SELECT substring(o FROM 'fillfactor=([0-9]+)')::int FROM unnest(c.reloptions) o"
+        "                  WHERE o LIKE 'fillfactor=%'), 100) AS fillfactor,"
+        "       current_setting('block_size')::int AS block_size"
+        "  FROM tree"
+        "  JOIN pg_class c ON c.oid = tree.relid"
+        "  JOIN pg_namespace n ON n.oid = c.relnamespace"
+        "  LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid"
+        "  LEFT JOIN pg_statio_user_tables io ON io.relid = c.oid "
+        " WHERE c.relkind = 'r' "
+        "ORDER BY total_bytes DESC, schema, table_name",
+        executor,
+        table_filter
+    )
+
+    reports = [
+        TableReport(row.schema, row.table_name, row.total_bytes, row.table_bytes, row.indexes_bytes, row.toast_bytes,
+                    row.estimated_rows, row.live_tuples, row.dead_tuples, row.seq_scans, row.idx_scans,
+                    _ratio(row.hits, row.reads),
+                    estimate_bloat(row.pages, row.estimated_rows,
+                                   float(row.row_width) if row.row_width is not None else None,
+                                   row.fillfactor, row.block_size))
+        for row in query_result
+    ]
+
+    if include_indexes:
+        per_table = {entry.name: entry for entry in reports}
+        for index in _index_report(executor, table_filter):
+            entry = per_table.get(f'{index.schema}.{index.table_name}')
+            if entry is not None:
+                entry.indexes.append(index)
+
+    return reports
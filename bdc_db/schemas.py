@@ -0,0 +1,212 @@
+#
+# This file is part of BDC-DB.
+# Copyright (C) 2023 INPE.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/gpl-3.0.html>.
+#
+
+"""Application-free registry of the JSONSchemas used to validate JSONB values.
+
+The :class:`~bdc_db.schemas.SchemaRegistry` loads the schemas of the entry point ``bdc.schemas``
+and resolves the ``$ref`` of the schemas served by ``JSONSCHEMAS_HOST`` offline. It is picklable,
+so the validation works in worker processes (``multiprocessing``, Celery) and plain scripts.
+
+.. versionadded:: 0.9.0
+"""
+
+import json
+import os
+import typing as t
+from importlib.metadata import entry_points
+from urllib.parse import urldefrag, urljoin, urlsplit
+
+import jsonschema
+
+from . import config
+
+try:
+    from referencing import Registry, Resource
+    from referencing.exceptions import NoSuchResource
+    from referencing.jsonschema import DRAFT7
+except ImportError:  # pragma: no cover - jsonschema < 4.18
+    Registry = None
+
+
+class SchemaRegistry:
+    """Keep the JSONSchemas and build the validators without a Flask application context.
+
+    Examples:
+        .. code-block:: python
+
+            from concurrent.futures import ProcessPoolExecutor
+
+            from bdc_db.schemas import SchemaRegistry
+
+            registry = SchemaRegistry.from_entry_points()
+
+            with ProcessPoolExecutor() as pool:
+                pool.map(registry.validate, ['myapp/myschema.json'] * len(values), values)
+
+    Args:
+        schemas: Map of schema relative path and the directory which contains it.
+        host: The host which serves the schemas. Defaults to ``JSONSCHEMAS_HOST``.
+        endpoint: The URL path prefix of the schemas.
+        url_scheme: The URL scheme of the schemas.
+    """
+
+    def __init__(self, schemas: t.Optional[t.Dict[str, str]] = None, host: t.Optional[str] = None,
+                 endpoint: str = '/schemas', url_scheme: str = 'https'):
+        """Build a new schema registry."""
+        self.schemas: t.Dict[str, str] = dict(schemas or dict())
+        self.host = host or config.JSONSCHEMAS_HOST
+        self.endpoint = endpoint
+        self.url_scheme = url_scheme
+        self._documents: t.Dict[str, t.Any] = dict()
+        self._validators: t.Dict[str, t.Any] = dict()
+
+    @classmethod
+    def from_entry_points(cls, group: str = 'bdc.schemas', **kwargs) -> 'SchemaRegistry':
+        """Build a registry with the schema directories of an entry point group."""
+        registry = cls(**kwargs)
+        for base_entry in entry_points(group=group):
+            registry.register_schemas_dir(os.path.dirname(base_entry.load().__file__))
+        return registry
+
+    def register_schemas_dir(self, directory: str):
+        """Register all the JSON files of a directory (recursively)."""
+        directory = os.path.abspath(directory)
+        for root, _, files in os.walk(directory):
+            relative = os.path.relpath(root, directory)
+            for file_name in files:
+                if file_name.lower().endswith('.json'):
+                    path = file_name if relative == '.' else os.path.join(relative, file_name)
+                    self.schemas[path.replace(os.sep, '/')] = directory
+
+    def list_schemas(self) -> t.List[str]:
+        """List the relative path of the registered schemas."""
+        return sorted(self.schemas)
+
+    def schema_url(self, path: str) -> str:
+        """Build the URL of a schema, like ``https://brazildatacube.org/schemas/myapp/myschema.json``."""
+        return f'{self.url_scheme}://{self.host}{self.endpoint}/{path.lstrip("/")}'
+
+    def url_to_path(self, url: str) -> t.Optional[str]:
+        """Retrieve the schema path of an URL (or relative path) or ``None`` when not registered."""
+        url, _ = urldefrag(url)
+        parts = urlsplit(url)
+        if parts.netloc:
+            prefix = f'{self.endpoint}/'
+            if parts.netloc != self.host or not parts.path.startswith(prefix):
+                return None
+            url = parts.path[len(prefix):]
+        return url if url in self.schemas else None
+
+    def get_schema(self, path: str) -> t.Dict[str, t.Any]:
+        """Load a registered schema.
+
+        Raises:
+            KeyError: When the schema is not registered.
+        """
+        if path not in self._documents:
+            if path not in self.schemas:
+                raise KeyError(f'JSONSchema "{path}" not found')
+            with open(os.path.join(self.schemas[path], path)) as fd:
+                self._documents[path] = json.load(fd)
+        return self._documents[path]
+
+    def _retrieve(self, uri: str):
+        path = self.url_to_path(uri)
+        if path is None:
+            raise NoSuchResource(ref=uri)
+        return Resource.from_contents(self.get_schema(path), default_specification=DRAFT7)
+
+    def _resolve_remote(self, uri: str):  # pragma: no cover - jsonschema < 4.18
+        path = self.url_to_path(uri)
+        if path is None:
+            raise jsonschema.RefResolutionError(f'Reference "{uri}" is not a registered schema')
+        return self.get_schema(path)
+
+    def validator(self, schema_key: str, draft_checker=None):
+        """Build the JSONSchema validator of a registered schema.
+
+        The ``$ref`` are resolved with the registered schemas only, no schema is fetched from network.
+        Without ``draft_checker``, the validator is kept for the next calls.
+        """
+        if draft_checker is None and schema_key in self._validators:
+            return self._validators[schema_key]
+
+        schema = dict(self.get_schema(schema_key))
+        # Relative ids and refs are resolved against the schema URL in JSONSCHEMAS_HOST
+        schema['$id'] = urljoin(self.schema_url(schema_key), schema.get('$id', ''))
+
+        validator_cls = jsonschema.validators.validator_for(schema)
+        validator_cls.check_schema(schema)
+        format_checker = draft_checker or jsonschema.FormatChecker()
+
+        if Registry is not None:
+            validator = validator_cls(schema, format_checker=format_checker,
+                                      registry=Registry(retrieve=self._retrieve))
+        else:  # pragma: no cover - jsonschema < 4.18
+            handlers = dict(http=self._resolve_remote, https=self._resolve_remote)
+            resolver = jsonschema.RefResolver.from_schema(schema, handlers=handlers)
+            validator = validator_cls(schema, format_checker=format_checker, resolver=resolver)
+
+        if draft_checker is None:
+            self._validators[schema_key] = validator
+        return validator
+
+    def validate(self, schema_key: str, value: t.Any, draft_checker=None) -> t.Any:
+        """Validate a value against a registered schema.
+
+        Raises:
+            jsonschema.ValidationError: When the value does not match with the schema.
+        """
+        self.validator(schema_key, draft_checker).validate(value)
+        return value
+
+    def validate_many(self, schema_key: str, values: t.Iterable[t.Any], draft_checker=None) -> t.List[t.Any]:
+        """Validate a batch of values against a registered schema, skipping ``None`` values."""
+        validator = self.validator(schema_key, draft_checker)
+        values = list(values)
+        for value in values:
+            if value is not None:
+                validator.validate(value)
+        return values
+
+    def __getstate__(self) -> t.Dict[str, t.Any]:
+        """Pickle the registry without the validators, which are rebuilt on demand."""
+        state = self.__dict__.copy()
+        state['_validators'] = dict()
+        return state
+
+
+_default_registry: t.Optional[SchemaRegistry] = None
+
+
+def get_default_registry() -> SchemaRegistry:
+    """Retrieve the registry used by :func:`~bdc_db.utils.validate_schema` outside an application context.
+
+    It is the registry of the last initialized :class:`~bdc_db.ext.BrazilDataCubeDB` or, when none,
+    a registry loaded from the entry point ``bdc.schemas`` on first use.
+    """
+    global _default_registry
+    if _default_registry is None:
+        _default_registry = SchemaRegistry.from_entry_points()
+    return _default_registry
+
+
+def set_default_registry(registry: t.Optional[SchemaRegistry]):
+    """Set the registry used outside an application context, like in a worker process initializer."""
+    global _default_registry
+    _default_registry = registry
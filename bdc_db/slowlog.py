@@ -0,0 +1,302 @@
+#
+# This file is part of BDC-DB.
+# Copyright (C) 2023 INPE.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/gpl-3.0.html>.
+#
+
+"""Capture the slow statements executed by an engine, with their code location and plan.
+
+.. versionadded:: 0.9.0
+"""
+
+import datetime
+import json
+import os
+import socket
+import threading
+import time
+import traceback
+import typing as t
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+import flask_sqlalchemy
+import sqlalchemy
+from flask import Blueprint, jsonify
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import NullPool
+
+EXPLAIN_PREFIXES = ('select', 'with', 'insert', 'update', 'delete')
+"""The statements which support ``EXPLAIN``."""
+
+RECORD_FILE_PATTERN = 'slow-queries-*.jsonl'
+"""The pattern of the record files written by each process in the directory ``BDC_DB_SLOW_QUERY_DIR``."""
+
+_IGNORED_PATHS = (
+    os.path.dirname(sqlalchemy.__file__) + os.sep,
+    os.path.dirname(flask_sqlalchemy.__file__) + os.sep,
+    __file__,
+)
+
+
+@dataclass
+class SlowQuery:
+    """Represent a statement which took longer than the threshold."""
+
+    statement: str
+    parameters: t.Any
+    duration: float
+    location: str
+    stack: t.List[str] = field(default_factory=list)
+    plan: t.Any = None
+    explain_error: t.Optional[str] = None
+    timestamp: str = field(default_factory=lambda: datetime.datetime.now(datetime.timezone.utc).isoformat())
+
+
+def redact(parameters: t.Any) -> t.Any:
+    """Replace the parameter values by their types, like ``<str>``, keeping the structure and the ``None`` values."""
+    if isinstance(parameters, dict):
+        return {key: redact(value) for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [redact(value) for value in parameters]
+    return None if parameters is None else f'<{type(parameters).__name__}>'
+
+
+def _printable(parameters: t.Any, limit: int = 200) -> t.Any:
+    if isinstance(parameters, dict):
+        return {key: _printable(value, limit) for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [_printable(value, limit) for value in parameters]
+    if parameters is None or isinstance(parameters, (bool, int, float)):
+        return parameters
+    text = str(parameters)
+    return text if len(text) <= limit else f'{text[:limit]}...'
+
+
+def caller_frames(limit: int = 5, ignored: t.Tuple[str, ...] = ()) -> t.List[traceback.FrameSummary]:
+    """Retrieve the innermost frames outside SQLAlchemy and Flask-SQLAlchemy, innermost first.
+
+    Args:
+        limit: The maximum number of frames.
+        ignored: Extra file paths (or directory prefixes) to skip, like the module calling this function.
+    """
+    prefixes = _IGNORED_PATHS + tuple(ignored)
+    frames = [frame for frame in traceback.extract_stack() if not frame.filename.startswith(prefixes)]
+    return frames[-limit:][::-1]
+
+
+def caller_stack(limit: int = 5, ignored: t.Tuple[str, ...] = ()) -> t.List[str]:
+    """Retrieve the innermost frames outside SQLAlchemy and Flask-SQLAlchemy, as ``file:line in function``."""
+    return [f'{frame.filename}:{frame.lineno} in {frame.name}' for frame in caller_frames(limit, ignored)]
+
+
+class SlowQueryLog:
+    """Time the statements of an engine and keep the slow ones in a bounded ring buffer.
+
+    Examples:
+        .. code-block:: python
+
+            from bdc_db.db import db
+            from bdc_db.slowlog import SlowQueryLog
+
+            slow_queries = SlowQueryLog(threshold=0.2, explain=True)
+            slow_queries.install(db.engine)
+
+            for record in slow_queries.records():
+                print(record.duration, record.location, record.statement)
+
+    Args:
+        threshold: The minimum duration in seconds of a recorded statement.
+        explain: Capture the ``EXPLAIN (FORMAT JSON)`` of the statement on a separate connection.
+        maxsize: The number of statements kept (the oldest are discarded).
+        redact_parameters: Keep only the types of the parameters.
+        directory: Append each record to a file of this process in the directory, read by ``db slow-queries``.
+        explain_timeout: The lock and statement timeout in seconds of the ``EXPLAIN``.
+    """
+
+    def __init__(self, threshold: float = 0.5, explain: bool = False, maxsize: int = 100,
+                 redact_parameters: bool = True, directory: t.Optional[t.Union[str, Path]] = None,
+                 explain_timeout: float = 1.0):
+        """Build a new slow query log."""
+        self.threshold = threshold
+        self.explain = explain
+        self.redact_parameters = redact_parameters
+        self.directory = directory
+        self.explain_timeout = explain_timeout
+        self.engine: t.Optional[Engine] = None
+        self._explain_engine: t.Optional[Engine] = None
+        self._records: t.Deque[SlowQuery] = deque(maxlen=maxsize)
+        self._lock = threading.Lock()
+
+    @property
+    def path(self) -> t.Optional[Path]:
+        """Retrieve the record file of the current process, when a directory is set."""
+        if self.directory is None:
+            return None
+        return Path(self.directory) / RECORD_FILE_PATTERN.replace('*', f'{socket.gethostname()}-{os.getpid()}')
+
+    def install(self, engine: Engine):
+        """Listen the statements executed by an engine."""
+        self.engine = engine
+        if self.explain:
+            # The plans use their own connections, so they never wait for a connection of the engine pool
+            self._explain_engine = create_engine(engine.url, poolclass=NullPool)
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def uninstall(self):
+        """Stop listening the engine."""
+        if self.engine is None:
+            return
+        event.remove(self.engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.remove(self.engine, 'after_cursor_execute', self._after_cursor_execute)
+        if self._explain_engine is not None:
+            self._explain_engine.dispose()
+            self._explain_engine = None
+        self.engine = None
+
+    def records(self) -> t.List[SlowQuery]:
+        """List the recorded statements, the slowest first."""
+        with self._lock:
+            return sorted(self._records, key=lambda record: record.duration, reverse=True)
+
+    def clear(self):
+        """Remove all records kept in memory. The record files are kept, see :func:`~bdc_db.slowlog.clear_records`."""
+        with self._lock:
+            self._records.clear()
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        context._bdc_slowlog_start = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, '_bdc_slowlog_start', None)
+        duration = time.perf_counter() - start if start is not None else 0.0
+        if duration < self.threshold:
+            return
+
+        stack = caller_stack()
+        record = SlowQuery(
+            statement=statement,
+            parameters=redact(parameters) if self.redact_parameters else _printable(parameters),
+            duration=duration,
+            location=stack[0] if stack else '',
+            stack=stack,
+        )
+        if self._explain_engine is not None and not executemany and \
+                statement.lstrip().lower().startswith(EXPLAIN_PREFIXES):
+            self._explain(record, statement, parameters)
+
+        with self._lock:
+            self._records.append(record)
+            if self.directory is not None:
+                append_record(record, self.path)
+
+    def _explain(self, record: SlowQuery, statement: str, parameters: t.Any):
+        """Retrieve the plan on a separate DBAPI connection, so the statement events are not triggered again.
+
+        The timeouts avoid waiting forever for a lock held by the transaction which ran the statement.
+        """
+        connection = self._explain_engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            timeout = max(int(self.explain_timeout * 1000), 1)
+            cursor.execute(f'SET lock_timeout = {timeout}')
+            cursor.execute(f'SET statement_timeout = {timeout}')
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {statement}', parameters)
+            plan = cursor.fetchone()[0]
+            record.plan = json.loads(plan) if isinstance(plan, str) else plan
+            connection.rollback()
+        except Exception as e:
+            record.explain_error = str(e)
+        finally:
+            connection.close()
+
+
+def append_record(record: SlowQuery, path: t.Union[str, Path]):
+    """Append a record to a JSON lines file.
+
+    The file is created readable only by the current user and it is never followed
+    when it is a symbolic link.
+    """
+    flags = os.O_WRONLY | os.O_APPEND | getattr(os, 'O_NOFOLLOW', 0)
+    Path(path).parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+    try:
+        fd = os.open(path, flags)
+    except FileNotFoundError:
+        fd = os.open(path, flags | os.O_CREAT | os.O_EXCL, 0o600)
+
+    with os.fdopen(fd, 'a') as f:
+        f.write(json.dumps(asdict(record), default=str) + '\n')
+
+
+def load_records(path: t.Union[str, Path]) -> t.List[SlowQuery]:
+    """Read the records written by :class:`~bdc_db.slowlog.SlowQueryLog` into a file or the files of a directory."""
+    path = Path(path)
+    files = sorted(path.glob(RECORD_FILE_PATTERN)) if path.is_dir() else [path]
+
+    records = []
+    for file in files:
+        with open(file) as f:
+            records.extend(SlowQuery(**json.loads(line)) for line in f if line.strip())
+    return records
+
+
+def clear_records(directory: t.Union[str, Path]) -> int:
+    """Remove the record files of all processes in a directory.
+
+    Returns:
+        The number of removed files.
+    """
+    files = list(Path(directory).glob(RECORD_FILE_PATTERN))
+    for file in files:
+        file.unlink()
+    return len(files)
+
+
+def create_blueprint(slow_queries: SlowQueryLog, guard: t.Callable[[], t.Any]) -> Blueprint:
+    """Create a blueprint which lists the slow statements as JSON (``GET /``) and clears them (``DELETE /``).
+
+    The records expose the SQL statements of the application, so every request passes
+    through the ``guard`` first (``before_request``). It must return a response, like
+    ``abort(403)``, to deny the request, or ``None`` to allow it.
+
+    Examples:
+        .. code-block:: python
+
+            def admin_only():
+                if not current_user.is_admin:
+                    abort(403)
+
+            app.register_blueprint(create_blueprint(slow_queries, admin_only), url_prefix='/_db/slow-queries')
+
+    Args:
+        slow_queries: The slow query log.
+        guard: The function called before each request.
+    """
+    blueprint = Blueprint('bdc_db_slow_queries', __name__)
+    blueprint.before_request(guard)
+
+    @blueprint.route('/', methods=['GET'])
+    def list_slow_queries():
+        return jsonify([asdict(record) for record in slow_queries.records()])
+
+    @blueprint.route('/', methods=['DELETE'])
+    def clear_slow_queries():
+        slow_queries.clear()
+        return '', 204
+
+    return blueprint
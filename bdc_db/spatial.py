@@ -0,0 +1,318 @@
+#
+# This file is part of BDC-DB.
+# Copyright (C) 2023 INPE.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/gpl-3.0.html>.
+#
+
+"""Spatial clustering and index maintenance of the geometry tables.
+
+.. versionadded:: 0.9.0
+"""
+
+import statistics
+import time
+import typing as t
+from dataclasses import dataclass, field
+
+from sqlalchemy import Column, Date, DateTime, MetaData, Table, text
+from sqlalchemy.engine import Engine
+
+from .indexes import (compile_create_index, create_index_concurrently,
+                      missing_indexes)
+from .sqltypes import Geometry
+from .utils import execute
+
+ORDERS = ('spatial', 'time')
+"""The physical orders of :func:`~bdc_db.spatial.spatial_optimize`. ``time`` orders by time then geohash."""
+
+GEOHASH_PRECISION = 10
+"""The number of geohash characters used to sort the geometries (about one meter)."""
+
+
+@dataclass
+class LatencyStats:
+    """Represent the latency in milliseconds of a sample workload."""
+
+    queries: int = 0
+    median: float = 0.0
+    p95: float = 0.0
+
+
+@dataclass
+class SpatialOptimizeResult:
+    """Represent the optimization of a geometry table."""
+
+    table: str
+    column: str
+    statements: t.List[str] = field(default_factory=list)
+    before: t.Optional[LatencyStats] = None
+    after: t.Optional[LatencyStats] = None
+    elapsed: float = 0.0
+    error: t.Optional[str] = None
+
+    @property
+    def speedup(self) -> t.Optional[float]:
+        """Retrieve the ratio between the median latency before and after."""
+        if self.before is None or self.after is None or not self.after.median:
+            return None
+        return self.before.median / self.after.median
+
+
+def geometry_columns(metadata: MetaData, tables: t.Optional[t.Iterable[Table]] = None) -> t.List[Column]:
+    """List the :class:`~bdc_db.sqltypes.Geometry` columns declared in metadata.
+
+    Args:
+        metadata: The SQLAlchemy metadata (usually ``db.metadata``).
+        tables: Restrict to the given tables.
+    """
+    selected = set(tables) if tables is not None else None
+    return [
+        column
+        for table in metadata.sorted_tables if selected is None or table in selected
+        for column in table.columns if isinstance(column.type, Geometry)
+    ]
+
+
+def time_columns(table: Table) -> t.List[Column]:
+    """List the date and timestamp columns of a table."""
+    return [column for column in table.columns if isinstance(column.type, (Date, DateTime))]
+
+
+def has_postgis(executor) -> bool:
+    """Check if the PostGIS extension is installed in database.
+
+    Args:
+        executor: The SQLAlchemy engine or connection.
+    """
+    return execute("SELECT count(*) FROM pg_extension WHERE extname = 'postgis'", executor).scalar() > 0
+
+
+def _index_name(table: Table, column: Column, suffix: str) -> str:
+    prefix = f'idx_{table.schema}_{table.name}' if table.schema else f'idx_{table.name}'
+    return f'{prefix}_{column.name}_{suffix}'[:63]
+
+
+def geohash_expression(column: Column, preparer) -> t.Optional[str]:
+    """Build the SQL expression which sorts the geometries of a column along the geohash (Z-order) curve.
+
+    The geohash requires longitude and latitude, so the centroids are transformed to ``EPSG:4326``.
+
+    Returns:
+        The SQL expression or ``None`` when the column SRID is unknown (``0``).
+    """
+    srid = column.type.srid
+    if srid <= 0:
+        return None
+
+    name = preparer.quote(column.name)
+    centroid = f'ST_Centroid({name})' if srid == 4326 else f'ST_Transform(ST_Centroid({name}), 4326)'
+    return f'(CASE WHEN ST_IsEmpty({name}) THEN NULL ELSE ST_GeoHash({centroid}, {GEOHASH_PRECISION}) END)'
+
+
+def _drop_order_index(column: Column, dialect) -> str:
+    preparer = dialect.identifier_preparer
+    schema = f'{preparer.quote_schema(column.table.schema)}.' if column.table.schema else ''
+    return f'DROP INDEX IF EXISTS {schema}{preparer.quote(_index_name(column.table, column, "order"))}'
+
+
+def optimize_statements(column: Column, dialect, order: str = 'spatial', cluster: bool = True,
+                        brin: bool = True) -> t.List[str]:
+    """Build the statements which cluster a table by a geometry column.
+
+    The table is rewritten by ``CLUSTER`` using a temporary B-tree index over the geohash
+    of the geometries (and the first time column with ``order='time'``), followed by ``ANALYZE``.
+
+    Args:
+        column: The geometry column.
+        dialect: The SQLAlchemy dialect.
+        order: ``spatial`` or ``time``.
+        cluster: Rewrite the table in the given order.
+        brin: Create the BRIN indexes of the time columns.
+
+    Raises:
+        ValueError: When the order is invalid or requires a missing time column.
+    """
+    if order not in ORDERS:
+        raise ValueError(f'Invalid order "{order}". Expected one of {ORDERS}')
+
+    table = column.table
+    preparer = dialect.identifier_preparer
+    table_name = preparer.format_table(table)
+    dates = time_columns(table)
+
+    statements = []
+    if brin:
+        for date_column in dates:
+            name = preparer.quote(_index_name(table, date_column, 'brin'))
+            statements.append(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table_name} '
+                              f'USING brin ({preparer.quote(date_column.name)})')
+
+    expression = geohash_expression(column, preparer)
+    if not cluster or expression is None:
+        return statements
+
+    keys = [expression]
+    if order == 'time':
+        if not dates:
+            raise ValueError(f'Table "{table.fullname}" has no time column to order by')
+        keys.insert(0, preparer.quote(dates[0].name))
+
+    name = preparer.quote(_index_name(table, column, 'order'))
+    statements.extend([
+        f'CREATE INDEX IF NOT EXISTS {name} ON {table_name} ({", ".join(keys)})',
+        f'CLUSTER {table_name} USING {name}',
+        _drop_order_index(column, dialect),
+        f'ANALYZE {table_name}',
+    ])
+    return statements
+
+
+def sample_boxes(column: Column, executor, samples: int = 20) -> t.List[bytes]:
+    """Sample the bounding boxes of random geometries of a column as EWKB, used as the query workload.
+
+    Args:
+        column: The geometry column.
+        executor: The SQLAlchemy engine or connection.
+        samples: The number of boxes.
+    """
+    preparer = executor.dialect.identifier_preparer
+    name = preparer.quote(column.name)
+    rows = execute(
+        f'SELECT ST_AsEWKB(ST_Envelope({name})) AS box FROM {preparer.format_table(column.table)} '
+        f' WHERE {name} IS NOT NULL ORDER BY random() LIMIT :samples',
+        executor,
+        dict(samples=samples)
+    )
+    return [bytes(row.box) for row in rows]
+
+
+def measure_latency(column: Column, engine: Engine, boxes: t.Sequence[bytes], repeat: int = 3) -> LatencyStats:
+    """Measure the latency of bounding box queries (``&&``) over a geometry column.
+
+    Each box is queried ``repeat`` times after a warm up run and the fastest run is kept.
+
+    Args:
+        column: The geometry column.
+        engine: The SQLAlchemy active database engine.
+        boxes: The query boxes as EWKB, like :func:`~bdc_db.spatial.sample_boxes`.
+        repeat: The number of runs of each query.
+    """
+    preparer = engine.dialect.identifier_preparer
+    statement = text(f'SELECT count(*) FROM {preparer.format_table(column.table)} '
+                     f' WHERE {preparer.quote(column.name)} && ST_GeomFromEWKB(:box)')
+
+    latencies = []
+    with engine.connect() as conn:
+        for box in boxes:
+            conn.execute(statement, dict(box=box))
+            runs = []
+            for _ in range(max(repeat, 1)):
+                start = time.perf_counter()
+                conn.execute(statement, dict(box=box)).scalar()
+                runs.append((time.perf_counter() - start) * 1000)
+            latencies.append(min(runs))
+
+    if not latencies:
+        return LatencyStats()
+
+    latencies.sort()
+    return LatencyStats(len(latencies), statistics.median(latencies),
+                        latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))])
+
+
+def spatial_optimize(columns: t.Sequence[Column], engine: Engine, order: str = 'spatial', cluster: bool = True,
+                     brin: bool = True, samples: int = 20,
+                     on_result: t.Optional[t.Callable[[SpatialOptimizeResult], None]] = None
+                     ) -> t.List[SpatialOptimizeResult]:
+    """Optimize the geometry tables for spatial range queries.
+
+    For each table, it creates the missing spatial indexes declared in metadata (GiST or SP-GiST)
+    and the BRIN indexes of the time columns without blocking the writes, then rewrites the table
+    along the geohash curve of its first geometry column with ``CLUSTER``. The latency of
+    ``samples`` bounding box queries is measured before and after.
+
+    Note:
+        ``CLUSTER`` holds an ``ACCESS EXCLUSIVE`` lock on the table while it is rewritten. Run it
+        in a maintenance window or use ``cluster=False`` to only create the indexes.
+
+    Examples:
+        .. code-block:: python
+
+            from bdc_db.db import db
+            from bdc_db.spatial import geometry_columns, spatial_optimize
+
+            for result in spatial_optimize(geometry_columns(db.metadata), db.engine):
+                print(result.table, result.before.median, result.after.median)
+
+    Args:
+        columns: The geometry columns, like :func:`~bdc_db.spatial.geometry_columns`.
+        engine: The SQLAlchemy active database engine.
+        order: ``spatial`` (geohash) or ``time`` (first time column, then geohash).
+        cluster: Rewrite the tables in the given order.
+        brin: Create the BRIN indexes of the time columns.
+        samples: The number of bounding box queries of the workload. Use ``0`` to skip the measures.
+        on_result: Callback called with the result of each table once finished.
+
+    Raises:
+        RuntimeError: When PostGIS is not installed.
+
+    Returns:
+        The result of each table.
+    """
+    if not has_postgis(engine):
+        raise RuntimeError('The PostGIS extension is not installed in database')
+
+    per_table: t.Dict[Table, t.List[Column]] = dict()
+    for column in columns:
+        per_table.setdefault(column.table, list()).append(column)
+
+    results = []
+    for table, table_columns in per_table.items():
+        column = table_columns[0]
+        result = SpatialOptimizeResult(table.fullname, column.name)
+        start = time.perf_counter()
+        try:
+            boxes = sample_boxes(column, engine, samples) if samples else []
+            if boxes:
+                result.before = measure_latency(column, engine, boxes)
+
+            for index in missing_indexes(table.metadata, engine):
+                if index.table is table:
+                    create_index_concurrently(index, engine)
+                    result.statements.append(compile_create_index(index, engine.dialect))
+
+            statements = optimize_statements(column, engine.dialect, order, cluster, brin)
+            drop_order = _drop_order_index(column, engine.dialect)
+            with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+                try:
+                    for statement in statements:
+                        execute(statement, conn)
+                        result.statements.append(statement)
+                finally:
+                    # Do not leave the temporary order index behind when CLUSTER fails
+                    if drop_order in statements and drop_order not in result.statements:
+                        execute(drop_order, conn)
+
+            if boxes:
+                result.after = measure_latency(column, engine, boxes)
+        except Exception as e:
+            result.error = str(e)
+        result.elapsed = time.perf_counter() - start
+
+        if on_result is not None:
+            on_result(result)
+        results.append(result)
+
+    return results
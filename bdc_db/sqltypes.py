@@ -19,12 +19,70 @@
 
 """Represent the custom data types for BDC-Catalog."""
 
-from typing import Any
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple, Union
 
-from sqlalchemy import TypeDecorator
+from sqlalchemy import (ARRAY, Column, Computed, Index, Text, TypeDecorator,
+                        bindparam, cast, event, func, inspect)
 from sqlalchemy.dialects.postgresql import JSONB as _JSONB
+from sqlalchemy.dialects.postgresql import array as pg_array
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.mutable import Mutable
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.sql import ClauseElement, Insert, Update
+from sqlalchemy.sql.base import SchemaEventTarget
+from sqlalchemy.types import UserDefinedType, to_instance
 
-from .utils import validate_schema
+from .utils import validate_schema, validate_schema_many
+
+try:
+    import numpy
+    import shapely
+except ImportError:  # pragma: no cover
+    numpy = shapely = None
+
+SPATIAL_INDEX_METHODS = ('gist', 'spgist', 'brin')
+"""The index methods supported by :class:`~bdc_db.sqltypes.Geometry` columns."""
+
+
+@dataclass(frozen=True)
+class JSONBPath:
+    """Declare a path inside a JSONB document to be indexed or extracted as a generated column.
+
+    .. versionadded:: 0.9.0
+
+    Args:
+        path: The document key or a tuple with the nested keys, like ``('eo:bands', 'name')``.
+        type_: Cast the extracted text value to this type (it must be an immutable cast, like numbers).
+            Defaults to keep the text value.
+    """
+
+    path: Union[str, Tuple[str, ...]]
+    type_: Any = None
+
+    @property
+    def keys(self) -> Tuple[str, ...]:
+        """Retrieve the path as a tuple of keys."""
+        return (self.path, ) if isinstance(self.path, str) else tuple(self.path)
+
+    @property
+    def slug(self) -> str:
+        """Represent the path as a valid identifier suffix."""
+        return re.sub(r'\W+', '_', '_'.join(self.keys)).strip('_').lower()
+
+    def expression(self, column: Column):
+        """Build the SQL expression which extracts the path value from a column."""
+        keys = self.keys
+        expression = (column[keys[0]] if len(keys) == 1 else column[keys]).astext
+        if self.type_ is not None:
+            expression = cast(expression, to_instance(self.type_))
+        return expression
+
+
+def _as_path(value: Union[str, Tuple[str, ...], JSONBPath]) -> JSONBPath:
+    return value if isinstance(value, JSONBPath) else JSONBPath(value)
 
 
 class JSONB(TypeDecorator):
@@ -81,6 +139,21 @@ class JSONB(TypeDecorator):
             >>> c.properties = {"mykey": 102}
             >>> db.session.commit()  # Error
 
+        The way the column is queried may be declared as well. The following column creates a ``GIN``
+        index for containment queries (``@>``), a btree index over the ``mykey`` value as number and
+        a stored generated column ``mykey_value`` extracted from the document:
+
+        .. doctest::
+            :skipIf: True
+
+            >>> from bdc_db.sqltypes import JSONBPath
+            >>> properties = db.Column(JSONB('myapp/myschema.json', gin='jsonb_path_ops',
+            ...                              btree=[JSONBPath('mykey', db.Float)],
+            ...                              generated={'mykey_value': JSONBPath('mykey', db.Float)}))
+
+        These declarations are regular SQLAlchemy indexes and computed columns of the table, which are
+        created by ``create-schema`` and detected by Alembic autogenerate.
+
     .. seealso::
 
         `sqlalchemy.dialects.postgresql.JSONB <https://docs.sqlalchemy.org/en/14/dialects/postgresql.html#sqlalchemy.dialects.postgresql.JSONB>`_
@@ -90,17 +163,89 @@ class JSONB(TypeDecorator):
     """Keep the JSONSchema relative file path."""
     _draft_checker: Any
     """The JSONSchema draft checker model version."""
+    gin: Optional[str]
+    """The operator class of the ``GIN`` index."""
+    btree: Tuple['JSONBPath', ...]
+    """The paths of the btree expression indexes."""
+    generated: Tuple[Tuple[str, 'JSONBPath'], ...]
+    """The name and path of the stored generated columns."""
+    deferred: Optional[bool]
+    """Load the column on first access. When ``None``, it is deferred unless the extension configuration disables it."""
     impl = _JSONB
     """Set the SQLAlchemy Data Type to manage this custom type."""
     cache_ok = True
-    """Enable cache context for JSONB type. It also removes SQLAlchemy Warnings."""
+    """Enable cache context for JSONB type. It also removes SQLAlchemy Warnings.
+
+    The keyword-only ``gin``, ``btree`` and ``generated`` are not part of the SQLAlchemy cache key.
+    They only declare the indexes and generated columns of the table, which do not change the
+    compiled statements of the column.
+    """
+
+    def __init__(self, schema: str, draft_checker=None, *args, gin: Optional[str] = None,
+                 btree: Iterable[Union[str, Tuple[str, ...], JSONBPath]] = (),
+                 generated: Optional[Dict[str, Union[str, Tuple[str, ...], JSONBPath]]] = None,
+                 deferred: Optional[bool] = None, **kwargs):
+        """Build a new data type.
+
+        Args:
+            schema: The JSONSchema relative file path.
+            draft_checker: The JSONSchema format checker.
+            gin: Create a ``GIN`` index with the operator class ``jsonb_ops`` or ``jsonb_path_ops``.
+            btree: Create a btree expression index for each path.
+            generated: Map of column name and path to be extracted as stored generated columns.
+            deferred: Load the column only on first access, whatever the extension config.
+                Defaults to the extension config ``BDC_DB_DEFER_LARGE_COLUMNS`` (group ``bdc_large``).
+        """
+        if gin not in (None, 'jsonb_ops', 'jsonb_path_ops'):
+            raise ValueError(f'Invalid GIN operator class "{gin}"')
 
-    def __init__(self, schema: str, draft_checker=None, *args, **kwargs):
-        """Build a new data type."""
         self._schema_key = schema
         self._draft_checker = draft_checker
+        self.gin = gin
+        self.btree = tuple(_as_path(path) for path in btree)
+        self.generated = tuple((name, _as_path(path)) for name, path in (generated or dict()).items())
+        self._copied = False
+        self.deferred = deferred
         super().__init__(*args, **kwargs)
 
+    def _set_parent(self, column, **kw):
+        """Support SchemaEventTarget to declare the indexes once the column is attached to a table."""
+        super()._set_parent(column, **kw)
+
+        if (self.gin or self.btree or self.generated) and not self._copied:
+            column._on_table_attach(self._set_table)
+
+    def copy(self, **kw):
+        """Copy the type for a column copy, which does not declare the indexes and generated columns again."""
+        instance = super().copy(**kw)
+        instance._copied = True
+        return instance
+
+    def _set_table(self, column, table):
+        """Add the declared indexes and generated columns into the table.
+
+        Note:
+            It runs for each table which declares the column, even when they share the type instance.
+            The column copies made by Alembic or ``Table.to_metadata`` carry theirs own indexes and
+            generated columns.
+        """
+        prefix = f'idx_{table.schema}_{table.name}_{column.name}' if table.schema else \
+            f'idx_{table.name}_{column.name}'
+        index_names = {index.name for index in table.indexes}
+
+        if self.gin and f'{prefix}_gin' not in index_names:
+            Index(f'{prefix}_gin', column, postgresql_using='gin', postgresql_ops={column.name: self.gin})
+
+        for path in self.btree:
+            name = f'{prefix}_{path.slug}'[:63]
+            if name not in index_names:
+                Index(name, path.expression(column))
+
+        for name, path in self.generated:
+            if name not in table.c:
+                table.append_column(Column(name, to_instance(path.type_ or Text), Computed(path.expression(column),
+                                                                                   persisted=True)))
+
     def coerce_compared_value(self, op, value):
         """Define a 'coerced' Python value in an expression.
 
@@ -109,10 +254,11 @@ class JSONB(TypeDecorator):
         """
         return self.impl.coerce_compared_value(op, value)
 
-    def process_bind_param(self, value, dialect):
-        """Apply JSONSchema validation and bind the JSON value to the SQLAlchemy Engine execution.
+    def validate(self, value):
+        """Validate a JSON value against the column JSONSchema.
 
-        TODO: Use native SQLAlchemy ValidatorError when an error occurs.
+        Raises:
+            jsonschema.ValidationError: When the value does not match with expected schema.
         """
         options = dict()
         if self._draft_checker:
@@ -121,3 +267,442 @@ class JSONB(TypeDecorator):
             validate_schema(self._schema_key, value, **options)
 
         return value
+
+    def process_bind_batch(self, values):
+        """Validate a batch of JSON values at once, used by :func:`~bdc_db.utils.bulk_upsert`.
+
+        .. versionadded:: 0.9.0
+        """
+        options = dict()
+        if self._draft_checker:
+            options['draft_checker'] = self._draft_checker
+
+        return validate_schema_many(self._schema_key, values, **options)
+
+    def process_bind_param(self, value, dialect):
+        """Apply JSONSchema validation and bind the JSON value to the SQLAlchemy Engine execution.
+
+        TODO: Use native SQLAlchemy ValidatorError when an error occurs.
+        """
+        return self.validate(value)
+
+
+class MutableJSONB(Mutable, dict):
+    """Represent a JSONB document which tracks the changes made in place.
+
+    Instead of rewriting the whole document, the tracked changes are flushed as partial
+    updates using ``jsonb_set``, ``#-`` and ``||``. The JSONSchema validation runs once
+    for the merged document on flush.
+
+    .. versionadded:: 0.9.0
+
+    Note:
+        Only the changes made through this object are tracked: set or delete a key,
+        :meth:`update`, :meth:`set_path` and :meth:`delete_path`. Assigning a new document to
+        the attribute or calling :meth:`clear` falls back to a full document write.
+
+    Examples:
+        .. doctest::
+            :skipIf: True
+
+            >>> from bdc_db.sqltypes import JSONB, MutableJSONB
+            >>> class Collection(db.Model):
+            ...      id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+            ...      properties = db.Column(MutableJSONB.as_mutable(JSONB('myapp/myschema.json')))
+            >>> collection = Collection.query.get(1)
+            >>> collection.properties['mykey'] = 20
+            >>> collection.properties.set_path(('eo', 'cloud_cover'), 10)
+            >>> db.session.commit()  # UPDATE ... SET properties = jsonb_set(jsonb_set(properties, ...), ...)
+    """
+
+    _changes: List[Tuple[str, Tuple[str, ...], Any]]
+    """The ordered tracked changes: operation, path and value."""
+    _synced: bool = False
+    """Flag to indicate the document matches the database value (loaded or flushed)."""
+
+    def __init__(self, *args, **kwargs):
+        """Build a new tracked document."""
+        super().__init__(*args, **kwargs)
+        self._changes = []
+
+    @classmethod
+    def coerce(cls, key, value):
+        """Convert plain dictionaries to :class:`~bdc_db.sqltypes.MutableJSONB`."""
+        if isinstance(value, cls) or isinstance(value, ClauseElement):
+            return value
+        if isinstance(value, dict):
+            return cls(value)
+        return Mutable.coerce(key, value)
+
+    @classmethod
+    def _listen_on_attribute(cls, attribute, coerce, parent_cls):
+        """Mark the documents loaded from database as synced to enable partial updates."""
+        super()._listen_on_attribute(attribute, coerce, parent_cls)
+
+        if parent_cls is not attribute.class_:
+            return
+
+        key = attribute.key
+        _tracked_attributes.add((parent_cls, key))
+
+        def load(state, *args):
+            value = state.dict.get(key)
+            if isinstance(value, cls):
+                value._mark_synced()
+
+        def load_attrs(state, context, attrs):
+            if not attrs or key in attrs:
+                load(state)
+
+        event.listen(parent_cls, 'load', load, raw=True, propagate=True)
+        event.listen(parent_cls, 'refresh', load_attrs, raw=True, propagate=True)
+        event.listen(parent_cls, 'refresh_flush', load_attrs, raw=True, propagate=True)
+
+    def _mark_synced(self):
+        self._changes = []
+        self._synced = True
+
+    def _track(self, operation: str, path: Tuple[str, ...], value: Any = None):
+        if self._synced:
+            self._changes.append((operation, path, value))
+        self.changed()
+
+    def __setitem__(self, key, value):
+        """Set a document key and track the change."""
+        dict.__setitem__(self, key, value)
+        self._track('set', (key, ), value)
+
+    def __delitem__(self, key):
+        """Delete a document key and track the change."""
+        dict.__delitem__(self, key)
+        self._track('delete', (key, ))
+
+    def setdefault(self, key, value=None):
+        """Set the key value when it is not defined yet."""
+        if key not in self:
+            self[key] = value
+        return self[key]
+
+    def update(self, *args, **kwargs):
+        """Merge the given values into document using the operator ``||``."""
+        values = dict(*args, **kwargs)
+        dict.update(self, values)
+        self._track('merge', (), values)
+
+    def pop(self, key, *args):
+        """Remove the key and return its value."""
+        exists = key in self
+        result = dict.pop(self, key, *args)
+        if exists:
+            self._track('delete', (key, ))
+        return result
+
+    def popitem(self):
+        """Remove and return the last document item."""
+        key, value = dict.popitem(self)
+        self._track('delete', (key, ))
+        return key, value
+
+    def clear(self):
+        """Remove all the keys (It rewrites the whole document)."""
+        dict.clear(self)
+        self._synced = False
+        self._changes = []
+        self.changed()
+
+    def set_path(self, path: Tuple[str, ...], value: Any):
+        """Set a nested value, creating the intermediate objects when required.
+
+        Args:
+            path: The nested keys, like ``('eo', 'cloud_cover')``.
+            value: The new value.
+        """
+        path = tuple(path)
+        target = self
+        for position, key in enumerate(path[:-1]):
+            if not isinstance(target.get(key), dict):
+                # Create the whole missing subtree at once since jsonb_set does not create parents
+                subtree = value
+                for missing in reversed(path[position + 1:]):
+                    subtree = {missing: subtree}
+                dict.__setitem__(target, key, subtree)
+                self._track('set', path[:position + 1], subtree)
+                return
+            target = target[key]
+
+        dict.__setitem__(target, path[-1], value)
+        self._track('set', path, value)
+
+    def delete_path(self, path: Tuple[str, ...]):
+        """Delete a nested value.
+
+        Args:
+            path: The nested keys, like ``('eo', 'cloud_cover')``.
+        """
+        path = tuple(path)
+        target = self
+        for key in path[:-1]:
+            target = target[key]
+        dict.__delitem__(target, path[-1])
+        self._track('delete', path)
+
+    def to_expression(self, column):
+        """Build the SQL expression which applies the tracked changes over a column."""
+        expression = func.coalesce(column, cast('{}', _JSONB))
+
+        for operation, path, value in self._changes:
+            keys = cast(pg_array(list(path)), ARRAY(Text))
+            if operation == 'set':
+                expression = func.jsonb_set(expression, keys, bindparam(None, value, type_=_JSONB), True,
+                                            type_=_JSONB)
+            elif operation == 'delete':
+                expression = expression.op('#-', return_type=_JSONB)(keys)
+            else:
+                expression = expression.op('||', return_type=_JSONB)(bindparam(None, value, type_=_JSONB))
+
+        return expression
+
+    def __getstate__(self):
+        """Pickle the document values."""
+        return dict(self)
+
+    def __setstate__(self, state):
+        """Restore the document values."""
+        dict.update(self, state)
+        self._changes = []
+
+
+_tracked_attributes: Set[Tuple[type, str]] = set()
+"""The mapped attributes using :class:`~bdc_db.sqltypes.MutableJSONB`."""
+
+
+_PATCHES_KEY = 'bdc_jsonb_patches'
+
+
+def _restore_partial_updates(session):
+    """Put back the tracked documents replaced by update expressions of a flush which did not finish."""
+    for state, key, value in session.info.pop(_PATCHES_KEY, []):
+        if isinstance(state.dict.get(key), ClauseElement):
+            state.dict[key] = value
+
+
+@event.listens_for(Session, 'before_flush')
+def _prepare_partial_updates(session, flush_context, instances):
+    """Replace the tracked JSONB documents by partial update expressions."""
+    # Patches left by a failed flush would be written again
+    _restore_partial_updates(session)
+    patches = session.info.setdefault(_PATCHES_KEY, [])
+
+    try:
+        for instance in session.dirty:
+            state = inspect(instance)
+            for parent_cls, key in _tracked_attributes:
+                if not isinstance(instance, parent_cls) or key not in state.committed_state:
+                    continue
+
+                value = state.dict.get(key)
+                if not isinstance(value, MutableJSONB) or not value._synced or not value._changes:
+                    continue
+
+                column = state.mapper.columns[key]
+                if isinstance(column.type, JSONB):
+                    column.type.validate(value)
+
+                state.dict[key] = value.to_expression(column)
+                patches.append((state, key, value))
+    except Exception:
+        _restore_partial_updates(session)
+        raise
+
+
+@event.listens_for(Session, 'after_flush')
+def _finish_partial_updates(session, flush_context):
+    """Restore the merged documents once the partial updates were flushed."""
+    for state, key, value in session.info.pop(_PATCHES_KEY, []):
+        value._mark_synced()
+        set_committed_value(state.obj(), key, value)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_partial_updates(session, previous_transaction):
+    """Restore the tracked documents when the flush failed and the transaction was rolled back."""
+    _restore_partial_updates(session)
+
+
+def _require_shapely():
+    if shapely is None:  # pragma: no cover
+        raise ImportError('The Geometry type requires "shapely>=2". Install it with "pip install bdc-db[geo]"')
+
+
+class EWKB(bytes):
+    """Represent a geometry already encoded as EWKB (WKB with SRID) by :class:`~bdc_db.sqltypes.Geometry`.
+
+    .. versionadded:: 0.9.0
+    """
+
+
+class Geometry(SchemaEventTarget, UserDefinedType):
+    """Represent a PostGIS ``geometry`` column with SRID enforcement.
+
+    The values may be `shapely <https://shapely.readthedocs.io/>`_ geometries, WKT strings or WKB bytes and
+    are loaded as shapely geometries. The geometries are transferred as EWKB, encoded and decoded with the
+    vectorized shapely 2 functions for whole batches: in executemany statements (like ORM bulk inserts),
+    in :func:`~bdc_db.utils.bulk_upsert` and with :meth:`~bdc_db.sqltypes.Geometry.process_result_batch`.
+
+    A geometry without SRID gets the column SRID and a geometry with another SRID raises ``ValueError``.
+    It requires ``shapely>=2``, installed with the extra ``bdc-db[geo]``.
+
+    .. versionadded:: 0.9.0
+
+    Examples:
+        .. code-block:: python
+
+            from bdc_db.db import db
+            from bdc_db.sqltypes import Geometry
+
+
+            class Tile(db.Model):
+                id = db.Column(db.Integer, primary_key=True)
+                footprint = db.Column(Geometry('POLYGON', srid=4326))  # GiST index idx_tile_footprint_gist
+
+            db.session.execute(insert(Tile), [dict(id=i, footprint=polygon) for i, polygon in enumerate(polygons)])
+
+    Args:
+        geometry_type: The PostGIS geometry type, like ``POINT``, ``POLYGON`` or ``MULTIPOLYGON``.
+        srid: The spatial reference system. Use ``0`` to allow any SRID.
+        spatial_index: Create a spatial index with ``gist`` (default when ``True``), ``spgist`` or ``brin``.
+            Use ``False`` to skip it.
+    """
+
+    cache_ok = True
+    """Enable cache context for Geometry type."""
+
+    def __init__(self, geometry_type: str = 'GEOMETRY', srid: int = 4326, spatial_index: Union[bool, str] = True):
+        """Build a new geometry type."""
+        method = 'gist' if spatial_index is True else spatial_index or None
+        if method is not None and method not in SPATIAL_INDEX_METHODS:
+            raise ValueError(f'Invalid spatial index method "{spatial_index}". Expected one of {SPATIAL_INDEX_METHODS}')
+
+        self.geometry_type = geometry_type.upper()
+        self.srid = srid
+        self.spatial_index = spatial_index
+        self._copied = False
+
+    @property
+    def spatial_index_method(self) -> Optional[str]:
+        """Retrieve the method of the spatial index, if any."""
+        return 'gist' if self.spatial_index is True else self.spatial_index or None
+
+    def get_col_spec(self, **kw):
+        """Render the column type, like ``geometry(POLYGON,4326)``."""
+        if self.srid > 0:
+            return f'geometry({self.geometry_type},{self.srid})'
+        if self.geometry_type != 'GEOMETRY':
+            return f'geometry({self.geometry_type})'
+        return 'geometry'
+
+    def _set_parent(self, column, **kw):
+        """Declare the spatial index once the column is attached to a table."""
+        if self.spatial_index_method and not self._copied:
+            column._on_table_attach(self._set_table)
+
+    def copy(self, **kw):
+        """Copy the type for a column copy, which carries its own spatial index."""
+        instance = super().copy(**kw)
+        instance._copied = True
+        return instance
+
+    def _set_table(self, column, table):
+        prefix = f'idx_{table.schema}_{table.name}_{column.name}' if table.schema else \
+            f'idx_{table.name}_{column.name}'
+        name = f'{prefix}_{self.spatial_index_method}'[:63]
+        if name not in {index.name for index in table.indexes}:
+            Index(name, column, postgresql_using=self.spatial_index_method)
+
+    def process_bind_batch(self, values: Iterable[Any]) -> List[Optional[EWKB]]:
+        """Encode a batch of geometries (shapely, WKT or WKB) as EWKB with the column SRID.
+
+        Raises:
+            ValueError: When a geometry has a SRID different of the column SRID.
+        """
+        _require_shapely()
+
+        values = list(values)
+        geometries = numpy.empty(len(values), dtype=object)
+        texts, binaries = [], []
+        for position, value in enumerate(values):
+            if isinstance(value, str):
+                texts.append(position)
+            elif isinstance(value, (bytes, bytearray, memoryview)):
+                binaries.append(position)
+            else:
+                geometries[position] = value
+
+        if texts:
+            geometries[texts] = shapely.from_wkt([values[position] for position in texts])
+        if binaries:
+            geometries[binaries] = shapely.from_wkb([bytes(values[position]) for position in binaries])
+
+        if self.srid > 0:
+            srids = shapely.get_srid(geometries)
+            invalid = (srids > 0) & (srids != self.srid)
+            if invalid.any():
+                raise ValueError(f'Geometry SRID {srids[invalid][0]} does not match the column SRID {self.srid}')
+            geometries = shapely.set_srid(geometries, self.srid)
+
+        return [None if value is None else EWKB(value) for value in shapely.to_wkb(geometries, include_srid=True)]
+
+    def process_result_batch(self, values: Iterable[Any]) -> List[Any]:
+        """Decode a batch of EWKB values into shapely geometries."""
+        _require_shapely()
+
+        values = [bytes(value) if isinstance(value, memoryview) else value for value in values]
+        return list(shapely.from_wkb(values)) if values else []
+
+    def bind_expression(self, bindvalue):
+        """Convert the bound EWKB value to geometry on database."""
+        return func.ST_GeomFromEWKB(bindvalue, type_=self)
+
+    def column_expression(self, col):
+        """Select the geometry as EWKB."""
+        return func.ST_AsEWKB(col, type_=self)
+
+    def bind_processor(self, dialect):
+        """Encode a single geometry as EWKB, unless already encoded in batch."""
+        def process(value):
+            if value is None:
+                return None
+            if not isinstance(value, EWKB):
+                value = self.process_bind_batch([value])[0]
+            return bytes(value)
+
+        return process
+
+    def result_processor(self, dialect, coltype):
+        """Decode a single EWKB value into a shapely geometry."""
+        def process(value):
+            return None if value is None else self.process_result_batch([value])[0]
+
+        return process
+
+
+@event.listens_for(Engine, 'before_execute', retval=True)
+def _encode_geometry_batch(conn, clauseelement, multiparams, params, execution_options):
+    """Encode the geometries of executemany INSERT and UPDATE statements in a single vectorized call."""
+    if len(multiparams) < 2 or not isinstance(clauseelement, (Insert, Update)) \
+            or not all(isinstance(entry, dict) for entry in multiparams):
+        return clauseelement, multiparams, params
+
+    columns = [column for column in clauseelement.table.columns if isinstance(column.type, Geometry)]
+    columns = [column for column in columns if column.key in multiparams[0]]
+    if not columns:
+        return clauseelement, multiparams, params
+
+    multiparams = [dict(entry) for entry in multiparams]
+    for column in columns:
+        encoded = column.type.process_bind_batch([entry.get(column.key) for entry in multiparams])
+        for entry, value in zip(multiparams, encoded):
+            if column.key in entry:
+                entry[column.key] = value
+
+    return clauseelement, multiparams, params
@@ -18,14 +18,25 @@
 
 """Utility for Image Catalog Extension."""
 
+import contextlib
+import itertools
+import select as _select
+import time
 import typing as t
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
-import jsonschema
-from flask import current_app
-from sqlalchemy import inspect, text
+from flask import current_app, has_app_context
+from sqlalchemy import (Integer, Table, bindparam, func, inspect, select, text,
+                        tuple_)
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.engine import Engine
 
+from .db import db as _db
+from .schemas import get_default_registry
+
+MAX_BIND_PARAMETERS = 32767
+"""The maximum number of bind parameters in a single statement used by :func:`~bdc_db.utils.bulk_upsert`."""
+
 
 def validate_schema(schema_key: str, value: t.Any, draft_checker=None) -> t.Any:
     """Validate a JSONSchema according a json model.
@@ -35,22 +46,353 @@ def validate_schema(schema_key: str, value: t.Any, draft_checker=None) -> t.Any:
     Raises:
         jsonschema.ValidationError: When the current value does not match with expected schema.
 
+    .. versionchanged:: 0.9.0
+        The schema is validated with the :class:`~bdc_db.schemas.SchemaRegistry` of
+        :func:`~bdc_db.ext.BrazilDataCubeDB`, which keeps the validators and resolves
+        the ``$ref`` offline. Outside a Flask Application Context, the default registry is used.
+
     Note:
-        This method works under a Flask Application Context since it seeks for JSONSchema
-        loaded into :func:`~bdc_db.ext.BrazilDataCubeDB`
+        Under a Flask Application Context, it seeks for JSONSchema loaded into
+        :func:`~bdc_db.ext.BrazilDataCubeDB`.
 
     Args:
         schema_key (str): The schema key path reference to the `jsonschemas` folder.
         value (Any): The model value to be validated.
         draft_checker (jsonschema.FormatChecker): The format checker validation for schemas.
     """
-    extension = current_app.extensions['bdc-db']
+    return _schema_registry().validate(schema_key, value, draft_checker)
+
 
-    draft_checker = draft_checker or jsonschema.FormatChecker()
-    schema = extension.schemas.get_schema(schema_key)
-    jsonschema.validate(instance=value, schema=schema, format_checker=draft_checker)
+def validate_schema_many(schema_key: str, values: t.Iterable[t.Any], draft_checker=None) -> t.List[t.Any]:
+    """Validate a batch of values against the same JSONSchema.
 
-    return value
+    The schema is checked and the validator is built once for the whole batch.
+
+    .. versionadded:: 0.9.0
+
+    Raises:
+        jsonschema.ValidationError: When any value does not match with expected schema.
+
+    Args:
+        schema_key (str): The schema key path reference to the `jsonschemas` folder.
+        values (Iterable[Any]): The values to be validated. ``None`` values are skipped.
+        draft_checker (jsonschema.FormatChecker): The format checker validation for schemas.
+    """
+    return _schema_registry().validate_many(schema_key, values, draft_checker)
+
+
+def _schema_registry():
+    if has_app_context():
+        return current_app.extensions['bdc-db'].schema_registry
+    return get_default_registry()
+
+
+@dataclass
+class UpsertResult:
+    """Represent the summary of :func:`~bdc_db.utils.bulk_upsert`."""
+
+    rows: int = 0
+    batches: int = 0
+    duplicates: int = 0
+    elapsed: float = 0.0
+    keys: t.List[t.Tuple[t.Any, ...]] = field(default_factory=list)
+
+    @property
+    def rows_per_second(self) -> float:
+        """Retrieve the throughput of operation."""
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+
+def bulk_upsert(model: t.Any, rows: t.Iterable[t.Dict[str, t.Any]], conflict: t.Optional[t.Sequence[str]] = None,
+                update: t.Optional[t.Sequence[str]] = None, batch_size: int = 1000, returning: bool = False,
+                executor: t.Optional[t.Any] = None) -> UpsertResult:
+    """Insert or update rows in batches using ``INSERT ... ON CONFLICT``.
+
+    Each batch is a single statement with multi-row ``VALUES``. The columns whose type
+    supports batch binding (like :class:`~bdc_db.sqltypes.JSONB`) are processed once per
+    batch, validating all the JSONSchema documents with a single validator.
+
+    .. versionadded:: 0.9.0
+
+    Examples:
+        .. code-block:: python
+
+            from bdc_db.db import db
+            from bdc_db.utils import bulk_upsert
+
+            result = bulk_upsert(Item, rows, conflict=['name'], batch_size=5000)
+            db.session.commit()
+
+            print(f'{result.rows} rows ({result.rows_per_second:.0f} rows/s)')
+
+    Note:
+        All the rows must have the same keys. The transaction is not committed.
+        The rows of a batch which repeat a conflict key are merged, keeping the last one,
+        since PostgreSQL can not update a row twice in a statement.
+
+    Args:
+        model: The SQLAlchemy model or table.
+        rows: The rows (dict of column key and value) to insert.
+        conflict: The unique columns of the conflict target. Defaults to the primary key.
+        update: The columns to update on conflict. Defaults to every column in rows except the conflict ones.
+            Use an empty list to ignore the conflicting rows (``DO NOTHING``).
+        batch_size: The number of rows per statement.
+        returning: Return the conflict key of each inserted or updated row.
+        executor: The SQLAlchemy session or connection. Defaults to ``db.session``.
+    """
+    table = getattr(model, '__table__', model)
+    executor = executor if executor is not None else _db.session
+    conflict = list(conflict or [column.key for column in table.primary_key.columns])
+
+    result = UpsertResult()
+    start = time.perf_counter()
+    rows = iter(rows)
+
+    # Without RETURNING, the batches do not wait for each other in psycopg 3 pipeline mode
+    with pipeline(executor) if not returning else contextlib.nullcontext():
+        while True:
+            first = next(rows, None)
+            if first is None:
+                break
+
+            columns = list(first.keys())
+            size = max(1, min(batch_size, MAX_BIND_PARAMETERS // max(len(columns), 1)))
+            batch = [first] + list(itertools.islice(rows, size - 1))
+
+            if all(column in first for column in conflict):
+                unique = {tuple(row[column] for column in conflict): row for row in batch}
+                result.duplicates += len(batch) - len(unique)
+                batch = list(unique.values())
+
+            values = _bind_batch(table, columns, batch)
+
+            statement = insert(table).values(values)
+            update_columns = [column for column in columns if column not in conflict] if update is None else update
+            if update_columns:
+                statement = statement.on_conflict_do_update(
+                    index_elements=conflict,
+                    set_={column: statement.excluded[column] for column in update_columns}
+                )
+            else:
+                statement = statement.on_conflict_do_nothing(index_elements=conflict)
+
+            if returning:
+                statement = statement.returning(*[table.c[column] for column in conflict])
+
+            query_result = executor.execute(statement)
+            if returning:
+                result.keys.extend(tuple(row) for row in query_result)
+
+            result.rows += len(batch)
+            result.batches += 1
+
+    result.elapsed = time.perf_counter() - start
+
+    return result
+
+
+@contextlib.contextmanager
+def pipeline(executor: t.Optional[t.Any] = None) -> t.Iterator[t.Any]:
+    """Send the statements executed in the block without waiting for each result.
+
+    With psycopg 3, the block runs in `pipeline mode <https://www.psycopg.org/psycopg3/docs/advanced/pipeline.html>`_,
+    cutting one network round trip per statement. The results are synchronized on the block exit,
+    which is also where the database errors are raised. With psycopg2, it does nothing.
+
+    .. versionadded:: 0.9.0
+
+    Examples:
+        .. code-block:: python
+
+            from bdc_db.utils import pipeline
+
+            with pipeline(db.session):
+                for item in items:
+                    db.session.execute(update(Item).where(Item.id == item['id']).values(name=item['name']))
+
+    Note:
+        Do not read the results of the statements (like ``RETURNING``) inside the block.
+
+    Args:
+        executor: The SQLAlchemy session or connection. Defaults to ``db.session``.
+    """
+    executor = executor if executor is not None else _db.session
+    connection = executor.connection() if hasattr(executor, 'get_bind') else executor
+    dbapi_connection = connection.connection.dbapi_connection
+
+    if not hasattr(dbapi_connection, 'pipeline'):
+        yield executor
+        return
+
+    with dbapi_connection.pipeline():
+        yield executor
+
+
+def poll_notifications(dbapi_connection, timeout: float = 1.0) -> t.List[t.Tuple[str, str]]:
+    """Wait for the ``NOTIFY`` messages of the channels listened by a connection.
+
+    The connection must be in autocommit mode and have executed ``LISTEN <channel>``.
+    It supports both psycopg2 and psycopg 3 connections.
+
+    .. versionadded:: 0.9.0
+
+    Args:
+        dbapi_connection: The driver (DBAPI) connection.
+        timeout: Maximum seconds to wait for the first message.
+
+    Returns:
+        The channel and payload of each message received.
+    """
+    if hasattr(dbapi_connection, 'poll'):
+        if _select.select([dbapi_connection], [], [], timeout) != ([], [], []):
+            dbapi_connection.poll()
+        messages = [(notify.channel, notify.payload) for notify in dbapi_connection.notifies]
+        dbapi_connection.notifies.clear()
+        return messages
+
+    messages = [(notify.channel, notify.payload) for notify in dbapi_connection.notifies(timeout=timeout, stop_after=1)]
+    if messages:
+        # Drain the messages already received
+        messages.extend((notify.channel, notify.payload) for notify in dbapi_connection.notifies(timeout=0))
+    return messages
+
+
+def _bind_batch(table, columns: t.List[str], batch: t.List[t.Dict[str, t.Any]]) -> t.List[t.Dict[str, t.Any]]:
+    """Apply the batch bind processing of column types into the batch values."""
+    values = [dict(row) for row in batch]
+
+    for column in columns:
+        column_type = table.c[column].type
+        process_bind_batch = getattr(column_type, 'process_bind_batch', None)
+        if process_bind_batch is None:
+            continue
+
+        processed = process_bind_batch([row[column] for row in batch])
+        impl = getattr(column_type, 'impl_instance', column_type)
+        for row, value in zip(values, processed):
+            row[column] = bindparam(None, value, type_=impl)
+
+    return values
+
+
+STREAM_MODES = ('objects', 'rows', 'dicts')
+"""The output modes supported by :func:`~bdc_db.utils.stream`."""
+
+
+def stream(query: t.Any, chunk_size: int = 1000, mode: t.Optional[str] = None, keyset: bool = False,
+           keys: t.Optional[t.Sequence[t.Any]] = None, session: t.Optional[t.Any] = None) -> t.Iterator[t.Any]:
+    """Iterate over the results of a large query without loading them all in memory.
+
+    By default, the query runs once using a server-side (named) cursor which fetches
+    ``chunk_size`` rows at a time. This keeps one snapshot open during the whole scan.
+    With ``keyset=True``, each chunk is fetched by a new short query ordered by ``keys``
+    and filtered by the last key seen, so long scans do not hold an old snapshot.
+
+    .. versionadded:: 0.9.0
+
+    Examples:
+        .. code-block:: python
+
+            from bdc_db.utils import stream
+
+            for item in stream(Item, chunk_size=5000, keyset=True):
+                process(item)
+
+            for batch in stream(select(Item.id, Item.name), mode='dicts'):
+                writer.write(batch)
+
+    Note:
+        The ORM objects stay in the session identity map while referenced. Avoid changing them
+        during the scan or expunge them once processed.
+
+    Args:
+        query: The SQLAlchemy model, table or ``select`` statement.
+        chunk_size: The number of rows fetched at a time.
+        mode: Yield ORM ``objects``, ``rows`` (Row tuples) or ``dicts`` (one list of dicts per chunk).
+            Defaults to ``objects`` for single entity queries and ``rows`` otherwise.
+        keyset: Use keyset pagination instead of a server-side cursor.
+        keys: The unique columns used for keyset pagination. Defaults to the primary key.
+        session: The SQLAlchemy session or connection. Defaults to ``db.session``.
+    """
+    session = session if session is not None else _db.session
+    statement = select(query) if isinstance(query, Table) or hasattr(query, '__mapper__') else query
+    entity = single_entity(statement)
+
+    mode = mode or ('objects' if entity is not None else 'rows')
+    if mode not in STREAM_MODES:
+        raise ValueError(f'Invalid stream mode "{mode}". Expected one of {STREAM_MODES}')
+    if mode == 'objects' and entity is None:
+        raise ValueError('The mode "objects" requires a query of a single ORM entity')
+
+    if not keyset:
+        result = session.execute(statement, execution_options=dict(yield_per=chunk_size))
+        if mode == 'dicts':
+            for partition in result.mappings().partitions(chunk_size):
+                yield [dict(row) for row in partition]
+        else:
+            yield from result.scalars() if mode == 'objects' else result
+        return
+
+    keys = [key.__clause_element__() if hasattr(key, '__clause_element__') else key
+            for key in keys or _default_keys(statement, entity)]
+    statement = statement.order_by(None).order_by(*keys).limit(chunk_size)
+    last = None
+
+    while True:
+        page = statement if last is None else statement.where(tuple_(*keys) > tuple_(*last))
+        result = session.execute(page)
+        chunk = result.scalars().all() if mode == 'objects' else result.all()
+        if not chunk:
+            return
+
+        if mode == 'dicts':
+            yield [dict(row._mapping) for row in chunk]
+        else:
+            yield from chunk
+
+        if len(chunk) < chunk_size:
+            return
+
+        last = key_values(chunk[-1], keys, entity)
+
+
+def single_entity(statement) -> t.Optional[t.Any]:
+    """Retrieve the ORM entity of a statement which selects a single entity.
+
+    .. versionadded:: 0.9.0
+    """
+    descriptions = statement.column_descriptions
+    if len(descriptions) == 1 and descriptions[0]['entity'] is not None \
+            and descriptions[0]['type'] is descriptions[0]['entity']:
+        return descriptions[0]['entity']
+    return None
+
+
+def _default_keys(statement, entity) -> t.List[t.Any]:
+    if entity is not None:
+        return list(inspect(entity).primary_key)
+
+    froms = statement.get_final_froms()
+    primary_key = list(froms[0].primary_key) if len(froms) == 1 else []
+    if not primary_key:
+        raise ValueError('Could not detect the keyset columns of the query. Use the argument "keys".')
+    return primary_key
+
+
+def key_values(item, keys: t.List[t.Any], entity) -> t.Tuple[t.Any, ...]:
+    """Retrieve the values of the key columns from an ORM object or a row.
+
+    .. versionadded:: 0.9.0
+
+    Args:
+        item: The ORM object (when ``entity`` is given) or row.
+        keys: The key columns.
+        entity: The ORM entity selected by the statement, like :func:`~bdc_db.utils.single_entity`.
+    """
+    if entity is not None and not hasattr(item, '_mapping'):
+        mapper = inspect(entity)
+        return tuple(getattr(item, mapper.get_property_by_column(key).key) for key in keys)
+    return tuple(item._mapping[key] for key in keys)
 
 
 @dataclass
@@ -105,6 +447,39 @@ def delete_trigger(name: str, engine: Engine, table: str, schema: str = None):
     execute(f'DROP TRIGGER IF EXISTS {name} ON {schema}.{table}', engine)
 
 
+def reset_sequences(table: Table, executor: t.Union[Engine, t.Any]) -> t.Dict[str, int]:
+    """Move the serial and identity sequences of a table to the greatest column value.
+
+    Use it after loading rows with explicit key values, like ``COPY`` or a bulk
+    insert, so the next generated value does not conflict with the loaded rows.
+
+    .. versionadded:: 0.9.0
+
+    Args:
+        table: The SQLAlchemy table.
+        executor: The SQLAlchemy engine or connection.
+
+    Returns:
+        Map of column name and the last value of its sequence.
+    """
+    table_name = executor.dialect.identifier_preparer.format_table(table)
+    values = {}
+
+    for column in table.columns:
+        if not isinstance(column.type, Integer):
+            continue
+
+        sequence = execute(select(func.pg_get_serial_sequence(table_name, column.name)), executor).scalar()
+        if sequence is None:
+            continue
+
+        greatest = func.max(column)
+        statement = select(func.setval(sequence, func.coalesce(greatest, 1), greatest.is_not(None))).select_from(table)
+        values[column.name] = execute(statement, executor).scalar()
+
+    return values
+
+
 def execute(statement: t.Union[str, t.Any], executor: t.Union[Engine, t.Any], *args, **kwargs):
     """Execute a query statement in SQLAlchemy database engine.
 
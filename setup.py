@@ -38,6 +38,7 @@ tests_require = [
     'coveralls>=3.3',
     'pytest>=7.4',
     'pytest-cov>=4.1',
+    'pytest-xdist>=3.0',
     'pytest-pep8>=1.0',
     'pydocstyle>=4.0',
     'isort>4.3',
@@ -45,6 +46,10 @@ tests_require = [
 ]
 
 extras_require = {
+    'arrow': ['pyarrow>=10'],
+    'geo': ['shapely>=2', 'pyproj>=3'],
+    'psycopg': ['psycopg[binary]>=3.2'],
+    'zstd': ['zstandard>=0.18'],
     'docs': docs_require,
     'tests': tests_require,
 }
@@ -18,8 +18,13 @@
 
 """Unit-test configuration."""
 
+from unittest import mock
+
 import pytest
+from demo_app.models import FakeModel
 from flask import Flask
+from sqlalchemy import delete
+from utils import mock_entry_points
 
 from bdc_db import BrazilDataCubeDB, db
 
@@ -31,3 +36,39 @@ def app():
 
     with app.app_context():
         yield app
+
+
+@pytest.fixture
+def fake_models(app):
+    """Prepare an empty table for the demo FakeModel."""
+    with mock.patch('bdc_db.ext.entry_points', mock_entry_points), \
+            mock.patch('importlib_metadata.entry_points', mock_entry_points):
+        BrazilDataCubeDB(app)
+
+    db.create_all()
+    db.session.execute(delete(FakeModel))
+    db.session.commit()
+
+    yield FakeModel
+
+    db.session.rollback()
+    db.session.execute(delete(FakeModel))
+    db.session.commit()
+
+
+@pytest.fixture
+def create_tables(fake_models):
+    """Create the tables of a test MetaData, dropping them at teardown."""
+    created = []
+
+    def _create(metadata):
+        metadata.drop_all(db.engine)
+        metadata.create_all(db.engine)
+        created.append(metadata)
+        return metadata
+
+    yield _create
+
+    db.session.rollback()
+    for metadata in reversed(created):
+        metadata.drop_all(db.engine)
@@ -19,7 +19,9 @@
 """Define models of the package demo_app."""
 
 from bdc_db.db import db
-from bdc_db.sqltypes import JSONB
+from bdc_db.models import PartitionedMixin
+from bdc_db.partitioning import RangePartition
+from bdc_db.sqltypes import JSONB, MutableJSONB
 
 
 class FakeModel(db.Model):
@@ -31,3 +33,22 @@ class FakeModel(db.Model):
     name = db.Column(db.String, nullable=False)
     properties = db.Column(JSONB('dummy-jsonschema.json'))
     counter = db.Column(db.Integer, default=0)
+
+
+class FakeEvent(PartitionedMixin, db.Model):
+    """Define a table partitioned by month to store dated events."""
+
+    __tablename__ = 'fake_event'
+    __partition__ = RangePartition('date', interval='month', premake=1)
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    date = db.Column(db.Date, primary_key=True)
+
+
+class FakeDocument(db.Model):
+    """Define a table with a JSONB document updated partially."""
+
+    __tablename__ = 'fake_document'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    properties = db.Column(MutableJSONB.as_mutable(JSONB('dummy-jsonschema.json')))
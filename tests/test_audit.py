@@ -0,0 +1,95 @@
+#
+# This file is part of BDC-DB.
+# Copyright (C) 2022 INPE.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/gpl-3.0.html>.
+#
+
+"""Unit-test for BDC-DB JSONB audit."""
+
+import json
+
+import pytest
+from sqlalchemy import text
+
+from bdc_db.audit import AuditCheckpoint, audit_jsonb, jsonb_columns
+from bdc_db.db import db
+
+
+@pytest.fixture
+def documents(fake_models):
+    """Store documents bypassing the JSONSchema validation, every tenth one invalid."""
+    rows = [
+        dict(id=i, name=f'item-{i}',
+             properties=json.dumps(dict(fieldStringRequired=i) if i % 10 == 0 else dict(fieldStringRequired='ok')))
+        for i in range(1, 101)
+    ]
+    db.session.execute(
+        text('INSERT INTO fake_model (id, name, properties) VALUES (:id, :name, CAST(:properties AS JSONB))'), rows
+    )
+    db.session.execute(text('INSERT INTO fake_model (id, name) VALUES (101, :name)'), dict(name='empty'))
+    db.session.commit()
+
+    yield fake_models.__table__.c.properties
+
+
+def test_jsonb_columns(fake_models):
+    names = {f'{column.table.name}.{column.name}' for column in jsonb_columns(db.metadata)}
+    assert {'fake_model.properties', 'fake_document.properties'} <= names
+
+
+@pytest.mark.parametrize('jobs', [0, 2])
+def test_audit_jsonb(documents, jobs):
+    audit, = audit_jsonb([documents], db.engine, jobs=jobs, chunk_size=7)
+
+    assert audit.schema == 'dummy-jsonschema.json'
+    assert audit.rows == 100 and audit.invalid == 10 and audit.done
+    assert [violation.keys for violation in audit.violations] == [[i] for i in range(10, 101, 10)]
+    assert audit.violations[0].path == 'fieldStringRequired'
+    assert audit.last_key == [100]
+
+
+def test_audit_jsonb_interrupted(documents, tmp_path):
+    checkpoint = tmp_path / 'audit.json'
+
+    def _interrupt(audit):
+        raise KeyboardInterrupt
+
+    # The queued chunks are cancelled instead of validated before raising
+    with pytest.raises(KeyboardInterrupt):
+        audit_jsonb([documents], db.engine, jobs=2, chunk_size=5, checkpoint=checkpoint, on_progress=_interrupt)
+
+    audit, = AuditCheckpoint.load(checkpoint).columns.values()
+    assert audit.rows == 5 and not audit.done
+
+
+def test_audit_jsonb_resume(documents, tmp_path):
+    checkpoint = tmp_path / 'audit.json'
+
+    # Simulate an audit interrupted after the row 50
+    state = AuditCheckpoint()
+    partial, = audit_jsonb([documents], db.engine, jobs=0, chunk_size=50, max_violations=2,
+                           on_progress=lambda audit: state.columns.setdefault(audit.name, audit))
+    partial.rows, partial.invalid, partial.last_key, partial.done = 50, 5, [50], False
+    partial.violations = partial.violations[:1]
+    state.save(checkpoint)
+
+    audit, = audit_jsonb([documents], db.engine, jobs=0, chunk_size=20, checkpoint=checkpoint, max_violations=2)
+
+    assert audit.rows == 100 and audit.invalid == 10 and audit.done
+    assert [violation.keys for violation in audit.violations] == [[10], [60]]
+
+    # A finished audit is not executed again
+    assert AuditCheckpoint.load(checkpoint).columns[audit.name].done
+    assert audit_jsonb([documents], db.engine, jobs=0, checkpoint=checkpoint)[0].rows == 100
@@ -0,0 +1,173 @@
+#
+# This file is part of BDC-DB.
+# Copyright (C) 2023 INPE.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/gpl-3.0.html>.
+#
+
+"""Unit-test for BDC-DB bulk-load mode."""
+
+import json
+
+import pytest
+from demo_app.models import FakeModel
+from flask import current_app
+from sqlalchemy import (Column, Integer, MetaData, String, Table, insert,
+                        select, text)
+
+from bdc_db.bulkload import (CATCHUP_INFO_KEY, BulkLoad, BulkLoadJournal,
+                             journal_path, recover_bulk_load,
+                             registered_triggers, secondary_indexes)
+from bdc_db.changefeed import BULK_LOAD_OP, ChangeFeed, notify_changes
+from bdc_db.db import db
+from bdc_db.utils import execute, poll_notifications
+
+
+def _trigger_state():
+    return db.session.execute(text("SELECT tgenabled FROM pg_trigger "
+                                   " WHERE tgname = 'update_counter_fake_model'")).scalar()
+
+
+def _has_index():
+    return db.session.execute(text("SELECT to_regclass('idx_test_fake_model_name')")).scalar() is not None
+
+
+@pytest.fixture
+def loadable(fake_models, monkeypatch):
+    """Prepare the demo table with the registered trigger, an index and a catch-up statement."""
+    ext = current_app.extensions['bdc-db']
+    with db.engine.begin() as conn:
+        for scripts in ext.triggers.values():
+            for script in scripts.values():
+                with open(script) as f:
+                    execute(f.read(), conn)
+        conn.execute(text('CREATE INDEX idx_test_fake_model_name ON fake_model (name)'))
+
+    monkeypatch.setitem(FakeModel.__table__.info, CATCHUP_INFO_KEY,
+                        'UPDATE fake_model SET counter = 99 WHERE counter IS NULL')
+
+    yield FakeModel.__table__
+
+    db.session.rollback()
+    with db.engine.begin() as conn:
+        conn.execute(text('DROP TRIGGER IF EXISTS update_counter_fake_model ON fake_model'))
+        conn.execute(text('DROP INDEX IF EXISTS idx_test_fake_model_name'))
+        conn.execute(text('DROP INDEX IF EXISTS idx_test_fake_model_unique'))
+
+
+def test_registered_triggers(loadable):
+    # Its name only appears inside the registered script (function update_counter)
+    with db.engine.begin() as conn:
+        conn.execute(text('CREATE TRIGGER update_counter BEFORE UPDATE ON fake_model '
+                          'FOR EACH ROW EXECUTE PROCEDURE update_counter()'))
+
+    try:
+        triggers = registered_triggers([loadable], db.engine)
+    finally:
+        with db.engine.begin() as conn:
+            conn.execute(text('DROP TRIGGER update_counter ON fake_model'))
+
+    assert [trigger[2] for trigger in triggers] == ['update_counter_fake_model']
+
+
+def test_secondary_indexes(loadable):
+    with db.engine.begin() as conn:
+        conn.execute(text('CREATE UNIQUE INDEX idx_test_fake_model_unique ON fake_model (name, id)'))
+
+    assert [index.name for index in secondary_indexes(loadable, db.engine)] == ['idx_test_fake_model_name']
+
+
+def test_journal_path(loadable, tmp_path):
+    path = journal_path([loadable], db.engine, tmp_path)
+
+    assert path.parent == tmp_path and path.name.startswith(f'{db.engine.url.database}-')
+    assert path == journal_path([loadable], db.engine, tmp_path)
+    assert path != journal_path([loadable, Table('other', MetaData())], db.engine, tmp_path)
+
+
+def test_bulk_load(loadable, tmp_path):
+    journal = tmp_path / 'journal.json'
+
+    with BulkLoad([loadable], db.engine, journal=journal) as conn:
+        assert journal.exists()
+        db.session.rollback()
+        assert _trigger_state() == 'D'
+        assert not _has_index()
+
+        conn.execute(insert(loadable), [dict(id=i, name=f'item-{i}', counter=None) for i in range(1, 11)])
+
+    db.session.rollback()
+    assert not journal.exists()
+    assert _trigger_state() == 'O'
+    assert _has_index()
+    assert db.session.execute(select(FakeModel.counter).distinct()).scalars().all() == [99]
+
+
+def test_bulk_load_recover(loadable, tmp_path):
+    current_app.config['BDC_DB_BULK_LOAD_JOURNAL_DIR'] = str(tmp_path)
+    # A journal of another database in the same directory
+    other = tmp_path / 'other.json'
+    BulkLoadJournal(tables=[loadable.fullname], database='otherhost:5432/other').save(other)
+
+    loader = BulkLoad([loadable], db.engine)
+    assert loader.journal_path == journal_path([loadable], db.engine)
+    conn = loader.__enter__()
+    conn.execute(insert(loadable), [dict(id=1, name='item-1', counter=None)])
+    # Simulate a crash: the load transaction is aborted and the journal is kept
+    conn.close()
+
+    with pytest.raises(RuntimeError):
+        BulkLoad([loadable], db.engine).__enter__()
+    # The table is suspended by the crashed load, even through another journal
+    with pytest.raises(RuntimeError):
+        BulkLoad([loadable], db.engine, journal=tmp_path / 'journal.json').__enter__()
+
+    states = recover_bulk_load(db.engine)
+    assert len(states) == 1
+    assert states[0].stage == 'loading' and states[0].indexes[0].name == 'idx_test_fake_model_name'
+
+    db.session.rollback()
+    assert not loader.journal_path.exists()
+    assert other.exists()
+    assert _trigger_state() == 'O'
+    assert _has_index()
+    assert recover_bulk_load(db.engine) == []
+
+
+def test_bulk_load_change_feed(create_tables, tmp_path):
+    metadata = MetaData()
+    table = Table('bdc_bulk_load_feed', metadata, Column('id', Integer, primary_key=True), Column('name', String))
+    notify_changes(table, ChangeFeed(channel='bdc_bulk_load_feed'))
+    table.info[CATCHUP_INFO_KEY] = "UPDATE bdc_bulk_load_feed SET name = 'caught up' WHERE name IS NULL"
+    create_tables(metadata)
+
+    listener = db.engine.connect().execution_options(isolation_level='AUTOCOMMIT')
+    try:
+        listener.exec_driver_sql('LISTEN bdc_bulk_load_feed')
+
+        with BulkLoad([table], db.engine, journal=tmp_path / 'journal.json') as conn:
+            conn.execute(insert(table), [dict(id=i, name=None) for i in range(1, 101)])
+
+        # The loaded and caught up rows are not notified one by one
+        messages = poll_notifications(listener.connection.dbapi_connection, 2)
+        assert [json.loads(payload) for _, payload in messages] == [
+            dict(op=BULK_LOAD_OP, schema='public', table='bdc_bulk_load_feed', keys={})
+        ]
+
+        with db.engine.begin() as conn:
+            conn.execute(insert(table).values(id=101, name='after'))
+        messages = poll_notifications(listener.connection.dbapi_connection, 2)
+        assert [json.loads(payload)['op'] for _, payload in messages] == ['INSERT']
+    finally:
+        listener.close()
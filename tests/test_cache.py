@@ -0,0 +1,166 @@
+#
+# This file is part of BDC-DB.
+# Copyright (C) 2023 INPE.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/gpl-3.0.html>.
+#
+
+"""Unit-test for BDC-DB query cache."""
+
+import time
+
+import pytest
+from demo_app.models import FakeModel
+from sqlalchemy import event, select, text, update
+from sqlalchemy.orm import Session
+
+from bdc_db.cache import NotifyInvalidator, QueryCache
+from bdc_db.db import db
+from bdc_db.utils import bulk_upsert
+
+
+@pytest.fixture
+def cache(fake_models):
+    """Install a query cache on ``db.session``."""
+    bulk_upsert(fake_models, [dict(id=i, name=f'item-{i}') for i in range(1, 6)])
+    db.session.commit()
+
+    query_cache = QueryCache(maxsize=10, ttl=60)
+    query_cache.install(db.session)
+
+    yield query_cache
+
+    query_cache.uninstall()
+
+
+@pytest.fixture
+def statements():
+    """Count the statements sent to database."""
+    executed = []
+
+    def _count(conn, cursor, statement, parameters, context, executemany):
+        executed.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', _count)
+    yield executed
+    event.remove(db.engine, 'before_cursor_execute', _count)
+
+
+def _names():
+    return db.session.execute(select(FakeModel.name).order_by(FakeModel.id)).scalars().all()
+
+
+def test_query_cache_registered_model(cache, statements):
+    assert _names()[0] == 'item-1'
+    cache.register(FakeModel)
+
+    first = db.session.execute(select(FakeModel).where(FakeModel.id == 1)).scalar_one()
+    db.session.expunge_all()
+    second = db.session.execute(select(FakeModel).where(FakeModel.id == 1)).scalar_one()
+
+    assert first.name == second.name == 'item-1'
+    assert cache.stats.hits == 1 and cache.stats.misses == 1
+    assert len([s for s in statements if s.startswith('SELECT')]) == 2
+
+    # Flush a change of the cached table
+    second.name = 'changed'
+    db.session.flush()
+    assert cache.stats.invalidations > 0
+
+    assert db.session.execute(select(FakeModel.name).where(FakeModel.id == 1)).scalar() == 'changed'
+    db.session.rollback()
+
+    assert db.session.execute(select(FakeModel.name).where(FakeModel.id == 1)).scalar() == 'item-1'
+
+
+def test_query_cache_commit(cache):
+    cache.register(FakeModel)
+    other = Session(db.engine)
+    cache.install(other)
+    query = select(FakeModel.name).where(FakeModel.id == 1)
+
+    try:
+        db.session.execute(update(FakeModel).where(FakeModel.id == 1).values(name='changed'))
+        # The other session caches the committed row while the change is not committed
+        assert other.execute(query).scalar() == 'item-1'
+        other.close()
+
+        db.session.commit()
+        assert other.execute(query).scalar() == 'changed'
+    finally:
+        other.close()
+
+
+def test_query_cache_insert(cache):
+    cache.register(FakeModel)
+    query = select(FakeModel.name).where(FakeModel.id > 5).order_by(FakeModel.id)
+    assert db.session.execute(query).scalars().all() == []
+
+    bulk_upsert(FakeModel, [dict(id=i, name=f'item-{i}') for i in range(6, 8)])
+    db.session.commit()
+
+    assert db.session.execute(query).scalars().all() == ['item-6', 'item-7']
+    assert cache.stats.invalidations > 0
+
+
+def test_query_cache_option(cache):
+    query = select(FakeModel.name).order_by(FakeModel.id).execution_options(bdc_cache=True)
+
+    assert db.session.execute(query).scalars().all() == [f'item-{i}' for i in range(1, 6)]
+    assert db.session.execute(query).scalars().all() == [f'item-{i}' for i in range(1, 6)]
+    assert cache.stats.hits == 1
+
+    db.session.execute(update(FakeModel).where(FakeModel.id == 1).values(name='updated'))
+    assert db.session.execute(query).scalars().first() == 'updated'
+    db.session.commit()
+
+    # Not registered queries are not cached
+    _names()
+    assert cache.stats.hits == 1 and cache.stats.misses == 1
+
+
+def test_query_cache_ttl_and_size(cache):
+    cache.register(FakeModel)
+    cache.maxsize = 2
+
+    for i in range(1, 5):
+        db.session.execute(select(FakeModel).where(FakeModel.id == i)).scalar_one()
+    assert cache.stats.size == 2
+
+    query = select(FakeModel.name).execution_options(bdc_cache_ttl=0)
+    db.session.execute(query).all()
+    db.session.execute(query).all()
+    assert cache.stats.hits == 0
+
+
+def test_notify_invalidator(cache):
+    cache.register(FakeModel)
+    invalidator = NotifyInvalidator(db.engine)
+    invalidator.start(cache, timeout=0.1)
+
+    try:
+        _names()
+        assert cache.stats.size == 1
+
+        with db.engine.begin() as conn:
+            conn.execute(text("SELECT pg_notify('bdc_db_cache', '[\"fake_model\"]')"))
+
+        for _ in range(50):
+            if cache.stats.size == 0:
+                break
+            time.sleep(0.05)
+
+        assert cache.stats.size == 0
+    finally:
+        invalidator.stop()
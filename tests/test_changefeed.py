@@ -0,0 +1,118 @@
+#
+# This file is part of BDC-DB.
+# Copyright (C) 2022 INPE.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/gpl-3.0.html>.
+#
+
+"""Unit-test for BDC-DB change feed."""
+
+import asyncio
+import threading
+
+import pytest
+from sqlalchemy import Column, Integer, MetaData, String, Table, text
+
+from bdc_db.changefeed import (OUTBOX_TABLE, ChangeFeed, ChangeFeedConsumer,
+                               change_feed_tables, channel_name,
+                               notify_changes)
+from bdc_db.db import db
+
+
+@pytest.fixture
+def feed_table(create_tables):
+    """Create a table which notifies its changes."""
+    metadata = MetaData()
+    table = Table('bdc_change_feed_test', metadata,
+                  Column('id', Integer, primary_key=True),
+                  Column('name', String))
+    notify_changes(table, ChangeFeed(channel='bdc_test_changes', include_row=True))
+
+    create_tables(metadata)
+
+    return table
+
+
+def _consume(consumer):
+    thread = threading.Thread(target=consumer.run, daemon=True)
+    thread.start()
+    assert consumer.ready.wait(5)
+    return thread
+
+
+def test_change_feed_declaration(feed_table):
+    assert channel_name(feed_table) == 'bdc_test_changes'
+    assert change_feed_tables(feed_table.metadata) == [feed_table]
+
+
+def test_change_feed_consumer(feed_table):
+    batches = []
+    consumer = ChangeFeedConsumer(db.engine, ['bdc_test_changes'], batches.append, batch_interval=0.2)
+    thread = _consume(consumer)
+
+    with db.engine.begin() as conn:
+        conn.execute(feed_table.insert(), [dict(id=1, name='first'), dict(id=2, name='second')])
+        conn.execute(feed_table.update().where(feed_table.c.id == 1).values(name='changed'))
+
+    with db.engine.begin() as conn:
+        conn.execute(feed_table.delete().where(feed_table.c.id == 2))
+
+    consumer.stop()
+    thread.join(5)
+
+    events = [change for batch in batches for change in batch]
+    latest = {change.keys['id']: change for change in events}
+    assert latest[1].op == 'UPDATE' and latest[1].row['name'] == 'changed'
+    assert latest[2].op == 'DELETE'
+    # The insert and update of row 1 in the same batch are de-duplicated
+    assert all(len({change.identity for change in batch}) == len(batch) for batch in batches)
+
+
+def test_change_feed_outbox(feed_table):
+    batches = []
+    consumer = ChangeFeedConsumer(db.engine, ['bdc_test_changes'], batches.append, batch_interval=0.2)
+    thread = _consume(consumer)
+
+    with db.engine.begin() as conn:
+        conn.execute(feed_table.insert(), dict(id=1, name='x' * 10000))
+
+    consumer.stop()
+    thread.join(5)
+
+    events = [change for batch in batches for change in batch]
+    assert len(events) == 1
+    assert events[0].row['name'] == 'x' * 10000
+    with db.engine.connect() as conn:
+        assert conn.execute(text(f'SELECT count(*) FROM {OUTBOX_TABLE}')).scalar() == 0
+
+
+def test_change_feed_consumer_async(feed_table):
+    received = []
+
+    async def on_changes(events):
+        received.extend(events)
+        consumer.stop()
+
+    consumer = ChangeFeedConsumer(db.engine, ['bdc_test_changes'], on_changes, batch_interval=0.1)
+
+    async def main():
+        task = asyncio.create_task(consumer.run_async())
+        await asyncio.get_running_loop().run_in_executor(None, consumer.ready.wait, 5)
+        with db.engine.begin() as conn:
+            conn.execute(feed_table.insert(), dict(id=1, name='async'))
+        await asyncio.wait_for(task, 5)
+
+    asyncio.run(main())
+
+    assert [(change.op, change.keys) for change in received] == [('INSERT', dict(id=1))]
@@ -0,0 +1,95 @@
+#
+# This file is part of BDC-DB.
+# Copyright (C) 2023 INPE.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/gpl-3.0.html>.
+#
+
+"""Unit-test for BDC-DB columnar export and import."""
+
+from decimal import Decimal
+
+import pytest
+from demo_app.models import FakeModel
+from sqlalchemy import (Column, Computed, Identity, Integer, MetaData, Numeric,
+                        Table, insert, select)
+
+from bdc_db.columnar import arrow_schema, export_table, import_table
+from bdc_db.db import db
+from bdc_db.utils import bulk_upsert
+
+pa = pytest.importorskip('pyarrow')
+
+
+def test_arrow_schema():
+    schema = arrow_schema(FakeModel.__table__)
+
+    assert schema.field('id').type == pa.int32()
+    assert schema.field('properties').type == pa.string()
+    assert schema.metadata[b'bdc_db.table'] == FakeModel.__table__.fullname.encode()
+
+
+@pytest.mark.parametrize('file_name', ['fake_model.parquet', 'fake_model.arrow'])
+def test_export_import(fake_models, tmp_path, file_name):
+    table = fake_models.__table__
+    rows = [
+        dict(id=i, name=f'item-{i}', counter=i if i % 2 else None,
+             properties={'fieldStringRequired': str(i), 'fieldObjectAny': {'values': [i, None]}})
+        for i in range(1, 26)
+    ]
+    bulk_upsert(fake_models, rows)
+    db.session.commit()
+
+    path = tmp_path / file_name
+    result = export_table(table, path, db.engine, batch_size=10)
+    assert result.rows == 25 and result.batches == 3
+
+    result = import_table(table, path, db.engine, batch_size=7, truncate=True)
+    assert result.rows == 25 and result.batches >= 4
+
+    imported = db.session.execute(select(table).order_by(table.c.id)).mappings().all()
+    assert [dict(row) for row in imported] == rows
+
+
+def test_import_generated_columns(create_tables, tmp_path):
+    metadata = MetaData()
+    table = Table(
+        'columnar_generated', metadata,
+        Column('id', Integer, primary_key=True),
+        Column('code', Integer, Identity(always=True)),
+        Column('amount', Numeric),
+        Column('doubled', Numeric, Computed('amount * 2')),
+    )
+    create_tables(metadata)
+    # More digits than the Arrow decimal types and the default decimal context hold
+    amounts = [Decimal(f'1234567890123456789012345678901234567890123456789012345678901234567890123{i}.001')
+               for i in range(1, 6)]
+    with db.engine.begin() as conn:
+        conn.execute(insert(table), [dict(id=i, amount=amount) for i, amount in enumerate(amounts, start=1)])
+
+    assert arrow_schema(table).field('amount').type == pa.string()
+
+    path = tmp_path / 'generated.parquet'
+    export_table(table, path, db.engine)
+    result = import_table(table, path, db.engine, truncate=True)
+    assert result.rows == 5
+
+    with db.engine.begin() as conn:
+        rows = conn.execute(select(table).order_by(table.c.id)).mappings().all()
+        assert [row['amount'] for row in rows] == amounts
+        assert [row['code'] for row in rows] == [6, 7, 8, 9, 10]
+
+        # The sequence of "id" must continue after the imported rows
+        new_id = conn.execute(insert(table).values(amount=1).returning(table.c.id)).scalar()
+        assert new_id == 6
@@ -0,0 +1,158 @@
+#
+# This file is part of BDC-DB.
+# Copyright (C) 2023 INPE.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/gpl-3.0.html>.
+#
+
+"""Unit-test for BDC-DB dump and restore."""
+
+import pytest
+from demo_app.models import FakeModel
+from sqlalchemy import (Column, ForeignKey, Index, Integer, MetaData, String,
+                        Table, delete, event, func, insert, inspect, select)
+from sqlalchemy.exc import DBAPIError
+
+from bdc_db.db import db
+from bdc_db.dump import dump_tables, read_manifest, restore_tables
+from bdc_db.utils import bulk_upsert
+
+
+@pytest.mark.parametrize('compression, copy_format', [
+    ('gzip', 'text'),
+    ('zstd', 'text'),
+    ('none', 'text'),
+    ('gzip', 'binary'),
+])
+def test_dump_restore(fake_models, tmp_path, compression, copy_format):
+    if compression == 'zstd':
+        pytest.importorskip('zstandard')
+
+    table = fake_models.__table__
+    rows = [
+        dict(id=i, name=f'item\\t{i}\n', counter=i if i % 2 else None,
+             properties={'fieldStringRequired': str(i)})
+        for i in range(1, 101)
+    ]
+    bulk_upsert(fake_models, rows)
+    db.session.commit()
+
+    path = tmp_path / 'dump.tar'
+    result = dump_tables([table], path, db.engine, compression=compression, jobs=2, copy_format=copy_format)
+    assert result.rows == 100
+
+    manifest = read_manifest(path)
+    assert manifest['compression'] == compression and manifest['format'] == copy_format
+    assert [entry['table'] for entry in manifest['tables']] == [table.fullname]
+
+    db.session.execute(table.update().values(name='changed'))
+    db.session.commit()
+
+    result = restore_tables(path, db.metadata.tables, db.engine, clean=True)
+    assert result.rows == 100
+
+    restored = db.session.execute(select(table).order_by(table.c.id)).mappings().all()
+    assert [dict(row) for row in restored] == rows
+
+
+def test_restore_unknown_table(fake_models, tmp_path):
+    path = tmp_path / 'dump.tar'
+    dump_tables([FakeModel.__table__], path, db.engine)
+
+    with pytest.raises(ValueError):
+        restore_tables(path, dict(), db.engine)
+
+
+def test_restore_foreign_keys(create_tables, tmp_path):
+    metadata = MetaData()
+    parent = Table('dump_parent', metadata, Column('id', Integer, primary_key=True), Column('name', String))
+    child = Table('dump_child', metadata, Column('id', Integer, primary_key=True),
+                  Column('parent_id', ForeignKey('dump_parent.id'), nullable=False))
+    create_tables(metadata)
+
+    with db.engine.begin() as conn:
+        conn.execute(insert(parent), [dict(id=i, name=f'parent-{i}') for i in range(1, 4)])
+        conn.execute(insert(child), [dict(id=i, parent_id=i) for i in range(1, 4)])
+
+    path = tmp_path / 'dump.tar'
+    # Out of foreign key order on purpose
+    dump_tables([child, parent], path, db.engine)
+
+    result = restore_tables(path, metadata.tables, db.engine, clean=True)
+    assert [entry.table for entry in result.tables] == ['dump_parent', 'dump_child']
+    assert result.rows == 6
+
+    with db.engine.begin() as conn:
+        # The sequences continue after the restored keys
+        assert conn.execute(insert(parent).values(name='new').returning(parent.c.id)).scalar() == 4
+        assert conn.execute(insert(child).values(parent_id=4).returning(child.c.id)).scalar() == 4
+
+    # A table outside the dump which references the restored ones
+    other = MetaData()
+    Table('dump_parent', other, Column('id', Integer, primary_key=True))
+    reference = Table('dump_reference', other, Column('id', Integer, primary_key=True),
+                      Column('parent_id', ForeignKey('dump_parent.id')))
+    reference.create(db.engine)
+    with db.engine.begin() as conn:
+        conn.execute(insert(reference).values(id=1, parent_id=1))
+
+    try:
+        with pytest.raises(DBAPIError):
+            restore_tables(path, metadata.tables, db.engine, clean=True)
+
+        restore_tables(path, metadata.tables, db.engine, clean=True, cascade=True)
+        with db.engine.connect() as conn:
+            assert conn.execute(select(func.count()).select_from(reference)).scalar() == 0
+    finally:
+        reference.drop(db.engine)
+
+
+def test_restore_unique_index(create_tables, tmp_path):
+    metadata = MetaData()
+    table = Table('dump_unique', metadata, Column('id', Integer, primary_key=True), Column('code', String),
+                  Column('name', String),
+                  Index('idx_dump_unique_code', 'code', unique=True), Index('idx_dump_unique_name', 'name'))
+    create_tables(metadata)
+
+    with db.engine.begin() as conn:
+        conn.execute(insert(table), [dict(id=i, code=f'code-{i}', name='dumped') for i in range(1, 4)])
+
+    path = tmp_path / 'dump.tar'
+    dump_tables([table], path, db.engine)
+
+    # The same codes with other keys, so only the unique index rejects the restored rows
+    with db.engine.begin() as conn:
+        conn.execute(delete(table))
+        conn.execute(insert(table), [dict(id=i + 10, code=f'code-{i}', name='kept') for i in range(1, 4)])
+
+    statements = []
+
+    def listener(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+        # COPY runs on the driver connection, which raises its own errors
+        with pytest.raises(Exception, match='idx_dump_unique_code'):
+            restore_tables(path, metadata.tables, db.engine)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', listener)
+
+    # The unique index checks the rows on load and is never dropped
+    assert not any('DROP INDEX' in statement and 'idx_dump_unique_code' in statement for statement in statements)
+    assert any('DROP INDEX' in statement and 'idx_dump_unique_name' in statement for statement in statements)
+    assert {index['name'] for index in inspect(db.engine).get_indexes('dump_unique')} == \
+        {'idx_dump_unique_code', 'idx_dump_unique_name'}
+    with db.engine.connect() as conn:
+        assert conn.execute(select(func.count()).select_from(table).where(table.c.name == 'kept')).scalar() == 3
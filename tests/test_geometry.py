@@ -0,0 +1,137 @@
+#
+# This file is part of BDC-DB.
+# Copyright (C) 2022 INPE.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/gpl-3.0.html>.
+#
+
+"""Unit-test for BDC-DB Geometry type."""
+
+import pytest
+from sqlalchemy import (Column, Integer, MetaData, Table, insert, select, text,
+                        update)
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateTable
+
+from bdc_db.db import db
+from bdc_db.sqltypes import EWKB, Geometry, _encode_geometry_batch
+
+shapely = pytest.importorskip('shapely')
+
+SQUARE = 'POLYGON ((0 0, 1 0, 1 1, 0 1, 0 0))'
+
+
+def _tile_table(metadata=None, **kwargs):
+    return Table('bdc_tile_test', metadata or MetaData(),
+                 Column('id', Integer, primary_key=True),
+                 Column('footprint', Geometry('POLYGON', **kwargs)))
+
+
+def test_geometry_ddl():
+    table = _tile_table()
+    dialect = postgresql.dialect()
+
+    assert 'footprint geometry(POLYGON,4326)' in str(CreateTable(table).compile(dialect=dialect))
+    index, = table.indexes
+    assert index.name == 'idx_bdc_tile_test_footprint_gist'
+    assert index.dialect_options['postgresql']['using'] == 'gist'
+
+    assert 'ST_AsEWKB(bdc_tile_test.footprint)' in str(select(table).compile(dialect=dialect))
+    assert Geometry(srid=0).get_col_spec() == 'geometry'
+    assert not _tile_table(spatial_index=False).indexes
+    assert list(_tile_table(spatial_index='brin').indexes)[0].name.endswith('_brin')
+
+    with pytest.raises(ValueError):
+        Geometry(spatial_index='btree')
+
+
+def test_geometry_shared_type_indexes():
+    metadata = MetaData()
+    geometry_type = Geometry('POLYGON')
+    first = Table('a', metadata, Column('id', Integer, primary_key=True), Column('geom', geometry_type))
+    second = Table('b', metadata, Column('id', Integer, primary_key=True), Column('geom', geometry_type))
+
+    assert [index.name for index in first.indexes] == ['idx_a_geom_gist']
+    assert [index.name for index in second.indexes] == ['idx_b_geom_gist']
+
+    # The copy carries the indexes of the source table only
+    copy = first.to_metadata(MetaData(), name='c')
+    assert [index.name for index in copy.indexes] == ['idx_a_geom_gist']
+
+
+def test_geometry_batch_encoding():
+    geometry_type = Geometry('POLYGON', srid=4326)
+    square = shapely.from_wkt(SQUARE)
+
+    encoded = geometry_type.process_bind_batch([square, SQUARE, shapely.to_wkb(square), None])
+    assert all(isinstance(value, EWKB) for value in encoded[:3]) and encoded[3] is None
+    assert len(set(encoded[:3])) == 1
+
+    decoded = geometry_type.process_result_batch(encoded)
+    assert decoded[0].equals(square) and shapely.get_srid(decoded[0]) == 4326
+    assert decoded[3] is None
+
+    # Encoded values are not processed again by the bind processor
+    process = geometry_type.bind_processor(postgresql.dialect())
+    assert process(encoded[0]) == encoded[0]
+
+
+def test_geometry_srid_enforcement():
+    geometry_type = Geometry(srid=4326)
+    projected = shapely.set_srid(shapely.Point(1, 2), 3857)
+
+    with pytest.raises(ValueError, match='SRID 3857'):
+        geometry_type.process_bind_batch([projected])
+
+    any_srid = Geometry(srid=0)
+    assert shapely.get_srid(any_srid.process_result_batch(any_srid.process_bind_batch([projected]))[0]) == 3857
+
+
+def test_geometry_executemany_vectorized():
+    table = _tile_table()
+    rows = [dict(id=i, footprint=SQUARE) for i in range(3)]
+
+    statement, multiparams, _ = _encode_geometry_batch(None, insert(table), rows, {}, {})
+    assert all(isinstance(entry['footprint'], EWKB) for entry in multiparams)
+    assert rows[0]['footprint'] == SQUARE
+
+    # Single statements are left to the bind processor
+    _, single, _ = _encode_geometry_batch(None, update(table), [rows[0]], {}, {})
+    assert single[0]['footprint'] == SQUARE
+
+
+@pytest.fixture
+def postgis(create_tables):
+    """Create a table with geometry when PostGIS is available."""
+    with db.engine.begin() as conn:
+        available = conn.execute(text("SELECT count(*) FROM pg_available_extensions WHERE name = 'postgis'")).scalar()
+        if not available:
+            pytest.skip('PostGIS is not available')
+        conn.execute(text('CREATE EXTENSION IF NOT EXISTS postgis'))
+
+    metadata = MetaData()
+    table = _tile_table(metadata)
+    create_tables(metadata)
+    return table
+
+
+def test_geometry_round_trip(postgis):
+    squares = [shapely.affinity.translate(shapely.from_wkt(SQUARE), i, i) for i in range(10)]
+
+    with db.engine.begin() as conn:
+        conn.execute(insert(postgis), [dict(id=i, footprint=square) for i, square in enumerate(squares)])
+        loaded = conn.execute(select(postgis.c.footprint).order_by(postgis.c.id)).scalars().all()
+
+    assert all(a.equals(b) for a, b in zip(loaded, squares))
+    assert shapely.get_srid(loaded[0]) == 4326
@@ -0,0 +1,125 @@
+#
+# This file is part of BDC-DB.
+# Copyright (C) 2023 INPE.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/gpl-3.0.html>.
+#
+
+"""Unit-test for concurrent index management."""
+
+from datetime import date
+from unittest import mock
+
+from sqlalchemy import (Column, Date, Index, Integer, MetaData, String, Table,
+                        text)
+from utils import mock_entry_points
+
+import bdc_db.cli as bdc_cli
+from bdc_db import BrazilDataCubeDB
+from bdc_db.db import NAMING_CONVENTION, db
+from bdc_db.indexes import (build_indexes, invalid_indexes, missing_indexes,
+                            rebuild_index)
+from bdc_db.partitioning import RangePartition, partition_table
+
+
+def _prepare_tables():
+    metadata = MetaData(naming_convention=NAMING_CONVENTION)
+    sample = Table('fake_indexed', metadata,
+                   Column('id', Integer, primary_key=True),
+                   Column('name', String, index=True))
+    events = partition_table(
+        Table('fake_indexed_event', metadata,
+              Column('id', Integer, primary_key=True),
+              Column('date', Date, primary_key=True),
+              Column('name', String, index=True)),
+        RangePartition('date', premake=1)
+    )
+
+    metadata.drop_all(db.engine)
+    metadata.create_all(db.engine)
+
+    with db.engine.begin() as conn:
+        for table in (sample, events):
+            for index in table.indexes:
+                conn.execute(text(f'DROP INDEX {index.name}'))
+
+    return metadata, sample, events
+
+
+@mock.patch('bdc_db.ext.entry_points', mock_entry_points)
+def test_build_missing_indexes(app):
+    BrazilDataCubeDB(app)
+
+    metadata, sample, events = _prepare_tables()
+
+    with db.engine.connect() as conn:
+        missing = missing_indexes(metadata, conn)
+    assert sorted(str(index.name) for index in missing) == ['idx_fake_indexed_event_name', 'idx_fake_indexed_name']
+
+    progress = []
+    results = build_indexes(missing, db.engine, jobs=2, on_progress=progress.append, interval=0.01)
+    assert results == {'idx_fake_indexed_name': None, 'idx_fake_indexed_event_name': None}
+
+    with db.engine.connect() as conn:
+        assert missing_indexes(metadata, conn) == []
+        assert invalid_indexes(conn) == []
+
+    metadata.drop_all(db.engine)
+
+
+@mock.patch('bdc_db.ext.entry_points', mock_entry_points)
+def test_rebuild_invalid_index(app):
+    BrazilDataCubeDB(app)
+
+    metadata, sample, _ = _prepare_tables()
+    index = Index('fake_indexed_name_unique', sample.c.name, unique=True)
+
+    with db.engine.begin() as conn:
+        conn.execute(sample.insert(), [dict(id=1, name='dup'), dict(id=2, name='dup')])
+
+    # A failed concurrent build leaves an invalid index behind
+    results = build_indexes([index], db.engine)
+    assert results['fake_indexed_name_unique'] is not None
+
+    with db.engine.connect() as conn:
+        assert [entry.index_name for entry in invalid_indexes(conn)] == ['fake_indexed_name_unique']
+
+    runner = app.test_cli_runner()
+    result = runner.invoke(bdc_cli.indexes_status, [])
+    assert result.exit_code == 0
+    assert 'Invalid index "public.fake_indexed_name_unique"' in result.stdout
+
+    with db.engine.begin() as conn:
+        conn.execute(sample.delete().where(sample.c.id == 2))
+
+    rebuild_index('public', 'fake_indexed_name_unique', db.engine)
+
+    with db.engine.connect() as conn:
+        assert invalid_indexes(conn) == []
+
+    result = runner.invoke(bdc_cli.rebuild_invalid_indexes, [])
+    assert result.exit_code == 0
+    assert 'No invalid index.' in result.stdout
+
+    metadata.drop_all(db.engine)
+
+
+@mock.patch('bdc_db.ext.entry_points', mock_entry_points)
+def test_create_indexes_cli(app):
+    BrazilDataCubeDB(app)
+
+    runner = app.test_cli_runner()
+
+    result = runner.invoke(bdc_cli.create_indexes, ['--preview'])
+    assert result.exit_code == 0
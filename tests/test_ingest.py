@@ -0,0 +1,83 @@
+#
+# This file is part of BDC-DB.
+# Copyright (C) 2023 INPE.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/gpl-3.0.html>.
+#
+
+"""Unit-test for BDC-DB bulk ingest session."""
+
+import pytest
+from demo_app.models import FakeModel
+from flask import current_app
+from sqlalchemy import func, select
+from sqlalchemy.exc import StatementError
+
+from bdc_db.db import db
+
+
+def test_bulk_session(fake_models):
+    ext = current_app.extensions['bdc-db']
+    reports = []
+
+    def _on_stats(stats):
+        # The flushed objects must not accumulate in the identity map
+        assert len(db.session.identity_map) == 0
+        reports.append((stats.objects, stats.batches, stats.commits))
+
+    with ext.bulk_session(flush_every=10, commit_every=2, on_stats=_on_stats) as bulk:
+        for i in range(25):
+            bulk.add(FakeModel(name=f'item-{i}', properties={'fieldStringRequired': str(i)}))
+
+    assert reports == [(10, 1, 0), (20, 2, 1), (25, 3, 1)]
+    assert bulk.stats.commits == 2
+    assert bulk.stats.objects_per_second > 0 and bulk.stats.peak_rss > 0
+    assert db.session.scalar(select(func.count()).select_from(FakeModel)) == 25
+
+
+def test_bulk_session_cascaded_objects(fake_models):
+    ext = current_app.extensions['bdc-db']
+    loaded = FakeModel(name='loaded')
+    db.session.add(loaded)
+    db.session.commit()
+    assert loaded.name == 'loaded'
+
+    with ext.bulk_session(flush_every=2) as bulk:
+        for i in range(4):
+            bulk.add(FakeModel(name=f'item-{i}'))
+            # Objects flushed along with the batch, like the children of a relationship cascade
+            db.session.add(FakeModel(name=f'child-{i}'))
+
+    assert list(db.session.identity_map.values()) == [loaded]
+    assert db.session.scalar(select(func.count()).select_from(FakeModel)) == 9
+
+
+def test_bulk_session_max_bytes(fake_models):
+    ext = current_app.extensions['bdc-db']
+
+    with ext.bulk_session(max_bytes=1) as bulk:
+        bulk.add_all(FakeModel(name=f'item-{i}') for i in range(3))
+
+    assert bulk.stats.batches == 3
+
+
+def test_bulk_session_rollback(fake_models):
+    ext = current_app.extensions['bdc-db']
+
+    with pytest.raises(StatementError):
+        with ext.bulk_session(flush_every=2) as bulk:
+            bulk.add(FakeModel(name='valid', properties={'fieldStringRequired': 'valid'}))
+            bulk.add(FakeModel(name='invalid', properties={}))
+
+    assert db.session.scalar(select(func.count()).select_from(FakeModel)) == 0
@@ -0,0 +1,69 @@
+#
+# This file is part of BDC-DB.
+# Copyright (C) 2022 INPE.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/gpl-3.0.html>.
+#
+
+"""Unit-test for BDC-DB maintenance orchestration."""
+
+import pytest
+from demo_app.models import FakeDocument
+from sqlalchemy import delete, text
+
+from bdc_db.db import db
+from bdc_db.maintenance import maintain_tables, table_stats
+from bdc_db.utils import bulk_upsert
+
+
+@pytest.fixture
+def dead_tuples(fake_models):
+    """Leave dead tuples in the FakeModel table."""
+    bulk_upsert(fake_models, [dict(id=i, name=f'item-{i}') for i in range(1, 501)])
+    db.session.commit()
+    db.session.execute(delete(fake_models).where(fake_models.id > 100))
+    # Report the statistics of this backend now (PostgreSQL 15+)
+    db.session.execute(text('SELECT pg_stat_force_next_flush()'))
+    db.session.commit()
+
+    yield fake_models.__table__
+
+
+def test_table_stats(dead_tuples):
+    stats, = table_stats([dead_tuples], db.engine)
+
+    assert stats.table_name == 'fake_model'
+    assert stats.dead_tuples >= 400 and stats.modifications >= 400
+    assert stats.priority == stats.dead_tuples + stats.modifications
+
+
+def test_maintain_tables_vacuum(dead_tuples):
+    tables = [dead_tuples, FakeDocument.__table__]
+    finished = []
+
+    results = maintain_tables(tables, db.engine, 'vacuum', jobs=2, only_changed=False, on_result=finished.append)
+
+    assert results[0].before.name.endswith('.fake_model')
+    assert len(finished) == len(results) == 2
+    assert all(result.error is None and not result.skipped for result in results)
+    assert results[0].after.dead_tuples == 0
+    assert results[0].after.last_vacuum is not None
+
+
+def test_maintain_tables_budget(dead_tuples):
+    result, = maintain_tables([dead_tuples], db.engine, budget=0)
+    assert result.skipped and result.after is not None
+
+    with pytest.raises(ValueError):
+        maintain_tables([dead_tuples], db.engine, 'reindex')
@@ -0,0 +1,170 @@
+#
+# This file is part of BDC-DB.
+# Copyright (C) 2023 INPE.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/gpl-3.0.html>.
+#
+
+"""Unit-test for BDC-DB models."""
+
+from unittest import mock
+
+import pytest
+from demo_app.models import FakeModel
+from sqlalchemy import Column, delete, event, select
+from sqlalchemy.dialects import postgresql
+from utils import mock_entry_points
+
+from bdc_db import BrazilDataCubeDB
+from bdc_db.db import db
+from bdc_db.models import (SpatialRefSys, SRIDRegistry, is_large_column,
+                           undefer_large)
+from bdc_db.sqltypes import JSONB
+
+
+def _compile(statement) -> str:
+    return str(statement.compile(dialect=postgresql.dialect()))
+
+
+@mock.patch('bdc_db.ext.entry_points', mock_entry_points)
+@mock.patch('importlib_metadata.entry_points', mock_entry_points)
+def test_deferred_large_columns(app):
+    BrazilDataCubeDB(app)
+
+    assert FakeModel.__mapper__.attrs['properties'].deferred
+    assert SpatialRefSys.__mapper__.attrs['srtext'].deferred
+    assert SpatialRefSys.__mapper__.attrs['proj4text'].deferred
+    assert not FakeModel.__mapper__.attrs['name'].deferred
+
+    assert 'properties' not in _compile(select(FakeModel))
+    assert 'properties' in _compile(select(FakeModel).options(undefer_large()))
+    assert 'srtext' in _compile(select(SpatialRefSys).options(undefer_large(SpatialRefSys)))
+
+    assert not is_large_column(Column('properties', JSONB('dummy-jsonschema.json', deferred=False)))
+    assert is_large_column(Column('properties', JSONB('dummy-jsonschema.json', deferred=True)))
+
+    db.create_all()
+
+    model = FakeModel(name='Deferred', properties={'fieldStringRequired': 'deferred'})
+    db.session.add(model)
+    db.session.commit()
+
+    model_id = model.id
+    db.session.expunge_all()
+    model = db.session.execute(select(FakeModel).where(FakeModel.id == model_id)).scalar_one()
+    assert 'properties' not in model.__dict__
+    assert model.properties == {'fieldStringRequired': 'deferred'}
+
+
+_WGS84 = ('GEOGCS["WGS 84",DATUM["WGS_1984",SPHEROID["WGS 84",6378137,298.257223563]],'
+          'PRIMEM["Greenwich",0],UNIT["degree",0.0174532925199433]]')
+
+
+@pytest.fixture
+def spatial_refs(fake_models):
+    """Prepare custom spatial references in spatial_ref_sys."""
+    srids = (990001, 990002)
+    db.session.execute(delete(SpatialRefSys).where(SpatialRefSys.srid.in_(srids)))
+    db.session.add(SpatialRefSys(srid=990001, auth_name='BDC', auth_srid='990001',
+                                 srtext=_WGS84, proj4text='+proj=longlat +datum=WGS84 +no_defs'))
+    db.session.commit()
+
+    yield srids
+
+    db.session.rollback()
+    db.session.execute(delete(SpatialRefSys).where(SpatialRefSys.srid.in_(srids)))
+    db.session.commit()
+
+
+def test_srid_registry(spatial_refs):
+    statements = []
+    event.listen(db.engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+
+    registry = SRIDRegistry(db.engine)
+    assert registry.get(990001).auth_name == 'BDC'
+    assert registry.get(990001).proj4text.startswith('+proj=longlat')
+    assert 990002 not in registry
+    with pytest.raises(KeyError):
+        registry.get(990002)
+    # Whole table once, then a single lookup for the missing SRID until the next refresh
+    assert len(statements) == 2
+
+    crs = registry.crs(990001)
+    assert crs.is_geographic
+    assert registry.crs(990001) is crs
+
+    db.session.add(SpatialRefSys(srid=990002, auth_name='BDC', auth_srid='990002',
+                                 proj4text='+proj=utm +zone=23 +south +datum=WGS84 +units=m +no_defs'))
+    db.session.flush()
+    assert 990002 not in registry._references
+    db.session.commit()
+
+    assert registry.get(990002).auth_srid == '990002'
+    assert registry.crs(990002).is_projected
+
+    db.session.get(SpatialRefSys, 990001).proj4text = '+proj=longlat +ellps=GRS80 +no_defs'
+    db.session.commit()
+    assert registry.get(990001).proj4text == '+proj=longlat +ellps=GRS80 +no_defs'
+    assert registry.crs(990001) is not crs
+
+    registry.invalidate(['public.spatial_ref_sys'])
+    assert not registry._references
+
+
+def test_srid_registry_savepoint_rollback(spatial_refs):
+    registry = SRIDRegistry(db.engine)
+    assert 990002 not in registry
+
+    db.session.add(SpatialRefSys(srid=990002, auth_name='BDC', auth_srid='990002',
+                                 proj4text='+proj=utm +zone=23 +south +datum=WGS84 +units=m +no_defs'))
+    db.session.flush()
+    with db.session.begin_nested() as savepoint:
+        db.session.get(SpatialRefSys, 990001).auth_name = 'Other'
+        db.session.flush()
+        savepoint.rollback()
+    db.session.commit()
+
+    # The change made before the savepoint still refreshes the registry
+    assert registry.get(990002).auth_srid == '990002'
+    assert registry.get(990001).auth_name == 'BDC'
+
+
+def test_eager_large_columns(app, spatial_refs):
+    # The config is read when the queries run, not when the models are mapped
+    app.config['BDC_DB_DEFER_LARGE_COLUMNS'] = False
+
+    model = FakeModel(name='Eager', properties={'fieldStringRequired': 'eager'})
+    db.session.add(model)
+    db.session.commit()
+
+    model_id = model.id
+    db.session.expunge_all()
+    model = db.session.execute(select(FakeModel).where(FakeModel.id == model_id)).scalar_one()
+    assert model.__dict__['properties'] == {'fieldStringRequired': 'eager'}
+
+    reference = db.session.get(SpatialRefSys, 990001)
+    assert 'srtext' in reference.__dict__ and 'proj4text' in reference.__dict__
+    assert db.session.execute(select(FakeModel.name).where(FakeModel.id == model_id)).scalar() == 'Eager'
+
+    app.config['BDC_DB_DEFER_LARGE_COLUMNS'] = True
+    db.session.expunge_all()
+    model = db.session.execute(select(FakeModel).where(FakeModel.id == model_id)).scalar_one()
+    assert 'properties' not in model.__dict__
+
+
+def test_srid_registry_subset(spatial_refs):
+    registry = SRIDRegistry(db.engine, srids=[990001])
+    assert registry.load() == 1
+    assert set(registry._references) == {990001}
+    assert registry.get(990001).srid == 990001
@@ -0,0 +1,128 @@
+#
+# This file is part of BDC-DB.
+# Copyright (C) 2023 INPE.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/gpl-3.0.html>.
+#
+
+"""Unit-test for BDC-DB keyset pagination."""
+
+import pytest
+from demo_app.models import FakeModel
+from sqlalchemy import Column, Index, Integer, MetaData, Table, select
+from sqlalchemy.dialects import postgresql
+
+from bdc_db.db import db
+from bdc_db.pagination import (SortKey, has_supporting_index, keyset_condition,
+                               paginate_keyset)
+from bdc_db.utils import bulk_upsert
+
+
+@pytest.fixture
+def items(app, fake_models):
+    """Prepare the demo rows with NULL and repeated counters."""
+    app.config['SECRET_KEY'] = 'test'
+    counters = [None, 1, 1, 2, None, 3, 2, 1, None, 3]
+    bulk_upsert(fake_models, [dict(id=i + 1, name=f'item-{i + 1}', counter=counter)
+                              for i, counter in enumerate(counters)])
+    db.session.commit()
+
+    return {i + 1: counter for i, counter in enumerate(counters)}
+
+
+def _walk(query, order_by, per_page, **kwargs):
+    pages, cursor = [], None
+    while True:
+        page = paginate_keyset(query, order_by, cursor=cursor, per_page=per_page, **kwargs)
+        pages.append(page.items)
+        if not page.has_next:
+            return pages
+        cursor = page.next_cursor
+
+
+def test_sort_key_parse():
+    key = SortKey.parse(FakeModel.counter.desc().nulls_last())
+    assert key.descending and key.nulls_first is False and not key.nulls_before
+
+    key = SortKey.parse(FakeModel.id)
+    assert not key.descending and not key.nulls_before
+
+
+def test_paginate_keyset(items):
+    pages = _walk(FakeModel, [FakeModel.id.desc()], per_page=4)
+    assert [[item.id for item in page] for page in pages] == [[10, 9, 8, 7], [6, 5, 4, 3], [2, 1]]
+
+
+@pytest.mark.parametrize('order_by, expected', [
+    ((FakeModel.counter, FakeModel.id), [2, 3, 8, 4, 7, 6, 10, 1, 5, 9]),
+    ((FakeModel.counter.desc(), FakeModel.id), [1, 5, 9, 6, 10, 4, 7, 2, 3, 8]),
+    ((FakeModel.counter.desc().nulls_last(), FakeModel.id.desc()), [10, 6, 7, 4, 8, 3, 2, 9, 5, 1]),
+    ((FakeModel.counter.nulls_first(), FakeModel.id.desc()), [9, 5, 1, 8, 3, 2, 7, 4, 10, 6]),
+])
+def test_paginate_keyset_mixed_order(items, order_by, expected):
+    query = select(FakeModel.id, FakeModel.counter)
+    for per_page in (1, 3):
+        pages = _walk(query, order_by, per_page=per_page, check_index=False)
+        assert [row.id for page in pages for row in page] == expected
+
+
+def test_paginate_keyset_errors(items):
+    with pytest.raises(ValueError):
+        paginate_keyset(FakeModel, [FakeModel.name, FakeModel.id])
+
+    page = paginate_keyset(FakeModel, [FakeModel.id], per_page=2)
+
+    with pytest.raises(ValueError):
+        paginate_keyset(FakeModel, [FakeModel.id], cursor=page.next_cursor + 'x')
+
+    with pytest.raises(ValueError):
+        paginate_keyset(FakeModel, [FakeModel.id.desc()], cursor=page.next_cursor)
+
+
+def test_keyset_condition_seeks_index():
+    table = Table('fake_keyset', MetaData(),
+                  Column('id', Integer, primary_key=True),
+                  Column('a', Integer, nullable=False),
+                  Column('b', Integer))
+
+    def _sql(keys, values):
+        return str(keyset_condition(keys, values).compile(dialect=postgresql.dialect(),
+                                                           compile_kwargs=dict(literal_binds=True)))
+
+    # Same direction over NOT NULL columns: row comparison
+    assert _sql([SortKey(table.c.a), SortKey(table.c.id)], [1, 2]) == '(fake_keyset.a, fake_keyset.id) > (1, 2)'
+    assert _sql([SortKey(table.c.id, descending=True)], [5]) == '(fake_keyset.id) < (5)'
+
+    # Mixed directions: leading range without NULL branches for NOT NULL columns
+    assert _sql([SortKey(table.c.a), SortKey(table.c.id, descending=True)], [1, 2]) == \
+        'fake_keyset.a >= 1 AND (fake_keyset.a > 1 OR fake_keyset.a = 1 AND fake_keyset.id < 2)'
+
+    # Nullable columns keep the NULL branch and no leading range when NULLs come after
+    assert 'IS NULL' in _sql([SortKey(table.c.b), SortKey(table.c.id)], [1, 2])
+    assert '>=' not in _sql([SortKey(table.c.b), SortKey(table.c.id)], [1, 2])
+
+
+def test_has_supporting_index_direction():
+    table = Table('fake_keyset_index', MetaData(),
+                  Column('id', Integer, primary_key=True),
+                  Column('a', Integer, nullable=False),
+                  Column('b', Integer, nullable=False))
+    Index('idx_fake_keyset_index_a_id', table.c.a, table.c.id)
+    Index('idx_fake_keyset_index_b_id', table.c.b, table.c.id.desc())
+
+    assert has_supporting_index([SortKey(table.c.a), SortKey(table.c.id)])
+    assert has_supporting_index([SortKey(table.c.a, True), SortKey(table.c.id, True)])
+    assert not has_supporting_index([SortKey(table.c.a), SortKey(table.c.id, True)])
+    assert has_supporting_index([SortKey(table.c.b), SortKey(table.c.id, True)])
+    assert has_supporting_index([SortKey(table.c.b, True), SortKey(table.c.id)])
@@ -0,0 +1,111 @@
+#
+# This file is part of BDC-DB.
+# Copyright (C) 2023 INPE.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/gpl-3.0.html>.
+#
+
+"""Unit-test for table partitioning."""
+
+from datetime import date
+from unittest import mock
+
+import pytest
+from demo_app.models import FakeEvent
+from sqlalchemy import Table
+from sqlalchemy.dialects import postgresql
+from utils import mock_entry_points
+
+import bdc_db.cli as bdc_cli
+from bdc_db import BrazilDataCubeDB
+from bdc_db.db import db
+from bdc_db.ext import _is_partition
+from bdc_db.partitioning import (ListPartition, RangePartition,
+                                 create_partitions, list_partitions)
+
+
+def test_range_partition_periods():
+    spec = RangePartition('date', interval='month')
+
+    partitions = list(spec.partitions(date(2023, 11, 15), date(2024, 1, 1)))
+
+    assert [suffix for suffix, _ in partitions] == ['p202311', 'p202312', 'p202401']
+    assert partitions[1][1] == "FOR VALUES FROM ('2023-12-01') TO ('2024-01-01')"
+
+    week = RangePartition('date', interval='week')
+    assert week.truncate(date(2023, 11, 15)) == date(2023, 11, 13)
+
+    with pytest.raises(ValueError):
+        RangePartition('date', interval='hour')
+
+
+def test_list_partition_values():
+    spec = ListPartition('collection', values=('S2-L1C', 'landsat'))
+
+    assert spec.partition_by == 'LIST (collection)'
+    partitions = list(spec.partitions(postgresql.dialect()))
+    assert [suffix for suffix, _ in partitions] == ['s2_l1c', 'landsat']
+    assert partitions[0][1] == "FOR VALUES IN ('S2-L1C')"
+
+
+@mock.patch('bdc_db.ext.entry_points', mock_entry_points)
+def test_partitioned_model(app):
+    BrazilDataCubeDB(app)
+
+    db.create_all()
+
+    table = FakeEvent.__table__
+    with db.engine.connect() as conn:
+        names = [partition.name for partition in list_partitions(table, conn)]
+    current = RangePartition('date').suffix(date.today().replace(day=1))
+    assert f'fake_event_{current}' in names
+
+    db.session.add(FakeEvent(date=date.today()))
+    db.session.commit()
+
+    runner = app.test_cli_runner()
+
+    result = runner.invoke(bdc_cli.premake_partitions, ['--ahead', '2'])
+    assert result.exit_code == 0
+
+    result = runner.invoke(bdc_cli.partition_sizes, [])
+    assert result.exit_code == 0
+    assert f'fake_event_{current}' in result.stdout
+
+    result = runner.invoke(bdc_cli.drop_old_partitions, ['--older-than', '2999-01-01', '--force'])
+    assert result.exit_code == 0
+    assert f'The partition "fake_event_{current}" was dropped.' in result.stdout
+
+    with db.engine.begin() as conn:
+        assert list_partitions(table, conn) == []
+        create_partitions(table, conn)
+        assert len(list_partitions(table, conn)) == 2
+
+
+@mock.patch('bdc_db.ext.entry_points', mock_entry_points)
+def test_alembic_skips_partitions_only(app):
+    BrazilDataCubeDB(app)
+    db.create_all()
+
+    with db.engine.begin() as conn:
+        create_partitions(FakeEvent.__table__, conn)
+        conn.exec_driver_sql('CREATE TABLE IF NOT EXISTS fake_event_archive (id integer)')
+        partition = list_partitions(FakeEvent.__table__, conn)[0].name
+
+    try:
+        assert _is_partition(Table(partition, db.MetaData()))
+        assert not _is_partition(Table('fake_event_archive', db.MetaData()))
+    finally:
+        with db.engine.begin() as conn:
+            conn.exec_driver_sql('DROP TABLE fake_event_archive')
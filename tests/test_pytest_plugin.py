@@ -0,0 +1,117 @@
+#
+# This file is part of BDC-DB.
+# Copyright (C) 2022 INPE.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/gpl-3.0.html>.
+#
+"""Unit-test for BDC-DB pytest plugin."""
+
+import os
+import subprocess
+import sys
+
+import pytest
+from demo_app.models import FakeModel
+from sqlalchemy import MetaData, create_engine
+
+from bdc_db.db import db
+from bdc_db.pytest_plugin import (drop_templates, ensure_template, schema_hash,
+                                  worker_database_uri)
+from bdc_db.utils import execute
+
+PLUGIN_TESTS = '''
+from sqlalchemy import func, select
+
+from bdc_db.db import db
+
+
+class PluginItem(db.Model):
+    __tablename__ = 'bdc_plugin_item'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String)
+
+
+def test_commit(bdc_db_session):
+    bdc_db_session.add(PluginItem(name='first'))
+    bdc_db_session.commit()
+    assert bdc_db_session.scalar(select(func.count(PluginItem.id))) == 1
+
+    bdc_db_session.add(PluginItem(name='rolled back'))
+    bdc_db_session.flush()
+    bdc_db_session.rollback()
+    assert db.session.scalar(select(func.count(PluginItem.id))) == 1
+
+
+def test_isolation(bdc_db_session):
+    assert bdc_db_session.scalar(select(func.count(PluginItem.id))) == 0
+
+
+def test_isolation_again(bdc_db_session):
+    test_isolation(bdc_db_session)
+'''
+
+
+def test_schema_hash(app, fake_models):
+    ext = app.extensions['bdc-db']
+    key = schema_hash(db.metadata, ext)
+    assert len(key) == 12
+    assert key == schema_hash(db.metadata, ext)
+    assert key != schema_hash(MetaData(), ext)
+    assert FakeModel.__table__.fullname in db.metadata.tables
+
+    assert worker_database_uri('postgresql://u:p@localhost/bdc', 'gw1') == 'postgresql://u:p@localhost/bdc_test_gw1'
+
+
+def _run_plugin(tmp_path, *args):
+    (tmp_path / 'conftest.py').write_text("pytest_plugins = ['bdc_db.pytest_plugin']\n")
+    (tmp_path / 'test_plugin_items.py').write_text(PLUGIN_TESTS)
+    return subprocess.run([sys.executable, '-m', 'pytest', '-q', '-p', 'no:cacheprovider', *args, str(tmp_path)],
+                          cwd=tmp_path, capture_output=True, text=True, env=dict(os.environ))
+
+
+def test_pytest_plugin(tmp_path):
+    result = _run_plugin(tmp_path, '--bdc-db-rebuild')
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert '3 passed' in result.stdout
+
+
+def test_ensure_template(fake_models):
+    uri = db.engine.url.set(database='bdc_plugin_unit')
+    engine = create_engine(uri.set(database='postgres'))
+
+    def _templates():
+        with engine.connect() as conn:
+            return execute("SELECT datname, shobj_description(oid, 'pg_database') FROM pg_database "
+                           " WHERE starts_with(datname, 'bdc_plugin_unit_tpl_') ORDER BY 1", conn).all()
+
+    try:
+        assert ensure_template(uri, 'first', MetaData()) == 'bdc_plugin_unit_tpl_first'
+        assert ensure_template(uri, 'first', MetaData(), rebuild='token') == 'bdc_plugin_unit_tpl_first'
+        assert _templates() == [('bdc_plugin_unit_tpl_first', 'token')]
+
+        # The template of the previous schema hash is dropped
+        ensure_template(uri, 'second', MetaData())
+        assert _templates() == [('bdc_plugin_unit_tpl_second', None)]
+    finally:
+        drop_templates(uri)
+    assert _templates() == []
+    engine.dispose()
+
+
+def test_pytest_plugin_xdist(tmp_path):
+    pytest.importorskip('xdist')
+    result = _run_plugin(tmp_path, '-n', '2')
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert '3 passed' in result.stdout
@@ -0,0 +1,107 @@
+#
+# This file is part of BDC-DB.
+# Copyright (C) 2022 INPE.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/gpl-3.0.html>.
+#
+
+"""Unit-test for BDC-DB N+1 detector and query budget."""
+
+import linecache
+from unittest import mock
+
+import pytest
+from demo_app.models import FakeModel
+from flask import Flask
+from sqlalchemy import select
+from utils import mock_entry_points
+
+from bdc_db import BrazilDataCubeDB
+from bdc_db.db import db
+from bdc_db.querystats import NPlusOneWarning, QueryBudgetError, fingerprint
+
+
+def _create_app(**config):
+    app = Flask(__name__)
+    app.testing = True
+    app.config.update(dict(BDC_DB_QUERY_TRACKING=True, BDC_DB_NPLUSONE_THRESHOLD=3), **config)
+
+    with app.app_context():
+        with mock.patch('bdc_db.ext.entry_points', mock_entry_points), \
+                mock.patch('importlib_metadata.entry_points', mock_entry_points):
+            BrazilDataCubeDB(app)
+
+    @app.route('/items/<int:total>')
+    def items(total):
+        # One statement per item, like a lazy load inside a loop
+        names = [db.session.execute(select(FakeModel.name).where(FakeModel.id == i)).scalar() for i in range(total)]
+        return dict(names=names)
+
+    return app
+
+
+@pytest.fixture
+def tracked_app(app):
+    """Create an application with query tracking."""
+    tracked = _create_app()
+    yield tracked
+    with tracked.app_context():
+        tracked.extensions['bdc-db'].query_tracker.uninstall()
+
+
+def test_fingerprint():
+    assert fingerprint("SELECT * FROM item WHERE id IN (%(id_1)s, %(id_2)s) AND name = 'a''b'") == \
+        'SELECT * FROM item WHERE id IN (?) AND name = ?'
+    assert fingerprint('SELECT x::text FROM t\n WHERE id = $1 AND v > 10') == \
+        'SELECT x::text FROM t WHERE id = ? AND v > ?'
+
+
+def test_server_timing(tracked_app):
+    response = tracked_app.test_client().get('/items/2')
+
+    assert response.status_code == 200
+    assert response.headers['Server-Timing'].startswith('db;dur=')
+    assert response.headers['Server-Timing'].endswith('desc="2 queries"')
+
+
+def test_nplusone_warning(tracked_app):
+    with pytest.warns(NPlusOneWarning, match='executed 4 times') as record:
+        response = tracked_app.test_client().get('/items/10')
+    assert response.status_code == 200
+
+    # The warning points at the view issuing the statements
+    warning = record.pop(NPlusOneWarning)
+    assert warning.filename == __file__
+    assert 'db.session.execute' in linecache.getline(warning.filename, warning.lineno)
+
+
+def test_nplusone_raise(app):
+    tracked = _create_app(BDC_DB_NPLUSONE_RAISE=True)
+    try:
+        with pytest.raises(QueryBudgetError):
+            tracked.test_client().get('/items/4')
+        assert tracked.test_client().get('/items/3').status_code == 200
+    finally:
+        with tracked.app_context():
+            tracked.extensions['bdc-db'].query_tracker.uninstall()
+
+
+def test_query_budget(app):
+    tracked = _create_app(BDC_DB_NPLUSONE_THRESHOLD=100, BDC_DB_QUERY_BUDGET='5')
+    try:
+        with pytest.raises(QueryBudgetError, match='budget of 5 statements'):
+            tracked.test_client().get('/items/6')
+    finally:
+        with tracked.app_context():
+            tracked.extensions['bdc-db'].query_tracker.uninstall()
@@ -0,0 +1,102 @@
+#
+# This file is part of BDC-DB.
+# Copyright (C) 2022 INPE.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/gpl-3.0.html>.
+#
+
+"""Unit-test for BDC-DB table report."""
+
+import pytest
+from sqlalchemy import (Column, Index, Integer, MetaData, String, Table, event,
+                        text)
+
+from bdc_db.db import db
+from bdc_db.report import (estimate_bloat, format_bytes, index_report,
+                           table_report)
+
+
+@pytest.fixture
+def report_table(create_tables):
+    """Create a table with a duplicate index and some dead tuples."""
+    metadata = MetaData()
+    table = Table('bdc_report_test', metadata,
+                  Column('id', Integer, primary_key=True),
+                  Column('name', String),
+                  Index('bdc_report_test_name_idx', 'name'),
+                  Index('bdc_report_test_name_copy_idx', 'name'))
+    # Same column, but another order, collation or access method
+    Index('bdc_report_test_name_desc_idx', table.c.name.desc())
+    Index('bdc_report_test_name_collate_idx', table.c.name.collate('C'))
+    Index('bdc_report_test_name_hash_idx', table.c.name, postgresql_using='hash')
+    create_tables(metadata)
+
+    with db.engine.begin() as conn:
+        conn.execute(table.insert(), [dict(id=i, name=f'name-{i}') for i in range(1, 2001)])
+        conn.execute(table.delete().where(table.c.id > 1000))
+        conn.execute(text('ANALYZE bdc_report_test'))
+
+    return table
+
+
+def test_table_report(report_table):
+    with db.engine.connect() as conn:
+        entry, = table_report(conn, [report_table])
+
+    assert entry.name == 'public.bdc_report_test'
+    assert entry.total_bytes >= entry.table_bytes + entry.indexes_bytes + entry.toast_bytes
+    assert entry.estimated_rows == 1000
+    # Half of the rows were deleted and not vacuumed yet
+    assert 0.3 < entry.bloat_ratio < 0.7
+    assert [index.index_name for index in entry.indexes][0] == 'bdc_report_test_pkey'
+
+
+def test_index_report(report_table):
+    with db.engine.connect() as conn:
+        indexes = {index.index_name: index for index in index_report(conn, [report_table])}
+
+    assert indexes['bdc_report_test_pkey'].primary and not indexes['bdc_report_test_pkey'].unused
+    assert indexes['bdc_report_test_name_copy_idx'].unused
+    assert indexes['bdc_report_test_name_idx'].duplicate_of == 'bdc_report_test_name_copy_idx'
+    assert indexes['bdc_report_test_name_copy_idx'].duplicate_of is None
+    for name in ('desc', 'collate', 'hash'):
+        assert indexes[f'bdc_report_test_name_{name}_idx'].duplicate_of is None
+
+
+def test_report_current_schema(report_table):
+    statements = []
+
+    def _record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with db.engine.connect() as conn:
+        event.listen(conn, 'before_cursor_execute', _record)
+        table_report(conn, [report_table])
+
+    assert len([statement for statement in statements if 'current_schema()' in statement]) == 1
+
+
+def test_report_namespaces(report_table):
+    with db.engine.connect() as conn:
+        names = {entry.name for entry in table_report(conn, namespaces=['public'], include_indexes=False)}
+
+    assert 'public.bdc_report_test' in names
+
+
+def test_report_helpers():
+    assert format_bytes(None) == '-'
+    assert format_bytes(512) == '512 B'
+    assert format_bytes(1536) == '1.5 kB'
+    assert estimate_bloat(10, 100, None, 100, 8192) is None
+    assert estimate_bloat(10, 0, 10, 100, 8192) == 10 * 8192
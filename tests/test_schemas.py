@@ -0,0 +1,155 @@
+#
+# This file is part of BDC-DB.
+# Copyright (C) 2022 INPE.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/gpl-3.0.html>.
+#
+
+"""Unit-test for BDC-DB schema registry."""
+
+import json
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+from unittest import mock
+
+import jsonschema
+import pytest
+from flask import current_app
+from utils import mock_entry_points
+
+from bdc_db.schemas import (SchemaRegistry, get_default_registry,
+                            set_default_registry)
+from bdc_db.utils import validate_schema, validate_schema_many
+
+DUMMY_SCHEMA = 'dummy-jsonschema.json'
+
+
+@pytest.fixture
+def registry():
+    """Load the demo schemas from entry points."""
+    with mock.patch('bdc_db.schemas.entry_points', mock_entry_points):
+        yield SchemaRegistry.from_entry_points()
+
+
+@pytest.fixture
+def ref_registry(tmp_path):
+    """Create schemas referencing each other by relative path and by URL."""
+    definitions = dict(definitions=dict(band=dict(type='object', required=['name'],
+                                                  properties=dict(name=dict(type='string')))))
+    (tmp_path / 'common').mkdir()
+    (tmp_path / 'common' / 'band.json').write_text(json.dumps(definitions))
+    (tmp_path / 'item.json').write_text(json.dumps({
+        '$schema': 'http://json-schema.org/draft-07/schema',
+        '$id': 'item.json',
+        'type': 'object',
+        'properties': {
+            'band': {'$ref': 'common/band.json#/definitions/band'},
+            'other': {'$ref': 'https://brazildatacube.org/schemas/common/band.json#/definitions/band'},
+            'remote': {'$ref': 'https://example.com/schemas/remote.json'},
+        }
+    }))
+
+    registry = SchemaRegistry(host='brazildatacube.org')
+    registry.register_schemas_dir(str(tmp_path))
+    return registry
+
+
+def test_registry_entry_points(registry):
+    assert registry.list_schemas() == [DUMMY_SCHEMA]
+    assert registry.validate(DUMMY_SCHEMA, dict(fieldStringRequired='ok'))
+
+    with pytest.raises(jsonschema.ValidationError):
+        registry.validate(DUMMY_SCHEMA, dict(fieldStringRequired=1))
+
+    with pytest.raises(KeyError):
+        registry.get_schema('unknown.json')
+
+
+def test_registry_offline_refs(ref_registry):
+    assert ref_registry.list_schemas() == ['common/band.json', 'item.json']
+    assert ref_registry.url_to_path('https://brazildatacube.org/schemas/item.json#/x') == 'item.json'
+    assert ref_registry.url_to_path('https://example.com/schemas/item.json') is None
+
+    ref_registry.validate('item.json', dict(band=dict(name='red'), other=dict(name='nir')))
+
+    with pytest.raises(jsonschema.ValidationError):
+        ref_registry.validate('item.json', dict(band=dict()))
+    with pytest.raises(jsonschema.ValidationError):
+        ref_registry.validate('item.json', dict(other=dict(name=1)))
+
+    # Unknown hosts are never fetched from network
+    with mock.patch('urllib.request.urlopen', side_effect=AssertionError('network access')):
+        with pytest.raises(Exception) as error:
+            ref_registry.validate('item.json', dict(remote=dict()))
+    assert not isinstance(error.value, AssertionError)
+
+
+def test_registry_pickle(ref_registry):
+    ref_registry.validate('item.json', dict())
+    restored = pickle.loads(pickle.dumps(ref_registry))
+
+    assert restored.list_schemas() == ref_registry.list_schemas()
+    with pytest.raises(jsonschema.ValidationError):
+        restored.validate('item.json', dict(band=dict()))
+
+
+def test_registry_worker_processes(ref_registry):
+    values = [dict(band=dict(name=f'band-{i}')) for i in range(4)]
+
+    with ProcessPoolExecutor(max_workers=2) as pool:
+        assert list(pool.map(ref_registry.validate, ['item.json'] * len(values), values)) == values
+
+
+def test_validate_schema_without_app_context(registry):
+    previous = get_default_registry()
+    set_default_registry(registry)
+    try:
+        assert validate_schema(DUMMY_SCHEMA, dict(fieldStringRequired='ok'))
+        assert validate_schema_many(DUMMY_SCHEMA, [dict(fieldStringRequired='ok'), None])[1] is None
+
+        with pytest.raises(jsonschema.ValidationError):
+            validate_schema(DUMMY_SCHEMA, dict())
+    finally:
+        set_default_registry(previous)
+
+
+def test_extension_shares_registry(fake_models):
+    ext = current_app.extensions['bdc-db']
+    assert get_default_registry() is ext.schema_registry
+    assert ext.schema_registry.list_schemas() == [DUMMY_SCHEMA]
+    assert os.path.isdir(ext.schema_registry.schemas[DUMMY_SCHEMA])
+
+
+def test_validate_schema_app_context(fake_models, registry):
+    ext = current_app.extensions['bdc-db']
+    previous = get_default_registry()
+    set_default_registry(registry)
+    try:
+        assert validate_schema(DUMMY_SCHEMA, dict(fieldStringRequired='ok'))
+        validator = ext.schema_registry.validator(DUMMY_SCHEMA)
+        assert validate_schema_many(DUMMY_SCHEMA, [dict(fieldStringRequired='ok')])
+        # The validator of the extension registry is built once and reused
+        assert ext.schema_registry.validator(DUMMY_SCHEMA) is validator
+        assert DUMMY_SCHEMA not in registry._validators
+
+        with pytest.raises(jsonschema.ValidationError):
+            validate_schema_many(DUMMY_SCHEMA, [dict()])
+    finally:
+        set_default_registry(previous)
+
+
+def test_validate_schema_without_extension(app):
+    with pytest.raises(KeyError):
+        validate_schema(DUMMY_SCHEMA, dict(fieldStringRequired='ok'))
@@ -0,0 +1,180 @@
+#
+# This file is part of BDC-DB.
+# Copyright (C) 2022 INPE.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/gpl-3.0.html>.
+#
+
+"""Unit-test for BDC-DB slow query capture."""
+
+import os
+import stat
+from unittest import mock
+
+import pytest
+from flask import Flask, abort, request
+from sqlalchemy import text
+from utils import mock_entry_points
+
+from bdc_db import BrazilDataCubeDB
+from bdc_db import cli as bdc_cli
+from bdc_db.db import db
+from bdc_db.slowlog import (SlowQuery, SlowQueryLog, append_record,
+                            clear_records, load_records, redact)
+
+
+@pytest.fixture
+def slow_log(fake_models):
+    """Record every statement taking more than 10 ms."""
+    slow_queries = SlowQueryLog(threshold=0.01, explain=True, maxsize=3)
+    slow_queries.install(db.engine)
+
+    yield slow_queries
+
+    slow_queries.uninstall()
+
+
+def _slow_query(seconds: float = 0.02):
+    return db.session.execute(
+        text('SELECT pg_sleep(:seconds), (SELECT count(*) FROM fake_model WHERE name = :name)'),
+        dict(seconds=seconds, name='secret')
+    ).all()
+
+
+def test_slow_query_capture(slow_log):
+    db.session.execute(text('SELECT 1'))
+    assert slow_log.records() == []
+
+    _slow_query()
+    record, = slow_log.records()
+
+    assert record.duration >= 0.02
+    assert 'pg_sleep' in record.statement
+    assert 'secret' not in str(record.parameters)
+    assert 'test_slowlog.py' in record.location and '_slow_query' in record.location
+    assert record.plan[0]['Plan']['Node Type']
+    assert record.explain_error is None
+
+
+def test_slow_query_ring_buffer(slow_log):
+    for _ in range(5):
+        _slow_query(0.011)
+    _slow_query(0.05)
+
+    records = slow_log.records()
+    assert len(records) == 3
+    assert records[0].duration >= 0.05
+
+    slow_log.clear()
+    assert slow_log.records() == []
+
+
+def test_redact():
+    assert redact(dict(name='secret', ids=[1, 2], empty=None)) == dict(name='<str>', ids=['<int>', '<int>'], empty=None)
+
+
+def test_slow_query_explain_timeout(fake_models):
+    slow_queries = SlowQueryLog(threshold=0.01, explain=True, explain_timeout=0.1)
+    slow_queries.install(db.engine)
+
+    try:
+        with db.engine.connect() as conn:
+            # The plan waits for the lock held by the transaction of the statement
+            conn.execute(text('LOCK TABLE fake_model IN ACCESS EXCLUSIVE MODE'))
+            conn.execute(text('SELECT pg_sleep(0.02), (SELECT count(*) FROM fake_model)'))
+            conn.rollback()
+    finally:
+        slow_queries.uninstall()
+
+    record, = slow_queries.records()
+    assert record.plan is None and 'timeout' in record.explain_error
+
+
+def test_slow_query_files(fake_models, tmp_path):
+    slow_queries = SlowQueryLog(threshold=0.01, directory=tmp_path / 'slow')
+    slow_queries.install(db.engine)
+
+    try:
+        _slow_query()
+        _slow_query()
+    finally:
+        slow_queries.uninstall()
+
+    path = slow_queries.path
+    assert path.parent == tmp_path / 'slow' and str(os.getpid()) in path.name
+    assert stat.S_IMODE(path.stat().st_mode) == 0o600
+    assert len(load_records(path)) == 2
+
+    # Another process of the application
+    other = tmp_path / 'slow' / 'slow-queries-other-1.jsonl'
+    append_record(load_records(path)[0], other)
+    assert len(load_records(tmp_path / 'slow')) == 3
+
+    assert clear_records(tmp_path / 'slow') == 2
+    assert load_records(tmp_path / 'slow') == []
+
+
+@pytest.mark.skipif(not hasattr(os, 'O_NOFOLLOW'), reason='Requires O_NOFOLLOW')
+def test_slow_query_file_symlink(tmp_path):
+    target = tmp_path / 'target'
+    target.write_text('')
+    link = tmp_path / 'slow-queries-link.jsonl'
+    link.symlink_to(target)
+
+    with pytest.raises(OSError):
+        append_record(SlowQuery(statement='SELECT 1', parameters=None, duration=1, location=''), link)
+    assert target.read_text() == ''
+
+
+def test_slow_query_extension(tmp_path):
+    app = Flask(__name__)
+    app.config.update(BDC_DB_SLOW_QUERY_THRESHOLD='0.01', BDC_DB_SLOW_QUERY_DIR=str(tmp_path),
+                      BDC_DB_SLOW_QUERY_ENDPOINT='/_db/slow-queries')
+
+    def _guard():
+        if request.headers.get('Authorization') != 'secret':
+            abort(403)
+
+    with app.app_context():
+        with mock.patch('bdc_db.ext.entry_points', mock_entry_points), \
+                mock.patch('importlib_metadata.entry_points', mock_entry_points):
+            # The endpoint is not registered without a guard
+            with pytest.raises(RuntimeError):
+                BrazilDataCubeDB(app)
+
+            app = Flask(__name__)
+            app.config.update(BDC_DB_SLOW_QUERY_THRESHOLD='0.01', BDC_DB_SLOW_QUERY_DIR=str(tmp_path),
+                              BDC_DB_SLOW_QUERY_ENDPOINT='/_db/slow-queries')
+            ext = BrazilDataCubeDB(app, slow_query_guard=_guard)
+
+    with app.app_context():
+        try:
+            db.session.execute(text('SELECT pg_sleep(0.02)'))
+            assert len(ext.slow_queries.records()) == 1
+            assert load_records(tmp_path)[0].statement == ext.slow_queries.records()[0].statement
+
+            client = app.test_client()
+            assert client.get('/_db/slow-queries/').status_code == 403
+            assert client.delete('/_db/slow-queries/').status_code == 403
+            assert len(client.get('/_db/slow-queries/', headers=dict(Authorization='secret')).get_json()) == 1
+            assert client.delete('/_db/slow-queries/', headers=dict(Authorization='secret')).status_code == 204
+            assert ext.slow_queries.records() == []
+
+            runner = app.test_cli_runner()
+            result = runner.invoke(bdc_cli.slow_queries, ['--limit', '5'])
+            assert result.exit_code == 0 and 'pg_sleep' in result.output
+            result = runner.invoke(bdc_cli.slow_queries, ['--clear'])
+            assert result.exit_code == 0 and not list(tmp_path.iterdir())
+        finally:
+            ext.slow_queries.uninstall()
@@ -0,0 +1,123 @@
+#
+# This file is part of BDC-DB.
+# Copyright (C) 2022 INPE.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/gpl-3.0.html>.
+#
+"""Unit-test for BDC-DB spatial optimization."""
+
+from unittest import mock
+
+import pytest
+from sqlalchemy import Column, DateTime, Integer, MetaData, Table
+from sqlalchemy.dialects import postgresql
+
+from bdc_db import cli as bdc_cli
+from bdc_db.db import db
+from bdc_db.spatial import (geohash_expression, geometry_columns, has_postgis,
+                            optimize_statements, spatial_optimize,
+                            time_columns)
+from bdc_db.sqltypes import Geometry
+
+
+def _scene_table(metadata, srid=4326):
+    return Table('bdc_scene_test', metadata,
+                 Column('id', Integer, primary_key=True),
+                 Column('start_date', DateTime),
+                 Column('footprint', Geometry('POLYGON', srid=srid)),
+                 schema='bdc')
+
+
+def test_geometry_columns():
+    metadata = MetaData()
+    table = _scene_table(metadata)
+    Table('bdc_plain_test', metadata, Column('id', Integer, primary_key=True))
+
+    assert geometry_columns(metadata) == [table.c.footprint]
+    assert geometry_columns(metadata, [metadata.tables['bdc_plain_test']]) == []
+    assert time_columns(table) == [table.c.start_date]
+
+
+def test_optimize_statements():
+    metadata = MetaData()
+    column = _scene_table(metadata).c.footprint
+    dialect = postgresql.dialect()
+
+    statements = optimize_statements(column, dialect)
+    assert statements == [
+        'CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_bdc_bdc_scene_test_start_date_brin ON bdc.bdc_scene_test '
+        'USING brin (start_date)',
+        'CREATE INDEX IF NOT EXISTS idx_bdc_bdc_scene_test_footprint_order ON bdc.bdc_scene_test '
+        '((CASE WHEN ST_IsEmpty(footprint) THEN NULL ELSE ST_GeoHash(ST_Centroid(footprint), 10) END))',
+        'CLUSTER bdc.bdc_scene_test USING idx_bdc_bdc_scene_test_footprint_order',
+        'DROP INDEX IF EXISTS bdc.idx_bdc_bdc_scene_test_footprint_order',
+        'ANALYZE bdc.bdc_scene_test',
+    ]
+
+    statements = optimize_statements(column, dialect, order='time', brin=False)
+    assert statements[0].startswith('CREATE INDEX IF NOT EXISTS idx_bdc_bdc_scene_test_footprint_order '
+                                    'ON bdc.bdc_scene_test (start_date, (CASE')
+    assert optimize_statements(column, dialect, cluster=False, brin=False) == []
+
+    utm = _scene_table(MetaData(), srid=32723).c.footprint
+    assert 'ST_Transform(ST_Centroid(footprint), 4326)' in geohash_expression(utm, dialect.identifier_preparer)
+    assert geohash_expression(_scene_table(MetaData(), srid=0).c.footprint, dialect.identifier_preparer) is None
+
+    with pytest.raises(ValueError):
+        optimize_statements(column, dialect, order='hilbert')
+
+    plain = Table('bdc_plain_test', MetaData(), Column('id', Integer, primary_key=True),
+                  Column('footprint', Geometry()))
+    with pytest.raises(ValueError):
+        optimize_statements(plain.c.footprint, dialect, order='time')
+
+
+def test_spatial_optimize_cli(app, fake_models):
+    table = _scene_table(db.metadata)
+    runner = app.test_cli_runner()
+    try:
+        with mock.patch('bdc_db.cli.missing_indexes', return_value=list(table.indexes)):
+            result = runner.invoke(bdc_cli.optimize_spatial, ['--preview', '-t', 'bdc.bdc_scene_test'])
+        assert result.exit_code == 0
+        assert 'CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_bdc_bdc_scene_test_footprint_gist ' \
+               'ON bdc.bdc_scene_test USING gist (footprint)' in result.output
+        assert 'CLUSTER bdc.bdc_scene_test' in result.output
+
+        if not has_postgis(db.engine):
+            with pytest.raises(RuntimeError):
+                spatial_optimize([table.c.footprint], db.engine)
+            result = runner.invoke(bdc_cli.optimize_spatial, ['-t', 'bdc.bdc_scene_test'])
+            assert result.exit_code != 0
+    finally:
+        db.metadata.remove(table)
+
+
+def test_spatial_optimize_cluster_failure(fake_models):
+    column = _scene_table(MetaData()).c.footprint
+    executed = []
+
+    def _execute(statement, executor, *args, **kwargs):
+        if statement.startswith('CLUSTER'):
+            raise RuntimeError('cluster failed')
+        executed.append(statement)
+
+    with mock.patch('bdc_db.spatial.has_postgis', return_value=True), \
+            mock.patch('bdc_db.spatial.missing_indexes', return_value=[]), \
+            mock.patch('bdc_db.spatial.execute', side_effect=_execute):
+        result, = spatial_optimize([column], db.engine, samples=0)
+
+    assert result.error == 'cluster failed'
+    # The temporary order index is dropped and the table is not analyzed
+    assert executed[-1] == 'DROP INDEX IF EXISTS bdc.idx_bdc_bdc_scene_test_footprint_order'
+    assert not any(statement.startswith('ANALYZE') for statement in executed)
@@ -20,12 +20,17 @@ from unittest import mock
 
 import jsonschema
 import pytest
-from demo_app.models import FakeModel
+from demo_app.models import FakeDocument, FakeModel
+from sqlalchemy import Column, Float, Integer, MetaData, Table, event, select
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.exc import StatementError
+from sqlalchemy.schema import CreateIndex
 from utils import mock_entry_points
 
 from bdc_db import BrazilDataCubeDB
-from bdc_db.db import db
+from bdc_db.db import NAMING_CONVENTION, db
+from bdc_db.indexes import missing_indexes
+from bdc_db.sqltypes import JSONB, JSONBPath, MutableJSONB
 
 
 @mock.patch('bdc_db.ext.entry_points', mock_entry_points)
@@ -54,3 +59,144 @@ def test_validate_jsonschema_type(app):
 
     assert isinstance(e.value.orig, jsonschema.ValidationError)
     assert e.value.orig.message == "'fieldStringRequired' is a required property"
+
+
+def test_jsonb_index_declarations(create_tables):
+    metadata = MetaData(naming_convention=NAMING_CONVENTION)
+    table = Table('fake_jsonb_indexed', metadata,
+                  Column('id', Integer, primary_key=True),
+                  Column('properties', JSONB('dummy-jsonschema.json', gin='jsonb_path_ops',
+                                             btree=['fieldStringRequired', JSONBPath(('eo', 'cloud'), Float)],
+                                             generated={'cloud': JSONBPath(('eo', 'cloud'), Float)})))
+
+    assert sorted(index.name for index in table.indexes) == [
+        'idx_fake_jsonb_indexed_properties_eo_cloud',
+        'idx_fake_jsonb_indexed_properties_fieldstringrequired',
+        'idx_fake_jsonb_indexed_properties_gin',
+    ]
+    assert table.c.cloud.computed is not None
+
+    with pytest.raises(ValueError):
+        JSONB('dummy-jsonschema.json', gin='invalid')
+
+    # A type instance shared by several tables declares the indexes of each one
+    shared = JSONB('dummy-jsonschema.json', gin='jsonb_path_ops')
+    first = Table('fake_jsonb_first', MetaData(), Column('id', Integer, primary_key=True), Column('doc', shared))
+    second = Table('fake_jsonb_second', MetaData(), Column('id', Integer, primary_key=True), Column('doc', shared))
+    assert [index.name for index in first.indexes] == ['idx_fake_jsonb_first_doc_gin']
+    assert [index.name for index in second.indexes] == ['idx_fake_jsonb_second_doc_gin']
+
+    copy = table.to_metadata(MetaData(), name='fake_jsonb_copy')
+    assert len(copy.indexes) == len(table.indexes)
+
+    create_tables(metadata)
+
+    with db.engine.begin() as conn:
+        conn.execute(table.insert(), dict(id=1, properties={'fieldStringRequired': 'a', 'eo': {'cloud': 10.5}}))
+        assert conn.execute(select(table.c.cloud)).scalar() == 10.5
+
+    with db.engine.connect() as conn:
+        assert missing_indexes(metadata, conn) == []
+
+
+def test_jsonb_distinct_declarations(create_tables):
+    metadata = MetaData(naming_convention=NAMING_CONVENTION)
+    tables = [
+        Table('fake_jsonb_ops', metadata, Column('id', Integer, primary_key=True),
+              Column('doc', JSONB('dummy-jsonschema.json', gin='jsonb_ops', btree=['fieldStringRequired']))),
+        Table('fake_jsonb_path_ops', metadata, Column('id', Integer, primary_key=True),
+              Column('doc', JSONB('dummy-jsonschema.json', gin='jsonb_path_ops', btree=[('eo', 'cloud')]))),
+    ]
+    assert tables[0].c.doc.type.gin == 'jsonb_ops' and tables[1].c.doc.type.gin == 'jsonb_path_ops'
+
+    indexes = [{index.name: str(CreateIndex(index).compile(dialect=postgresql.dialect())) for index in table.indexes}
+               for table in tables]
+    assert 'jsonb_ops' in indexes[0]['idx_fake_jsonb_ops_doc_gin']
+    assert 'jsonb_path_ops' in indexes[1]['idx_fake_jsonb_path_ops_doc_gin']
+    assert set(indexes[0]) == {'idx_fake_jsonb_ops_doc_gin', 'idx_fake_jsonb_ops_doc_fieldstringrequired'}
+    assert set(indexes[1]) == {'idx_fake_jsonb_path_ops_doc_gin', 'idx_fake_jsonb_path_ops_doc_eo_cloud'}
+
+    create_tables(metadata)
+
+    with db.engine.begin() as conn:
+        for table in tables:
+            conn.execute(table.insert(), dict(id=1, doc={'fieldStringRequired': table.name}))
+        # The same statement shape runs against each table
+        for table in tables:
+            statement = select(table.c.id).where(table.c.doc['fieldStringRequired'].astext == table.name)
+            assert conn.execute(statement).scalar() == 1
+
+    with db.engine.connect() as conn:
+        assert missing_indexes(metadata, conn) == []
+
+
+@mock.patch('bdc_db.ext.entry_points', mock_entry_points)
+@mock.patch('importlib_metadata.entry_points', mock_entry_points)
+def test_mutable_jsonb_partial_updates(app):
+    BrazilDataCubeDB(app)
+
+    db.create_all()
+
+    document = FakeDocument(properties={'fieldStringRequired': 'a', 'fieldObjectAny': {'x': 1}, 'old': True})
+    db.session.add(document)
+    db.session.commit()
+
+    document_id = document.id
+    db.session.expunge_all()
+    document = db.session.get(FakeDocument, document_id)
+    assert isinstance(document.properties, MutableJSONB)
+
+    statements = []
+
+    def _capture(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', _capture)
+    try:
+        document.properties['fieldStringRequired'] = 'b'
+        document.properties.set_path(('fieldObjectAny', 'y'), 2)
+        document.properties.set_path(('eo', 'cloud_cover'), 10)
+        del document.properties['old']
+        document.properties.update(extra=[1, 2])
+        db.session.commit()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', _capture)
+
+    update = [statement for statement in statements if statement.startswith('UPDATE')]
+    assert len(update) == 1 and 'jsonb_set' in update[0] and '#-' in update[0] and '||' in update[0]
+
+    expected = {'fieldStringRequired': 'b', 'fieldObjectAny': {'x': 1, 'y': 2},
+                'eo': {'cloud_cover': 10}, 'extra': [1, 2]}
+    assert document.properties == expected
+    stored = db.session.execute(select(FakeDocument.__table__.c.properties)
+                                .where(FakeDocument.id == document.id)).scalar()
+    assert stored == expected
+
+    # The merged document is validated on flush
+    with pytest.raises(jsonschema.ValidationError):
+        del document.properties['fieldStringRequired']
+        db.session.flush()
+    assert 'bdc_jsonb_patches' not in db.session.info
+    assert isinstance(document.properties, MutableJSONB)
+    db.session.rollback()
+
+    # A failed flush does not leave stale patches for the next one
+    def _fail(conn, cursor, statement, *args):
+        if statement.startswith('UPDATE'):
+            raise RuntimeError('flush failed')
+
+    document.properties['fieldStringRequired'] = 'failed'
+    event.listen(db.engine, 'before_cursor_execute', _fail)
+    try:
+        with pytest.raises(RuntimeError):
+            db.session.flush()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', _fail)
+    assert 'bdc_jsonb_patches' not in db.session.info
+    db.session.rollback()
+    assert document.properties['fieldStringRequired'] == 'b'
+
+    # Assigning a new document writes the whole document
+    document.properties = {'fieldStringRequired': 'c'}
+    db.session.commit()
+    assert document.properties == {'fieldStringRequired': 'c'}
@@ -0,0 +1,107 @@
+#
+# This file is part of BDC-DB.
+# Copyright (C) 2023 INPE.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/gpl-3.0.html>.
+#
+
+"""Unit-test for BDC-DB utilities."""
+
+import jsonschema
+import pytest
+from demo_app.models import FakeModel
+from sqlalchemy import select, update
+
+from bdc_db.db import db
+from bdc_db.utils import bulk_upsert, pipeline, stream
+
+
+def test_bulk_upsert(fake_models):
+    rows = [
+        dict(id=i, name=f'item-{i}', properties={'fieldStringRequired': str(i)})
+        for i in range(1, 11)
+    ]
+
+    result = bulk_upsert(fake_models, rows, batch_size=4, returning=True)
+    db.session.commit()
+
+    assert result.rows == 10 and result.batches == 3
+    assert sorted(result.keys) == [(i, ) for i in range(1, 11)]
+    assert result.rows_per_second > 0
+
+    # Update the existing rows on conflict
+    result = bulk_upsert(fake_models, [dict(id=1, name='updated', properties=None)], update=['name'])
+    db.session.commit()
+
+    names = dict(db.session.execute(select(FakeModel.id, FakeModel.name)).all())
+    assert len(names) == 10 and names[1] == 'updated'
+
+    # Ignore the conflicting rows
+    bulk_upsert(fake_models, [dict(id=2, name='ignored')], update=[])
+    db.session.commit()
+    assert db.session.get(FakeModel, 2).name == 'item-2'
+
+    # The repeated conflict keys of a batch keep the last row
+    result = bulk_upsert(fake_models, [dict(id=3, name='first'), dict(id=3, name='last'), dict(id=4, name='other')])
+    db.session.commit()
+    assert result.rows == 2 and result.duplicates == 1
+    assert db.session.get(FakeModel, 3).name == 'last'
+
+
+def test_bulk_upsert_validation(fake_models):
+    rows = [
+        dict(id=1, name='valid', properties={'fieldStringRequired': 'valid'}),
+        dict(id=2, name='invalid', properties={}),
+    ]
+
+    with pytest.raises(jsonschema.ValidationError):
+        bulk_upsert(fake_models, rows)
+
+
+@pytest.mark.parametrize('keyset', [False, True])
+def test_stream(fake_models, keyset):
+    bulk_upsert(fake_models, [dict(id=i, name=f'item-{i}') for i in range(1, 26)])
+    db.session.commit()
+
+    objects = list(stream(FakeModel, chunk_size=10, keyset=keyset))
+    assert sorted(obj.id for obj in objects) == list(range(1, 26))
+    assert all(isinstance(obj, FakeModel) for obj in objects)
+
+    rows = list(stream(select(FakeModel.id, FakeModel.name).where(FakeModel.id > 20), chunk_size=2, keyset=keyset,
+                       keys=[FakeModel.id]))
+    assert sorted(tuple(row) for row in rows) == [(i, f'item-{i}') for i in range(21, 26)]
+
+    batches = list(stream(fake_models.__table__, chunk_size=10, mode='dicts', keyset=keyset))
+    assert [len(batch) for batch in batches] == [10, 10, 5]
+    assert batches[0][0]['name'].startswith('item-')
+
+
+def test_stream_invalid_mode(fake_models):
+    with pytest.raises(ValueError):
+        next(stream(FakeModel, mode='unknown'))
+
+    with pytest.raises(ValueError):
+        next(stream(select(FakeModel.id), mode='objects'))
+
+
+def test_pipeline(fake_models):
+    bulk_upsert(fake_models, [dict(id=i, name=f'item-{i}') for i in range(1, 6)])
+
+    with pipeline(db.session):
+        for i in range(1, 6):
+            db.session.execute(update(FakeModel).where(FakeModel.id == i).values(counter=i * 10))
+    db.session.commit()
+
+    counters = db.session.execute(select(FakeModel.counter).order_by(FakeModel.id)).scalars().all()
+    assert counters == [10, 20, 30, 40, 50]